@@ -12,9 +12,11 @@
 """
 import os
 
+import numpy as np
 import torch
 
 from classfy.base import *
+from utils.runtime import ModelRuntime
 from config import PROJECT_DIR
 from utils import logger
 from pathlib import Path
@@ -31,16 +33,21 @@ data_dir2 = os.path.join(PROJECT_DIR, 'data/test/0206')
 #                                        transforms.ToTensor(), ])
 class DolphinClassifier(object):
 
-    def __init__(self, model_path: Path, device_id='1') -> None:
+    def __init__(self, model_path: Path, device_id='1', runtime: ModelRuntime = None) -> None:
         self.model_path = model_path
         self.device = None
         self.model = None
         self.device_id = device_id
+        self.runtime = runtime if runtime is not None else ModelRuntime()
 
-    def run(self):
+    def run(self, checkpoint=None):
+        """
+        :param checkpoint: SharedCheckpoint of the pickled model loaded by monitor, model is read from model_path
+        if None
+        """
         # if self.device_id is not None:
         #     os.environ['CUDA_VISIBLE_DEVICES'] = self.device_id
-        if not self.model_path.exists():
+        if checkpoint is None and not self.model_path.exists():
             raise Exception(f'Model init failed: model not exist at [{str(self.model_path)}].')
 
         if self.device_id is not None:
@@ -48,22 +55,27 @@ class DolphinClassifier(object):
         if torch.cuda.is_available():
             self.device = torch.device("cuda")
             # self.device = torch.device("cuda:" + str(self.device_id))
-            self.model = torch.load(str(self.model_path))
         else:
             self.device = torch.device("cpu")
+        if checkpoint is not None:
+            self.model = checkpoint.module
+        elif torch.cuda.is_available():
+            self.model = torch.load(str(self.model_path))
+        else:
             self.model = torch.load(str(self.model_path), map_location="cpu")
         self.model.avgpool = torch.nn.AvgPool2d(kernel_size=7, stride=1, padding=0)
-        self.model = self.model.to(self.device)
-        self.model.eval()
+        self.model = self.runtime.prepare(self.model, self.device)
         print(self.model)
         print(self.device)
+        self.runtime.warm_up(self.predict, np.zeros((224, 224, 3), dtype=np.uint8))
 
     def predict(self, image):
         image = to_pil(image)
         image_tensor = test_trainsforms(image).float()
         image_tensor = image_tensor.unsqueeze(0)
-        input = image_tensor.to(self.device)
-        output = self.model(input)
+        input = self.runtime.input(image_tensor, self.device)
+        with self.runtime.inference():
+            output = self.model(input)
         output = output.data.cpu().numpy()
         index = output.argmax()
         return index, normalization(output)
@@ -16,6 +16,10 @@ import os
 from enum import Enum
 from pathlib import Path
 
+# raw pixel formats of frames stored in frame caches, a slot holds a (height, width, 3) frame,
+# packed formats only since capture, detection and rendering all read frames of the full shape
+FRAME_PIX_FMTS = ('rgb24', 'bgr24')
+
 
 class Environment(object):
     PROD = 'prod'
@@ -94,7 +98,19 @@ class ServerConfig(Config):
                  stream_save_path,
                  sample_save_dir,
                  frame_save_dir,
-                 candidate_save_dir, offline_stream_save_dir) -> None:
+                 candidate_save_dir, offline_stream_save_dir,
+                 track_multi_target=True,
+                 track_timeout=60,
+                 track_backend='siamrpn',
+                 track_backend_confidence=None,
+                 track_max_targets=16,
+                 torch_threads=1,
+                 channels_last=False,
+                 fuse_conv_bn=False,
+                 warmup_iters=1,
+                 share_model_weights=True,
+                 encoder_pool_workers=2,
+                 encoder_pool_timeout=30) -> None:
         self.env = env
         self.log_level = log_level
         self.http_ip = http_ip
@@ -107,6 +123,32 @@ class ServerConfig(Config):
         self.detect_mode = detect_mode
         self.track_model_path = track_model_path
         self.track_cfg_path = track_cfg_path
+        # track all rects of a request by batched forwards in a single pass over the window
+        self.track_multi_target = track_multi_target
+        # seconds to wait for tracking results of a detection event, unfinished requests are cancelled
+        self.track_timeout = track_timeout
+        # siamrpn, or a model-free CPU backend: flow(optical flow), kcf, csrt
+        self.track_backend = track_backend
+        # confidence threshold of each CPU backend, their scores are not comparable with siamrpn ones:
+        # flow scores by the ratio of points passing forward-backward check, kcf and csrt score 1 or 0.
+        # alg['track_confidence'] of each camera is calibrated for siamrpn and used by backends not listed here
+        self.track_backend_confidence = track_backend_confidence if track_backend_confidence is not None else \
+            {'flow': 0.5, 'kcf': 0.5, 'csrt': 0.5}
+        # max rects of a tracking request, it fixes the record size of shared memory transport
+        self.track_max_targets = track_max_targets
+        # model runtime of every detector, classifier and tracker process: intra-op threads(0 keeps torch default),
+        # channels_last memory format, conv-bn fusion and warm-up iterations
+        self.torch_threads = torch_threads
+        self.channels_last = channels_last
+        self.fuse_conv_bn = fuse_conv_bn
+        self.warmup_iters = warmup_iters
+        # load each checkpoint once in monitor and share the read-only weights with all model processes
+        self.share_model_weights = share_model_weights
+        # warm ffmpeg encoders kept for each clip type of a camera, also the max clips encoded at the same time,
+        # 0 launches a new encoder per clip
+        self.encoder_pool_workers = encoder_pool_workers
+        # seconds a clip waits for a busy encoder pool before it is dropped, encoders are never more than the pool
+        self.encoder_pool_timeout = encoder_pool_timeout
         self.classify_model_path = classify_model_path
         self.detect_model_path = Path(os.path.join(PROJECT_DIR, detect_model_path))
         self.cascade_model_path = cascade_model_path
@@ -167,7 +209,38 @@ class VideoConfig(Config):
                  enable_sample_frame,
                  rtsp_saved_per_frame,
                  future_frames, bbox,
-                 alg):
+                 alg,
+                 max_reuse_age=0,
+                 reuse_dist_thresh=0,
+                 track_stride=1,
+                 track_lost_frames=0,
+                 track_stop_out_roi=False,
+                 track_lazy_fetch=False,
+                 fps=25,
+                 template_cache_size=0,
+                 template_cache_quant=16,
+                 template_cache_max_gap=250,
+                 segment_record=False,
+                 segment_duration=2,
+                 segment_keep=30,
+                 segment_dir='',
+                 overlay_clip=True,
+                 render_workers=2,
+                 render_queue_size=8,
+                 render_overlap_policy='merge',
+                 single_pass_render=True,
+                 render_sidecar=False,
+                 frame_wait_timeout=5,
+                 frame_pix_fmt='rgb24',
+                 push_delay_frames=2,
+                 push_max_lag=25,
+                 renditions=None,
+                 post_filter_scale=1,
+                 post_filter_stride=1,
+                 float_history_cell=32,
+                 float_history_half_life=120,
+                 float_history_size=64,
+                 float_reject_weight=1.5):
         self.index = index
         self.camera_id = camera_id
         self.channel = channel
@@ -217,6 +290,74 @@ class VideoConfig(Config):
         self.freq_thresh = freq_thresh
         self.bbox = bbox
         self.alg = alg
+        # reuse the last model results for at most max_reuse_age frames if the frame changes less than
+        # reuse_dist_thresh(histogram cosine distance), either of them is 0 disables result reuse
+        self.max_reuse_age = max_reuse_age
+        self.reuse_dist_thresh = reuse_dist_thresh
+        # track every track_stride frames of the search window, boxes of skipped frames are interpolated
+        self.track_stride = track_stride
+        # give up a target after track_lost_frames consecutive low score frames, 0 tracks the whole window
+        self.track_lost_frames = track_lost_frames
+        # give up a target once its box center leaves ROI
+        self.track_stop_out_roi = track_stop_out_roi
+        # fetch window frames one by one while tracking, instead of fetching all of them before tracking
+        self.track_lazy_fetch = track_lazy_fetch
+        # nominal frame rate of video stream
+        self.fps = fps
+        # reuse exemplar features of up to template_cache_size recent targets in tracker, 0 disables template cache.
+        # a target hits the cache if its box is in the same template_cache_quant pixels grid cell and its template
+        # frame is at most template_cache_max_gap frames later
+        self.template_cache_size = template_cache_size
+        self.template_cache_quant = template_cache_quant
+        self.template_cache_max_gap = template_cache_max_gap
+        # encode the stream once into rolling segments of segment_duration seconds, original clips of events are
+        # cut from them by stream copy. segment_keep segments are kept, they must cover future_frames * 2 frames.
+        # segments are written into segment_dir/index, such as a tmpfs directory, or candidate_save_dir/segments
+        # if segment_dir is empty
+        self.segment_record = segment_record
+        self.segment_duration = segment_duration
+        self.segment_keep = segment_keep
+        self.segment_dir = segment_dir
+        # render the bbox overlay clip of an event, if disabled in segment recording mode, no frame is encoded
+        # for an event and the message carries the original clip
+        self.overlay_clip = overlay_clip
+        # window tasks of video render and detection signal handler run by render_workers threads and wait in a queue
+        # of render_queue_size, tasks are rejected once the queue is full. a task overlapping a waiting one is merged
+        # into it by policy 'merge', dropped if it overlaps a waiting or running one by policy 'drop', or kept by 'none'
+        self.render_workers = render_workers
+        self.render_queue_size = render_queue_size
+        self.render_overlap_policy = render_overlap_policy
+        # read each frame of an event window once for both the original and the bbox overlay clip
+        self.single_pass_render = single_pass_render
+        # skip the overlay clip, write boxes into a json file beside the original clip and let clients draw them
+        self.render_sidecar = render_sidecar
+        # a clip ends early if its next frame is not written into frame cache in frame_wait_timeout seconds
+        self.frame_wait_timeout = frame_wait_timeout
+        # raw pixel format of frames stored in frame cache, rgb24 or bgr24; frames are piped into ffmpeg
+        # as they are, so it must match the capture: VLC decodes into rgb24, OpenCV captures bgr24
+        if frame_pix_fmt not in FRAME_PIX_FMTS:
+            raise Exception(f'Unsupported frame pixel format [{frame_pix_fmt}] of video [{index}], '
+                            f'expect one of {FRAME_PIX_FMTS}.')
+        self.frame_pix_fmt = frame_pix_fmt
+        # push streamer emits frames at fps and follows the newest frame push_delay_frames behind, the last frame
+        # is repeated if capture stalls, and frames are skipped once it is push_max_lag frames behind
+        self.push_delay_frames = push_delay_frames
+        self.push_max_lag = push_max_lag
+        # extra live outputs besides push_to, each is a dict of target (rtsp url or HLS directory), width, height,
+        # bitrate and fps, all of them are encoded from the pushed frames by one ffmpeg process
+        self.renditions = renditions if renditions is not None else []
+        # post filter analyses the preprocessed frame resized by post_filter_scale, once every post_filter_stride
+        # frames; trajectories only need coarse positions, the stride should not exceed disappear_frames_thresh
+        self.post_filter_scale = post_filter_scale
+        self.post_filter_stride = post_filter_stride
+        # float traces found by post filters are indexed on a grid of float_history_cell pixels, the weight of a cell
+        # halves every float_history_half_life seconds, at most float_history_size traces are kept for line fitting
+        self.float_history_cell = float_history_cell
+        self.float_history_half_life = float_history_half_life
+        self.float_history_size = float_history_size
+        # each float trace adds 1 to the cells it passes, rects at cells weighing at least float_reject_weight are
+        # known debris and are not tracked, 1.5 needs two floats within about a half life, 0 disables it
+        self.float_reject_weight = float_reject_weight
 
 
 class LabelConfig:
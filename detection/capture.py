@@ -284,6 +284,13 @@ class VideoOfflineCallbackCapture(VideoOfflineCapture):
         # self.controller.dispatch_frame(*args)
         self.controller.put_cache(*args)
 
+    def update(self, *args):
+        try:
+            super().update(*args)
+        finally:
+            # no frame is put into cache any more
+            self.controller.stop_recording()
+
     def cancel(self):
         super().cancel()
         if not self.shut_down_event.is_set():
@@ -512,6 +519,13 @@ class VideoRtspCallbackCapture(VideoRtspCapture):
         # self.controller.dispatch_frame(*args)
         self.controller.put_cache(*args)
 
+    def update(self, *args):
+        try:
+            super().update(*args)
+        finally:
+            # no frame is put into cache any more
+            self.controller.stop_recording()
+
 
 class VideoRtspVlcCapture(VideoRtspCallbackCapture):
     def __init__(self, video_path: Path, sample_path: Path, index_pool: Queue, frame_queue: Queue, cfg: VideoConfig,
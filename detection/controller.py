@@ -22,8 +22,9 @@ import numpy as np
 from classfy.model import DolphinClassifier
 from config import ModelType
 from .render import ArrivalMessage, ArrivalMsgType
+from stream.segment import SegmentRecorder
 from stream.websocket import *
-from utils.cache import SharedMemoryFrameCache
+from utils.cache import SharedMemoryFrameCache, ResultReuseCache
 from . import Detector
 from .capture import *
 from .detect_funcs import *
@@ -61,6 +62,13 @@ class DetectorController(object):
         self.original_stream_path = self.candidate_path / 'original-streams'
         self.test_path = self.candidate_path / 'tests'
         self.preview_path = self.candidate_path / 'preview'
+        # rolling segments of continuous recording, event clips are cut from them
+        self.segment_path = None
+        if self.cfg.segment_record:
+            self.segment_path = Path(self.cfg.segment_dir) / str(self.cfg.index) if self.cfg.segment_dir \
+                else self.candidate_path / 'segments'
+        # recorder is created by the capture process which calls put_cache()
+        self.segment_recorder = None
         self.create_workspace()
 
         self.result_cnt = 0
@@ -99,6 +107,16 @@ class DetectorController(object):
     def cancel(self):
         pass
 
+    def stop_recording(self):
+        """
+        complete the last segment and stop the segment recorder, called on exit of the capture process
+        which calls put_cache(), since the recorder lives there
+        :return:
+        """
+        if self.segment_recorder is not None:
+            self.segment_recorder.stop()
+            self.segment_recorder = None
+
     def init_control_range(self):
         # read a frame, record frame size before running detectors
         frame = self.frame_queue.get()
@@ -240,7 +258,7 @@ class TaskBasedDetectorController(DetectorController):
 
     def __init__(self, server_cfg: ServerConfig, cfg: VideoConfig, stream_path: Path, candidate_path: Path,
                  frame_path: Path, frame_queue: Queue, index_pool: Queue, msg_queue: Queue, streaming_queue: List,
-                 render_notify_queue, frame_cache: SharedMemoryFrameCache,recoder) -> None:
+                 render_notify_queue, frame_cache: SharedMemoryFrameCache,recoder, shared_checkpoint=None) -> None:
         super().__init__(cfg, stream_path, candidate_path, frame_path, frame_queue, index_pool, msg_queue, frame_cache)
         # self.construct_params = ray.put(
         #     ConstructParams(self.result_queue, self.original_frame_cache, self.render_frame_cache,
@@ -260,8 +278,13 @@ class TaskBasedDetectorController(DetectorController):
         # self.stream_render = stream_render
         self.render_notify_queue = render_notify_queue
         self.recorder = recoder
+        # weights loaded once by monitor and shared by all controllers, None loads from file inside sub-process
+        self.shared_checkpoint = shared_checkpoint
         self.init_control_range()
         self.init_detectors()
+        self.reuse_cache = None
+        if self.cfg.max_reuse_age > 0 and self.cfg.reuse_dist_thresh > 0:
+            self.reuse_cache = ResultReuseCache(self.cfg.reuse_dist_thresh, self.cfg.max_reuse_age, self.geometry)
 
     def init_detect_handler(self, handler):
         self.detect_handler = handler
@@ -293,7 +316,7 @@ class TaskBasedDetectorController(DetectorController):
                 #                       self.receive_pipes[index],
                 #                       region_detector_path))
                 self.detect_params.append(
-                    DetectorParams(self.x_step, self.y_step, i, j, self.cfg, region_detector_path))
+                    DetectorParams(self.x_step, self.y_step, i, j, self.cfg, region_detector_path, self.geometry))
         logger.info(
             '*******************************Controller [{}]: detectors init done ********************************'.format(
                 self.cfg.index))
@@ -303,11 +326,10 @@ class TaskBasedDetectorController(DetectorController):
         init frame blocks range
         :return:
         """
-        # read a frame, record frame size before running detectors
-        empty = np.zeros(self.cfg.shape).astype(np.uint8)
-        frame, _ = preprocess(empty, self.cfg)
-        self.x_step = int(frame.shape[1] / self.x_num)
-        self.y_step = int(frame.shape[0] / self.y_num)
+        # ROI, resize and block layout are fixed by configuration, compute them once per camera
+        self.geometry = FrameGeometry(self.cfg)
+        self.x_step = self.geometry.x_step
+        self.y_step = self.geometry.y_step
         self.block_info = BlockInfo(self.y_num, self.x_num, self.y_step, self.x_step)
 
     def collect(self, args):
@@ -332,8 +354,8 @@ class TaskBasedDetectorController(DetectorController):
         if construct_result is not None:
             frame = construct_result.frame
             if self.cfg.draw_boundary:
-                frame, _ = preprocess(frame, self.cfg)
-                frame = draw_boundary(frame, self.block_info)
+                frame, _ = self.geometry.preprocess(frame)
+                frame = draw_boundary(copy_on_write(frame), self.block_info)
                 # logger.info('Done constructing of sub-frames into a original frame....')
             if self.cfg.show_window:
                 pass
@@ -350,7 +372,7 @@ class TaskBasedDetectorController(DetectorController):
     def post_detect(self, frame, idx) -> List[DetectionResult]:
         sub_results = []
         for d in self.detect_params:
-            block = DispatchBlock(crop_by_se(frame, d.start, d.end),
+            block = DispatchBlock(self.geometry.block(frame, d),
                                   idx, frame.shape)
             sub_results.append(detect_based_task(block, d))
         return sub_results
@@ -359,6 +381,7 @@ class TaskBasedDetectorController(DetectorController):
         # sub_frames = [r.frame for r in results]
         results = args[0]
         _model = args[1]
+        # read-only view of the shared frame slot
         original_frame = args[-1]
         # sub_binary = [r.binary for r in results]
         # sub_thresh = [r.thresh for r in results]
@@ -368,7 +391,8 @@ class TaskBasedDetectorController(DetectorController):
         # logger.debug(f'Controller [{self.cfg.index}]: Construct frames into a original frame....')
         try:
             current_index = results[0].frame_index
-            render_frame = original_frame.copy()
+            # candidates are cropped from the frame only, nothing draws on it
+            render_frame = original_frame
             push_flag = False
             for r in results:
                 if len(r.rects):
@@ -381,7 +405,7 @@ class TaskBasedDetectorController(DetectorController):
                         start = time.time()
                         detect_result = True
                         if not self.cfg.cv_only:
-                            candidate = crop_by_rect(self.cfg, rect, render_frame)
+                            candidate = self.geometry.crop_square(render_frame, rect)
                             obj_class, output = _model.predict(candidate)
                             detect_result = (obj_class == 0)
                             logger.debug(
@@ -431,9 +455,11 @@ class TaskBasedDetectorController(DetectorController):
         import os
         os.environ["CUDA_VISIBLE_DEVICES"] = f'{int(self.cfg.index) % 4}'
 
-        from mmdetection import init_detector
-        import torch
-        torch.set_num_threads(1)
+        from mmdetection import init_detector, inference_detector
+        from utils.runtime import ModelRuntime
+        # threads, inference mode, fusion and warm-up are shared by all model types
+        runtime = ModelRuntime.from_config(self.server_cfg)
+        runtime.setup_process()
         classifier = None
         model = None
 
@@ -441,14 +467,14 @@ class TaskBasedDetectorController(DetectorController):
         # every frame looper will occupy single model instance by now
         # TODO less model instances,but could be shared by all detectors
         if self.server_cfg.detect_mode == ModelType.SSD:
-            model = SSDDetector(model_path=self.server_cfg.detect_model_path, device_id='0')
-            model.run()
+            model = SSDDetector(model_path=self.server_cfg.detect_model_path, device_id='0', runtime=runtime)
+            model.run(self.shared_checkpoint)
             logger.info(
                 f'*******************************Capture [{self.cfg.index}]: Running SSD Model********************************')
         elif self.server_cfg.detect_mode == ModelType.CLASSIFY and not self.cfg.cv_only:
             classifier = DolphinClassifier(model_path=self.server_cfg.classify_model_path,
-                                           device_id=self.server_cfg.dt_id)
-            classifier.run()
+                                           device_id=self.server_cfg.dt_id, runtime=runtime)
+            classifier.run(self.shared_checkpoint)
             logger.info(
                 f'*******************************Capture [{self.cfg.index}]: Running Classifier Model********************************')
         elif self.server_cfg.detect_mode == ModelType.CASCADE:
@@ -458,7 +484,16 @@ class TaskBasedDetectorController(DetectorController):
             if self.cfg.alg['cascade_model_cfg'] != '':
                 cascade_model_cfg = self.cfg.alg['cascade_model_cfg']
                 cascade_model_path = self.cfg.alg['cascade_model_path']
-            model = init_detector(cascade_model_cfg, cascade_model_path)
+            if self.shared_checkpoint is not None:
+                model = init_detector(cascade_model_cfg, None)
+                # mmdetection loads checkpoints non-strictly as well
+                self.shared_checkpoint.bind(model, strict=False)
+                if 'CLASSES' in self.shared_checkpoint.meta:
+                    model.CLASSES = self.shared_checkpoint.meta['CLASSES']
+            else:
+                model = init_detector(cascade_model_cfg, cascade_model_path)
+            model = runtime.prepare(model)
+            runtime.warm_up(inference_detector, model, np.zeros(self.cfg.shape, dtype=np.uint8))
             logger.info(
                 f'*******************************Capture [{self.cfg.index}]: Running Cascade-RCNN Model********************************')
 
@@ -501,24 +536,33 @@ class TaskBasedDetectorController(DetectorController):
         if frame.shape[1] > self.cfg.shape[1]:
             frame = imutils.resize(frame, width=self.cfg.shape[1])
         self.original_frame_cache[self.global_index.get()] = frame
+        if self.segment_path is not None:
+            if self.segment_recorder is None:
+                self.segment_recorder = SegmentRecorder(self.segment_path, self.original_frame_cache,
+                                                        (self.cfg.shape[1], self.cfg.shape[0]), self.cfg.fps,
+                                                        self.cfg.segment_duration, self.cfg.segment_keep,
+                                                        self.cache_size, pix_fmt=self.cfg.frame_pix_fmt)
+            self.segment_recorder.feed(self.global_index.get())
         self.global_index.set(self.global_index.get() + 1)
         e = 1 / (time.time() - s)
         logger.debug(self.LOG_PREFIX + f'Global Cache Writing Speed: [{round(e, 2)}]/FPS')
 
     def dispatch(self, *args):
         """
-        Dispatch frame to key detection handler
+        Dispatch frame to key detection handler.
+        Frame is passed as a read-only view of the shared memory slot, stages must not modify it in place,
+        use copy_on_write() if a stage needs to draw something.
         :param args: [Original Frame, None, SSD Model Ref, Classification Model Ref, Frame Index]
         :return:
         """
-        original_frame = args[0]
+        original_frame = read_only(args[0])
         self.pre_cnt = args[-1]
         # select different detection methods according the configuration
         if self.server_cfg.detect_mode == ModelType.CLASSIFY:  # using classifier
-            self.classify_based(args, original_frame.copy())
+            self.classify_based(args, original_frame)
         # using SSD or Cascade-RCNN
         elif self.server_cfg.detect_mode == ModelType.SSD or self.server_cfg.detect_mode == ModelType.CASCADE:
-            self.model_based(args, original_frame.copy())
+            self.model_based(args, original_frame)
         elif self.server_cfg.detect_mode == ModelType.FORWARD:  # done nothing
             self.forward(args, original_frame)
 
@@ -539,9 +583,18 @@ class TaskBasedDetectorController(DetectorController):
         model_instance = args[2]
         if self.pre_cnt % self.cfg.sample_rate == 0:
             start = time.time()
-            frames_results = self.get_model_result(original_frame, model_instance, self.server_cfg)
-            logger.debug(
-                self.LOG_PREFIX + f'Model [{self.cfg.index}]: Operation Speed Rate: [{round(1 / (time.time() - start), 2)}]/FPS')
+            frames_results = None
+            if self.reuse_cache is not None:
+                frames_results = self.reuse_cache.lookup(original_frame, self.pre_cnt)
+            if frames_results is None:
+                frames_results = self.get_model_result(original_frame, model_instance, self.server_cfg)
+                if self.reuse_cache is not None:
+                    self.reuse_cache.update(self.pre_cnt, frames_results)
+                logger.debug(
+                    self.LOG_PREFIX + f'Model [{self.cfg.index}]: Operation Speed Rate: [{round(1 / (time.time() - start), 2)}]/FPS')
+            else:
+                logger.debug(self.LOG_PREFIX + f'Reuse model results of frame [{self.reuse_cache.index}], '
+                                               f'hit rate [{round(self.reuse_cache.hit_rate(), 2)}]')
             # render_frame = original_frame.copy()
             detect_results = []
             detect_flag = False
@@ -549,16 +602,17 @@ class TaskBasedDetectorController(DetectorController):
             rects = []
             if self.cfg.show_window:
                 cv2.namedWindow(str(self.cfg.index), cv2.WINDOW_NORMAL | cv2.WINDOW_FREERATIO)
-                frame = original_frame
+                frame = copy_on_write(original_frame)
                 if len(frames_results):
-                    for rect in frames_results[0]:
+                    boxes = self.geometry.square_boxes(frames_results[0])
+                    for rect, box in zip(frames_results[0], boxes):
                         if rect[4] > self.cfg.alg['ssd_confidence']:
                             cv2.imwrite(f'data/frames/{self.cfg.index}_{current_index}.png',
                                         cv2.cvtColor(original_frame, cv2.COLOR_BGR2RGB))
                             color = np.random.randint(0, 255, size=(3,))
                             color = [int(c) for c in color]
                             # get a square bbox, the real bbox of width and height is universal as 224 * 224 or 448 * 448
-                            p1, p2 = bbox_points(self.cfg, rect, original_frame.shape)
+                            p1, p2 = (int(box[0]), int(box[1])), (int(box[2]), int(box[3]))
                             # write text
                             frame = paint_chinese_opencv(frame, '江豚', p1)
                             cv2.rectangle(frame, (rect[0], rect[1]), (rect[2], rect[3]), color, 2)
@@ -682,7 +736,9 @@ class TaskBasedDetectorController(DetectorController):
                 return model([original_frame])
             elif server_cfg.detect_mode == 'cascade':
                 from mmdetection import inference_detector
-                result_cascade = inference_detector(model, original_frame)
+                from utils.runtime import inference_context
+                with inference_context():
+                    result_cascade = inference_detector(model, original_frame)
                 if len(result_cascade[0]):
                     return result_cascade
                 else:
@@ -690,17 +746,15 @@ class TaskBasedDetectorController(DetectorController):
 
     def post_stream_req(self, construct_result, original_frame):
         """
-        pass frame to video streamer via pipe
+        pass boxes of a detected frame to video streamer
         :param construct_result:
         :param original_frame:
         :return:
         """
-        if self.cfg.push_stream:
-            if self.cfg.use_sm:
-                self.push_stream_queue[0][0] = original_frame
-                self.push_stream_queue[1].append((construct_result, self.pre_cnt))
-            else:
-                self.push_stream_queue.append((original_frame, construct_result, self.pre_cnt))
+        if self.cfg.push_stream and construct_result is not None and construct_result.detect_flag:
+            # the streamer reads frames from frame cache by index, only boxes are posted
+            self.push_stream_queue[1].append(
+                (self.pre_cnt, [r.rects for r in construct_result.results]))
 
     def classify_based(self, args, original_frame):
         """
@@ -712,14 +766,14 @@ class TaskBasedDetectorController(DetectorController):
         if self.pre_cnt % self.cfg.sample_rate == 0:
             # logger.debug('Controller [{}]: Dispatch frame to all detectors....'.format(self.cfg.index))
             async_futures = []
-            frame, original_frame = preprocess(original_frame, self.cfg)
+            frame, original_frame = self.geometry.preprocess(original_frame)
             if self.cfg.show_window:
                 cv2.namedWindow(str(self.cfg.index), cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)
                 cv2.imshow(str(self.cfg.index), frame)
                 cv2.waitKey(0)
             s = time.time()
             for d in self.detect_params:
-                block = DispatchBlock(crop_by_se(frame, d.start, d.end),
+                block = DispatchBlock(self.geometry.block(frame, d),
                                       self.pre_cnt, original_frame.shape)
                 async_futures.append(detect_based_task(block, d))
                 # TODO Perform detection acceleration by dispatching frame block to multiple processes
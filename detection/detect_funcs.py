@@ -118,7 +118,8 @@ def detect_based_mog2(frame, block, params: DetectorParams):
     #     '~~~~ Detector: [{},{}] detect done [{}] frames..'.format(params.col_index, params.row_index,
     #                                                               params))
     res = DetectionResult(None, None, status, regions, binary, binary, coordinates, params.x_index,
-                          params.y_index, block.index, back(rects, params.start, frame.shape, block.shape, params.cfg))
+                          params.y_index, block.index,
+                          params.geometry.block_to_original(rects, params.start).tolist())
     end = time.time() - start
     logger.info('Detector: [{},{}]: using [{}] seconds'.format(params.y_index, params.x_index, end))
     # cv2.destroyAllWindows()
@@ -141,9 +142,10 @@ def adaptive_thresh_with_rules(frame, block, params: DetectorParams):
 
     frame = cv2.pyrMeanShiftFiltering(frame, params.cfg.alg['sp'], params.cfg.alg['sr'])
 
-    cv2.namedWindow(str(params.cfg.index) + '-' + 'Smooth', cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)
-    cv2.imshow(str(params.cfg.index) + '-' + 'Smooth', frame)
-    cv2.waitKey(1)
+    if params.cfg.show_window:
+        cv2.namedWindow(str(params.cfg.index) + '-' + 'Smooth', cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)
+        cv2.imshow(str(params.cfg.index) + '-' + 'Smooth', frame)
+        cv2.waitKey(1)
     # adaptive thresh by size
     thresh_binary = adaptive_thresh_size(frame, block_size=params.cfg.alg['block_size'],
                                          C=params.cfg.alg['mean'])
@@ -196,7 +198,7 @@ def adaptive_thresh_with_rules(frame, block, params: DetectorParams):
             # merge all white blocks into a single binary map
             filtered_rects.append(rects[i])
     # rect coordinates in original frame
-    original_rects = back(filtered_rects, params.start, frame.shape, block.shape, params.cfg)
+    original_rects = params.geometry.block_to_original(filtered_rects, params.start).tolist()
 
     # load rect width and height thresh value from configuration
     # rect_width_thresh = params.cfg.alg['rwt']
@@ -288,7 +290,8 @@ def adaptive_thresh_mask_no_rules(frame, mask, block, params: DetectorParams):
     #     cv2.waitKey(1)
     # self.detect_cnt += 1
     res = DetectionResult(None, None, status, regions, dilated, dilated, coordinates, params.x_index,
-                          params.y_index, block.index, back(rects, params.start, frame.shape, block.shape, params.cfg))
+                          params.y_index, block.index,
+                          params.geometry.block_to_original(rects, params.start).tolist())
     end = time.time() - start
     logger.debug('Detector: [{},{}]: using [{}] seconds'.format(params.y_index, params.x_index, end))
     return res
@@ -715,6 +715,8 @@ def detect(video_path: Path, region_save_path: Path, mq: Queue, cfg: VideoConfig
                 logger.info('Read frame failed from [{}].'.format(ts_path))
                 break
             frame, original_frame = preprocess(frame, cfg)
+            # candidates are drawn on the processed frame
+            frame = copy_on_write(frame)
 
             # frame_height, frame_width, _ = frame.shape
             # if our saliency object is None, we need to instantiate it
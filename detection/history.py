@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: history.py
+@time: 10/20/26 6:40 AM
+@version 1.0
+@desc: float history of a camera, shared by post filter of signal handler and stream render, kept across restarts
+"""
+import json
+import os
+import threading
+import time
+from multiprocessing import Manager
+from pathlib import Path
+
+import numpy as np
+
+from config import VideoConfig
+from utils import logger
+
+
+class FloatTraceIndex(object):
+    """
+    float traces found by post filters of a camera, with a grid index over their centers.
+    Each cell of the grid weighs how many float traces passed it, the weight halves every half life,
+    so a cell where debris keeps floating stays heavy and a cell crossed once fades out.
+    Rects of known debris are rejected by one cell lookup before they are tracked.
+    """
+
+    # cells and traces lighter than this are dropped, a trace is kept for one half life
+    MIN_WEIGHT = 0.5
+
+    def __init__(self, cfg: VideoConfig, snapshot_path=None, manager: Manager = None) -> None:
+        """
+        :param cfg: camera configuration
+        :param snapshot_path: json file the index is saved into after each update and loaded from, None if in memory
+        :param manager: multiprocessing manager, containers are shared by processes if not None
+        """
+        super().__init__()
+        self.cell = cfg.float_history_cell
+        self.half_life = cfg.float_history_half_life
+        self.max_traces = cfg.float_history_size
+        self.reject_weight = cfg.float_reject_weight
+        self.snapshot_path = Path(snapshot_path) if snapshot_path is not None else None
+        if manager is not None:
+            # (col, row) -> (weight, time of the weight)
+            self.cells = manager.dict()
+            # [(time, trace), ...] in order of time, trace is [(idx, rect), ...], proxies are copied by [:] at once
+            self.traces = manager.list()
+            self.lock = manager.Lock()
+        else:
+            self.cells = {}
+            self.traces = []
+            self.lock = threading.Lock()
+        self.load()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if isinstance(self.cells, dict):
+            # thread locks can't be pickled, an in-memory index gets a new one in the process it is sent to
+            del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if 'lock' not in state:
+            self.lock = threading.Lock()
+
+    def decay(self, weight, stamp, now):
+        return weight * 0.5 ** (max(now - stamp, 0) / self.half_life)
+
+    def cell_of(self, rect):
+        return int(((rect[0] + rect[2]) / 2) // self.cell), int(((rect[1] + rect[3]) / 2) // self.cell)
+
+    def cells_of(self, trace):
+        """
+        :param trace: [(idx, rect), ...]
+        :return: set of cells of rect centers
+        """
+        rects = np.asarray([rect[:4] for idx, rect in trace], dtype=np.float64).reshape(-1, 4)
+        cols = ((rects[:, 0] + rects[:, 2]) / 2 // self.cell).astype(int)
+        rows = ((rects[:, 1] + rects[:, 3]) / 2 // self.cell).astype(int)
+        return set(zip(cols.tolist(), rows.tolist()))
+
+    def add(self, traces, now=None):
+        """
+        records float traces, each cell passed by a trace weighs one more
+        :param traces: [trace, ...]
+        :param now: time of traces, time.time() by default
+        """
+        if not len(traces):
+            return
+        now = time.time() if now is None else now
+        traces = [[(int(idx), [float(v) for v in rect]) for idx, rect in trace] for trace in traces]
+        with self.lock:
+            for trace in traces:
+                for key in self.cells_of(trace):
+                    weight, stamp = self.cells.get(key, (0, now))
+                    self.cells[key] = (self.decay(weight, stamp, now) + 1, now)
+            self.traces.extend([(now, trace) for trace in traces])
+            self.prune(now)
+            self.save()
+
+    def prune(self, now):
+        for key, (weight, stamp) in list(self.cells.items()):
+            if self.decay(weight, stamp, now) < self.MIN_WEIGHT:
+                del self.cells[key]
+        traces = [(stamp, trace) for stamp, trace in self.traces[:]
+                  if self.decay(1, stamp, now) >= self.MIN_WEIGHT]
+        self.traces[:] = traces[-self.max_traces:]
+
+    def weight(self, rect, now=None):
+        """
+        :return: decayed weight of the cell at center of rect
+        """
+        now = time.time() if now is None else now
+        weight, stamp = self.cells.get(self.cell_of(rect), (0, now))
+        return self.decay(weight, stamp, now)
+
+    def reject(self, rects, now=None):
+        """
+        drops rects at cells of known debris
+        :param rects: [[x1, y1, x2, y2, ...], ...]
+        :return: rects kept
+        """
+        if self.reject_weight <= 0 or not len(self.cells):
+            return rects
+        return [rect for rect in rects if self.weight(rect, now) < self.reject_weight]
+
+    def live_traces(self, now=None):
+        """
+        :return: float traces found within a half life, [trace, ...]
+        """
+        now = time.time() if now is None else now
+        return [trace for stamp, trace in self.traces[:] if self.decay(1, stamp, now) >= self.MIN_WEIGHT]
+
+    @staticmethod
+    def near(traces, trace, band):
+        """
+        traces overlapping trace vertically within band, the others can't make a near-horizontal line with it
+        :param traces: [trace, ...]
+        :param trace: [(idx, rect), ...]
+        :param band: vertical distance in pixels
+        :return: [trace, ...]
+        """
+        ys = [(rect[1] + rect[3]) / 2 for idx, rect in trace]
+        top, bottom = min(ys) - band, max(ys) + band
+        kept = []
+        for t in traces:
+            t_ys = [(rect[1] + rect[3]) / 2 for idx, rect in t]
+            if min(t_ys) <= bottom and max(t_ys) >= top:
+                kept.append(t)
+        return kept
+
+    def save(self):
+        if self.snapshot_path is None:
+            return
+        snapshot = {'cells': [[col, row, weight, stamp] for (col, row), (weight, stamp) in self.cells.items()],
+                    'traces': [[stamp, trace] for stamp, trace in self.traces[:]]}
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.snapshot_path.with_suffix('.tmp')
+            with open(str(tmp_path), 'w') as f:
+                json.dump(snapshot, f)
+            # readers never see a half-written snapshot
+            os.replace(str(tmp_path), str(self.snapshot_path))
+        except OSError as e:
+            logger.error(f'Float history: saving [{self.snapshot_path}] failed: {e}')
+
+    def load(self):
+        if self.snapshot_path is None or not self.snapshot_path.exists():
+            return
+        try:
+            with open(str(self.snapshot_path)) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f'Float history: loading [{self.snapshot_path}] failed: {e}')
+            return
+        with self.lock:
+            for col, row, weight, stamp in snapshot['cells']:
+                self.cells[(col, row)] = (weight, stamp)
+            self.traces.extend([(stamp, [(idx, rect) for idx, rect in trace]) for stamp, trace in snapshot['traces']])
+            self.prune(time.time())
+        logger.info(f'Float history: loaded [{len(self.cells)}] cells and [{len(self.traces)}] traces '
+                    f'from [{self.snapshot_path}]')
@@ -25,7 +25,7 @@ import traceback
 from apscheduler.schedulers.background import BackgroundScheduler
 
 import stream
-from config import VideoConfig, ServerConfig
+from config import VideoConfig, ServerConfig, ModelType
 from .capture import VideoOfflineCapture, VideoOnlineSampleCapture, VideoRtspCapture, VideoRtspVlcCapture, \
     VideoOfflineVlcCapture
 from pysot.tracker.service import TrackingService
@@ -33,9 +33,11 @@ from stream.rtsp import PushStreamer
 from stream.websocket import websocket_client
 from utils import generate_time_stamp, logger, clean_dir
 from utils.cache import SharedMemoryFrameCache, ListCache
+from utils.runtime import ModelRuntime, SharedCheckpoint
 from .capture import VideoRtspCallbackCapture, \
     VideoOfflineCallbackCapture
 from .controller import TaskBasedDetectorController, detect
+from .history import FloatTraceIndex
 from .render import DetectionSignalHandler, DetectionStreamRender
 
 
@@ -78,11 +80,7 @@ class DetectionMonitor(object):
         self.shut_down_event.clear()
         self.scheduler = BackgroundScheduler()
         if build_pool:
-            # build service
-            # pool_size = min(len(cfgs) * 2, cpu_count() - 1)
-            # self.process_pool = Pool(processes=pool_size)
-            self.process_pool = Pool(processes=len(self.cfgs) * 5)
-            self.thread_pool = ThreadPoolExecutor()
+            self.init_process_pool()
         # self.clean()
         self.stream_receivers = [
             stream.StreamReceiver(self.stream_path / str(c.index), offline_path, c, self.pipes[idx]) for idx, c in
@@ -97,6 +95,16 @@ class DetectionMonitor(object):
         self.frame_cache_manager = SharedMemoryManager()
         self.frame_cache_manager.start()
 
+    def init_process_pool(self):
+        """
+        build service
+        :return:
+        """
+        # pool_size = min(len(cfgs) * 2, cpu_count() - 1)
+        # self.process_pool = Pool(processes=pool_size)
+        self.process_pool = Pool(processes=len(self.cfgs) * 5)
+        self.thread_pool = ThreadPoolExecutor()
+
     def monitor(self):
         self.call()
         self.wait()
@@ -210,12 +218,11 @@ class EmbeddingControlMonitor(DetectionMonitor):
                                                      template.nbytes,
                                                      shape=cfg.shape)
                 self.frame_caches.append(frame_cache)
-                self.stream_stacks.append(
-                    [frame_cache,
-                     Manager().list()])
             else:
-                self.frame_caches.append(ListCache(Manager(), cfg.cache_size, template))
-                self.stream_stacks.append(Manager().list())
+                frame_cache = ListCache(Manager(), cfg.cache_size, template)
+                self.frame_caches.append(frame_cache)
+            # push streamer reads frames from frame cache by index, and boxes from the list
+            self.stream_stacks.append([frame_cache, Manager().list()])
 
     def init_caps(self):
         """
@@ -314,7 +321,9 @@ class EmbeddingControlBasedTaskMonitor(EmbeddingControlMonitor):
 
     def __init__(self, cfgs: List[VideoConfig], scfg, stream_path, sample_path, frame_path, region_path: Path,
                  offline_path=None, build_pool=True) -> None:
-        super().__init__(cfgs, scfg, stream_path, sample_path, frame_path, region_path, offline_path)
+        # pool workers are forked after the tracking service, so that they inherit semaphores of its rings
+        super().__init__(cfgs, scfg, stream_path, sample_path, frame_path, region_path, offline_path, False)
+        self.build_pool = build_pool
         # self.classify_model = classify_model
         # HandlerSSD.SSD_MODEL = ssd_model
         self.scfg = scfg
@@ -325,11 +334,18 @@ class EmbeddingControlBasedTaskMonitor(EmbeddingControlMonitor):
             # self.process_pool = None
         # self.thread_pool = None
         self.render_notify_queues = [self.pipe_manager.Queue() for c in self.cfgs]
+        # float history of each camera, shared by its stream render and detection signal handler,
+        # snapshots are kept outside of the daily region directory so restarts and new days reuse them
+        self.float_histories = [
+            FloatTraceIndex(c, self.region_path.parent / 'float_history' / f'{c.index}.json', self.pipe_manager)
+            for c in self.cfgs]
         self.stream_renders = []
         self.track_service = None
         self.track_requester = None
         self.detect_handlers = []
         self.track_input_pipe = self.pipe_manager.Queue()
+        # checkpoint path -> SharedCheckpoint
+        self.shared_checkpoints = {}
 
     def init_track_poster(self):
         """
@@ -338,7 +354,12 @@ class EmbeddingControlBasedTaskMonitor(EmbeddingControlMonitor):
         :return:
         """
         self.track_service = TrackingService(self.scfg.track_cfg_path, self.cfgs, self.scfg.track_model_path,
-                                             self.frame_caches)
+                                             self.frame_caches, multi_target=self.scfg.track_multi_target,
+                                             backend=self.scfg.track_backend,
+                                             backend_confidence=self.scfg.track_backend_confidence,
+                                             max_targets=self.scfg.track_max_targets,
+                                             runtime=ModelRuntime.from_config(self.scfg),
+                                             share_weights=self.scfg.share_model_weights)
         self.track_service.run()
         self.track_requester = self.track_service.get_request_instance()
 
@@ -354,7 +375,8 @@ class EmbeddingControlBasedTaskMonitor(EmbeddingControlMonitor):
                                   self.controllers[idx].render_rect_cache, self.controllers[idx].original_frame_cache,
                                   self.render_notify_queues[idx], self.region_path / str(c.index),
                                   self.controllers[idx].preview_path,
-                                  self.controllers[idx].detect_params) for idx, c
+                                  self.controllers[idx].detect_params,
+                                  self.controllers[idx].segment_path, self.float_histories[idx]) for idx, c
             in
             enumerate(self.cfgs)]
 
@@ -371,7 +393,7 @@ class EmbeddingControlBasedTaskMonitor(EmbeddingControlMonitor):
                                    self.render_notify_queues[idx], self.region_path / str(c.index),
                                    self.controllers[idx].preview_path,
                                    self.track_requester, self.render_notify_queues[idx],
-                                   self.controllers[idx].detect_params) for idx, c
+                                   self.controllers[idx].detect_params, self.float_histories[idx]) for idx, c
             in
             enumerate(self.cfgs)]
         for idx, h in enumerate(self.detect_handlers):
@@ -388,10 +410,43 @@ class EmbeddingControlBasedTaskMonitor(EmbeddingControlMonitor):
                                         self.caps_queue[idx], self.pipes[idx], self.msg_queue[idx],
                                         self.stream_stacks[idx],
                                         self.render_notify_queues[idx], self.frame_caches[idx],
-                                        self.recorder)
+                                        self.recorder, self.shared_checkpoint(cfg))
             for
             idx, cfg in enumerate(self.cfgs)]
 
+    def detect_checkpoint_path(self, cfg: VideoConfig):
+        """
+        checkpoint of the detection model used by a camera
+        :param cfg:
+        :return: checkpoint path, None if camera runs no model
+        """
+        if self.scfg.detect_mode == ModelType.SSD:
+            return self.scfg.detect_model_path
+        if self.scfg.detect_mode == ModelType.CLASSIFY and not cfg.cv_only:
+            return self.scfg.classify_model_path
+        if self.scfg.detect_mode == ModelType.CASCADE:
+            if cfg.alg['cascade_model_cfg'] != '':
+                return cfg.alg['cascade_model_path']
+            return self.scfg.cascade_model_path
+        return None
+
+    def shared_checkpoint(self, cfg: VideoConfig):
+        """
+        each checkpoint is read once and shared by all controllers using it
+        :param cfg:
+        :return: SharedCheckpoint, None if weights sharing is off or checkpoint is not found
+        """
+        path = self.detect_checkpoint_path(cfg)
+        if not self.scfg.share_model_weights or path is None:
+            return None
+        path = str(path)
+        if path not in self.shared_checkpoints:
+            if not os.path.exists(path):
+                logger.warning(f'Checkpoint [{path}] not found, controllers load their own weights.')
+                return None
+            self.shared_checkpoints[path] = SharedCheckpoint.load(path)
+        return self.shared_checkpoints[path]
+
     def init_rtsp_caps(self, c, idx):
         """
         init online rtsp video stream reciever
@@ -486,6 +541,8 @@ class EmbeddingControlBasedTaskMonitor(EmbeddingControlMonitor):
         # service initialization order is important,some services depend on other services
         self.init_websocket_clients()
         self.init_track_poster()
+        if self.build_pool:
+            self.init_process_pool()
         # Init detector controller
         self.init_controllers()
         self.init_caps()
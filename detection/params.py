@@ -13,7 +13,7 @@
 from pathlib import Path
 
 from config import VideoConfig
-from utils import logger
+from utils import logger, FrameGeometry
 
 
 # class CacheClearConfiguration(object):
@@ -96,7 +96,8 @@ class ReconstructResult(object):
 
 class DetectorParams(object):
 
-    def __init__(self, x_step, y_step, x_index, y_index, cfg: VideoConfig, region_save_path: Path) -> None:
+    def __init__(self, x_step, y_step, x_index, y_index, cfg: VideoConfig, region_save_path: Path,
+                 geometry: FrameGeometry = None) -> None:
         super().__init__()
         # self.video_path = video_path
         # self.region_save_path = region_save_path
@@ -108,6 +109,8 @@ class DetectorParams(object):
         self.start = [self.x_index * x_step, self.y_index * y_step]
         self.end = [(self.x_index + 1) * x_step, (self.y_index + 1) * y_step]
         self.region_save_path = region_save_path
+        # camera-wide coordinate transforms, shared by all blocks of a camera
+        self.geometry = geometry if geometry is not None else FrameGeometry(cfg)
         self.region_save_path.mkdir(exist_ok=True, parents=True)
         logger.debug(
             'Detector [{},{}]: region save to: [{}]'.format(self.y_index, self.y_index, str(self.region_save_path)))
@@ -11,10 +11,13 @@
 @desc:
 """
 
+import copy
+import json
 import math
 import os
 import threading
 import time
+from concurrent.futures import Future
 from dataclasses import dataclass
 from multiprocessing import Manager
 from multiprocessing.queues import Queue
@@ -23,20 +26,23 @@ from typing import List
 import cv2
 import numpy as np
 from queue import Empty
-from scipy.optimize import leastsq
+from scipy.optimize import linear_sum_assignment
 
 from config import ServerConfig, ModelType
 from config import SystemStatus
 from config import VideoConfig
 from .detect_funcs import adaptive_thresh_with_rules
+from .history import FloatTraceIndex
 from .params import DetectorParams, DispatchBlock
 from pysot.tracker.service import TrackRequester
-from stream.rtsp import FFMPEG_MP4Writer
+from stream.rtsp import FFMPEG_MP4Writer, FFMPEGWriterPool, to_bgr
+from stream.segment import cut_clip
 # from .manager import DetectorController
 from stream.websocket import creat_packaged_msg_json, creat_detect_msg_json, creat_detect_empty_msg_json
-from utils import bbox_points, generate_time_stamp, get_local_time
+from utils import FrameGeometry, generate_time_stamp, get_local_time
 from utils import paint_chinese_opencv
-from utils import preprocess, crop_by_se, logger
+from utils import logger
+from utils import BoundedExecutor
 from utils.cache import SharedMemoryFrameCache
 
 
@@ -63,7 +69,7 @@ class FrameArrivalHandler(object):
 
     def __init__(self, cfg: VideoConfig, scfg: ServerConfig, detect_index, future_frames, msg_queue: Queue,
                  rect_stream_path, original_stream_path, render_rect_cache, original_frame_cache,
-                 notify_queue, region_path, preview_path=None, detect_params=None) -> None:
+                 notify_queue, region_path, preview_path=None, detect_params=None, float_history=None) -> None:
         super().__init__()
         self.cfg = cfg
         self.scfg = scfg
@@ -89,11 +95,14 @@ class FrameArrivalHandler(object):
         self.status = Manager().Value('i', SystemStatus.RUNNING)
         self.notify_queue = notify_queue
         self.LOG_PREFIX = f'Frame Arrival Handler [{self.cfg.index}]: '
-        self.post_filter = Filter(self.cfg, region_path, detect_params)
+        self.post_filter = Filter(self.cfg, region_path, detect_params, float_history)
+        self.geometry = self.post_filter.geometry
         self.last_detection = time.time()  # record the last task triggered time.
         self.pre_candidate_rect = []  # record the last rects seed for detection or tracking
         self.task_msg_queue = Manager().Queue()
         self.dis_thresh = max(self.cfg.shape[0], self.cfg.shape[1]) * 1 / 4
+        # bounded workers of window tasks, threads can't be pickled so it is created inside the looping process
+        self.executor = None
 
     def is_window_reach(self, detect_index):
         return detect_index - self.detect_index > self.future_frames
@@ -209,6 +218,28 @@ class FrameArrivalHandler(object):
             self.lock_window.set()
             self.status.set(SystemStatus.SHUT_DOWN)
 
+    def init_executor(self):
+        self.executor = BoundedExecutor(self.cfg.render_workers, self.cfg.render_queue_size,
+                                        self.cfg.render_overlap_policy, self.merge_task, self.LOG_PREFIX + 'Executor')
+
+    def merge_task(self, waiting_args, new_args):
+        """
+        merge a new window task into an overlapping waiting one, override by subclass
+        :return: arguments of merged task, None if they can't be merged
+        """
+        return waiting_args
+
+    def submit(self, fn, window, *args):
+        """
+        run a window task by bounded executor
+        :param fn: task function
+        :param window: (start, end) frame window of task
+        :return: True if task is accepted or merged
+        """
+        if self.executor is None:
+            self.init_executor()
+        return self.executor.submit(fn, *args, window=window) is not None
+
     def loop(self):
         """
         loop message inside a sub-process
@@ -217,6 +248,8 @@ class FrameArrivalHandler(object):
         logger.info(
             f'*******************************{self.LOG_PREFIX}: Init Frame Arrival Handle Service********************************')
         threading.Thread(target=self.listen, daemon=True).start()
+        if self.executor is None:
+            self.init_executor()
         while self.status.get() == SystemStatus.RUNNING:
             try:
                 # index, type = self.notify_queue.get()
@@ -231,6 +264,9 @@ class FrameArrivalHandler(object):
                 pass
             except Exception as e:
                 logger.error(e)
+        # waiting tasks are cancelled, running ones see the shutdown status
+        self.executor.shutdown(cancel=True, timeout=5)
+        self.executor.report()
         logger.info(
             f'*******************************{self.LOG_PREFIX}: Exit Frame Arrival Handle Service********************************')
 
@@ -240,13 +276,64 @@ class DetectionStreamRender(FrameArrivalHandler):
     Generate a video with fixed time when notification occurs
     """
 
+    # each bbox will last 1.5s in 25FPS video
+    RECT_HOLD_FRAMES = 36
+
     def __init__(self, cfg: VideoConfig, scfg: ServerConfig, detect_index, future_frames, msg_queue: Queue,
                  rect_stream_path,
                  original_stream_path, render_frame_cache, original_frame_cache, notify_queue,
-                 region_path, preview_path=None, detect_params=None) -> None:
+                 region_path, preview_path=None, detect_params=None, segment_path=None, float_history=None) -> None:
         super().__init__(cfg, scfg, detect_index, future_frames, msg_queue, rect_stream_path, original_stream_path,
                          render_frame_cache, original_frame_cache, notify_queue, region_path, preview_path,
-                         detect_params)
+                         detect_params, float_history)
+        # rolling segments of continuous recording, original clips are cut from them if not None
+        self.segment_path = segment_path
+        # warm encoders can't be pickled, pools are created inside the rendering process
+        self.rect_writer_pool = None
+        self.original_writer_pool = None
+
+    def init_writer_pools(self):
+        if self.scfg.encoder_pool_workers <= 0:
+            return
+        size = (self.cfg.shape[1], self.cfg.shape[0])
+        # original clips are cut from segments in segment recording mode
+        if self.render_overlay():
+            self.rect_writer_pool = FFMPEGWriterPool(size, 25, self.rect_stream_path,
+                                                     self.scfg.encoder_pool_workers, pix_fmt=self.cfg.frame_pix_fmt)
+        if self.segment_path is None:
+            self.original_writer_pool = FFMPEGWriterPool(size, 25, self.original_stream_path,
+                                                         self.scfg.encoder_pool_workers,
+                                                         pix_fmt=self.cfg.frame_pix_fmt)
+        logger.info(self.LOG_PREFIX + f'Init [{self.scfg.encoder_pool_workers}] warm encoders per clip type.')
+
+    def close_writer_pools(self):
+        for pool in [self.rect_writer_pool, self.original_writer_pool]:
+            if pool is not None:
+                pool.close()
+
+    def open_writer(self, pool: FFMPEGWriterPool, target):
+        """
+        take a warm encoder from pool, blocked while all encoders of pool are busy.
+        :param pool: None if pool is disabled
+        :param target: clip path
+        :return: video writer, None if all encoders are still busy after encoder_pool_timeout and the clip is dropped
+        """
+        if pool is not None:
+            writer = pool.start(target, self.scfg.encoder_pool_timeout)
+            if writer is None:
+                logger.warning(self.LOG_PREFIX + f'All encoders are busy after [{self.scfg.encoder_pool_timeout}] '
+                                                 f'seconds, drop clip [{str(target)}], '
+                                                 f'[{pool.rejected}] clips dropped by pool.')
+            return writer
+        return FFMPEG_MP4Writer(str(target), (self.cfg.shape[1], self.cfg.shape[0]), 25,
+                                pix_fmt=self.cfg.frame_pix_fmt)
+
+    def loop(self):
+        self.init_writer_pools()
+        try:
+            super().loop()
+        finally:
+            self.close_writer_pools()
 
     def task(self, msg: ArrivalMessage):
         """
@@ -257,19 +344,45 @@ class DetectionStreamRender(FrameArrivalHandler):
         """
         current_idx = msg.current_index
         current_time = generate_time_stamp('%m%d%H%M%S')
+        window = (current_idx - self.future_frames, current_idx + self.future_frames)
+        # overlapping events are rendered into the waiting clip, boxes of all events are in rect cache
+        accepted = self.submit(self.render_task, window, current_idx, current_time, msg, self.task_cnt, window[1])
+        self.task_cnt += 1
+        return accepted
+
+    def merge_task(self, waiting_args, new_args):
+        """
+        the waiting clip is extended to the end of the new event, so that frames after its own window are not lost
+        """
+        return waiting_args[:4] + (max(waiting_args[4], new_args[4]),)
+
+    def render_overlay(self):
+        """
+        :return: if the bbox overlay clip is rendered, otherwise the original clip is sent in message
+        """
+        if self.cfg.render_sidecar:
+            return False
+        return self.segment_path is None or self.cfg.overlay_clip
+
+    def render_task(self, current_idx, current_time, msg: ArrivalMessage, task_cnt, end_idx=None):
+        """
+        render both clips of an event, executed by a worker of bounded executor
+        :param end_idx: end frame index of clips, the end of the event window if None, extended by merged events
+        """
+        end_idx = current_idx + self.future_frames if end_idx is None else end_idx
+        if self.segment_path is None and self.cfg.single_pass_render:
+            return self.single_pass_render_task(current_idx, current_time, msg, task_cnt, end_idx)
         post_filter_event = threading.Event()
         post_filter_event.clear()
-        # use two independent threads to execute video generation sub-tasks
-        rect_render_thread = threading.Thread(
-            target=self.rect_render_task,
-            args=(current_idx, current_time, post_filter_event, msg,), daemon=True)
-        rect_render_thread.start()
+        post_filter_future = self.start_post_filter(current_idx, task_cnt, end_idx)
+        # the two clips are encoded at the same time
         original_render_thread = threading.Thread(
             target=self.original_render_task,
-            args=(current_idx, current_time, post_filter_event, msg,), daemon=True)
+            args=(current_idx, current_time, post_filter_event, msg, task_cnt, end_idx,), daemon=True)
         original_render_thread.start()
-        self.task_cnt += 1
-        return True
+        self.rect_render_task(current_idx, current_time, post_filter_event, msg, task_cnt, post_filter_future,
+                              end_idx)
+        original_render_thread.join()
 
     def write_render_video_work(self, video_write, next_cnt, end_cnt):
         """
@@ -284,10 +397,14 @@ class DetectionStreamRender(FrameArrivalHandler):
         render_cnt = 0
         rects = []
         for index in range(next_cnt, end_cnt + 1):
-            frame = self.original_frame_cache[index].copy()
+            try:
+                frame = self.fetch_frame(index)
+            except TimeoutError as e:
+                logger.info(self.LOG_PREFIX + f'{e} Complete render task.')
+                break
             if frame is None:
-                print(f'Frame is none for [{index}]')
                 continue
+            frame = frame.copy()
             # tmp_rects = self.render_rect_cache[index % self.cache_size]
             # self.render_rect_cache[index % self.cache_size] = None
             # if current frame has bbox, just update the bbox position, and clear counting
@@ -300,27 +417,187 @@ class DetectionStreamRender(FrameArrivalHandler):
 
             # each bbox will last 1.5s in 25FPS video
             logger.debug(self.LOG_PREFIX + f'Render rect frame idx {index}, rects {rects}')
-            is_render = render_cnt <= 36
+            is_render = render_cnt <= self.RECT_HOLD_FRAMES
             if is_render:
-                for rect in rects:
-                    color = np.random.randint(0, 255, size=(3,))
-                    color = [int(c) for c in color]
-                    # get a square bbox, the real bbox of width and height is universal as 224 * 224 or 448 * 448
-                    p1, p2 = bbox_points(self.cfg, rect, frame.shape)
-                    # write text
-                    # frame = paint_chinese_opencv(frame, '江豚', p1)
-                    cv2.rectangle(frame, p1, p2, color, 2)
-                    if self.scfg.detect_mode != ModelType.CLASSIFY and len(rect) >= 5:
-                        cv2.putText(frame, str(round(rect[4], 2)), (p2[0], p2[1]),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 2, color, 2, cv2.LINE_AA)
+                self.draw_rects(frame, rects)
                 render_cnt += 1
             next_cnt += 1
             video_write.write(frame)
         return next_cnt
 
+    def draw_rects(self, frame, rects):
+        # get a square bbox, the real bbox of width and height is universal as 224 * 224 or 448 * 448
+        boxes = self.geometry.square_boxes(rects)
+        for rect, box in zip(rects, boxes):
+            color = np.random.randint(0, 255, size=(3,))
+            color = [int(c) for c in color]
+            p1, p2 = (int(box[0]), int(box[1])), (int(box[2]), int(box[3]))
+            # write text
+            # frame = paint_chinese_opencv(frame, '江豚', p1)
+            cv2.rectangle(frame, p1, p2, color, 2)
+            if self.scfg.detect_mode != ModelType.CLASSIFY and len(rect) >= 5:
+                cv2.putText(frame, str(round(rect[4], 2)), (p2[0], p2[1]),
+                            cv2.FONT_HERSHEY_SIMPLEX, 2, color, 2, cv2.LINE_AA)
+        return frame
+
+    def write_window_once(self, begin, end, original_writer, rect_writer, scratch, hold, preview_index,
+                          preview_path):
+        """
+        read each frame of [begin, end) once from cache, the pristine frame goes to original writer,
+        boxes are drawn on a scratch copy for rect writer, and the preview photo is taken in the same pass
+        :param hold: [rects, render_cnt] of the last rendered boxes, updated in place
+        :return: next frame index
+        """
+        for index in range(begin, end):
+            if self.status.get() == SystemStatus.SHUT_DOWN:
+                logger.info(f'Video Render [{self.index}]: render task interrupted by exit signal')
+                return index
+            try:
+                frame = self.fetch_frame(index)
+            except TimeoutError as e:
+                logger.info(self.LOG_PREFIX + f'{e} Complete render task.')
+                return index
+            if frame is None:
+                continue
+            original_writer.write(frame)
+            if index == preview_index:
+                cv2.imwrite(str(preview_path), to_bgr(frame, self.cfg.frame_pix_fmt))
+            if rect_writer is None:
+                continue
+            if index in self.render_rect_cache:
+                hold[0], hold[1] = self.render_rect_cache[index], 0
+            if hold[1] <= self.RECT_HOLD_FRAMES and len(hold[0]):
+                np.copyto(scratch, frame)
+                rect_writer.write(self.draw_rects(scratch, hold[0]))
+            else:
+                rect_writer.write(frame)
+            hold[1] += 1
+        return end
+
+    def write_bbox_track(self, begin, end, target):
+        """
+        write boxes of a clip into a sidecar json file, so that clients can draw them over the original clip
+        :param begin: first frame index of clip
+        :param end: last frame index of clip, exclusive
+        :param target: json path
+        """
+        frames = []
+        for index in range(begin, end):
+            if index not in self.render_rect_cache:
+                continue
+            rects = self.render_rect_cache[index]
+            boxes = self.geometry.square_boxes(rects)
+            frames.append({'frame': index - begin,
+                           'boxes': [[int(v) for v in box[:4]] for box in boxes],
+                           'scores': [round(float(r[4]), 4) if len(r) >= 5 else None for r in rects]})
+        with open(str(target), 'w') as f:
+            json.dump({'fps': self.cfg.fps, 'width': self.cfg.shape[1], 'height': self.cfg.shape[0],
+                       'hold_frames': self.RECT_HOLD_FRAMES, 'frames': frames}, f)
+
+    def single_pass_render_task(self, current_idx, current_time, msg: ArrivalMessage, task_cnt, end_idx=None):
+        """
+        render the original clip, the bbox overlay clip and the preview photo of an event by reading
+        each frame of the window only once
+        :param end_idx: end frame index of clips, the end of the event window if None
+        """
+        start = time.time()
+        name = f'{current_time}_{self.cfg.index}_{str(task_cnt)}'
+        original_target = self.original_stream_path / f'{name}.mp4'
+        rect_target = self.rect_stream_path / f'{name}.mp4'
+        preview_photo_path = self.preview_path / f'{name}.jpg'
+        overlay = self.render_overlay()
+        original_writer = self.open_writer(self.original_writer_pool, original_target)
+        if original_writer is None:
+            return
+        rect_writer = self.open_writer(self.rect_writer_pool, rect_target) if overlay else None
+        # the overlay clip is dropped by busy encoders, the original clip is sent instead
+        overlay = rect_writer is not None
+        # boxes are drawn on a reused buffer, frames in cache are never modified
+        scratch = np.empty(tuple(self.cfg.shape), dtype=np.uint8) if overlay else None
+        hold = [[], 0]
+        begin = max(current_idx - self.future_frames, 1)
+        end = current_idx + self.future_frames if end_idx is None else end_idx
+        post_filter_future = self.start_post_filter(current_idx, task_cnt, end)
+        try:
+            # frames before the event are ready, encode them while future frames are arriving
+            next_cnt = self.write_window_once(begin, current_idx, original_writer, rect_writer, scratch, hold,
+                                              current_idx, preview_photo_path)
+            # future frames are written as soon as they arrive, but boxes drawn by the overlay come from
+            # detection of those frames, unless they were given by tracking already
+            if rect_writer is not None and not msg.no_wait:
+                self.wait(task_cnt, 'Render Task', msg)
+            self.write_window_once(next_cnt, end, original_writer, rect_writer, scratch, hold, current_idx,
+                                   preview_photo_path)
+        except Exception as e:
+            logger.error(e)
+        original_writer.release()
+        if rect_writer is not None:
+            rect_writer.release()
+        if self.cfg.render_sidecar:
+            self.write_bbox_track(begin, end, original_target.with_suffix('.json'))
+        logger.info(
+            f'Video Render [{self.index}]: Render Task [{task_cnt}]: Consume [{round(time.time() - start, 2)}] ' +
+            f'seconds.Done write clips: [{str(original_target)}]' + (f', [{str(rect_target)}]' if overlay else ''))
+        post_filter_event = threading.Event()
+        post_filter_event.set()
+        self.post_handle(current_time, post_filter_event, rect_target if overlay else original_target, task_cnt,
+                         preview_photo_path, post_filter_future)
+
+    def window_frames(self, begin, end):
+        """
+        frames of [begin, end) read from frame cache as they arrive, in BGR as frames decoded from a clip
+        :return: generator of (position in clip, frame)
+        """
+        for index in range(begin, end):
+            if self.status.get() == SystemStatus.SHUT_DOWN:
+                return
+            try:
+                frame = self.fetch_frame(index)
+            except TimeoutError as e:
+                logger.info(self.LOG_PREFIX + f'{e} Complete post filter frames.')
+                return
+            if frame is None:
+                continue
+            yield index - begin, to_bgr(frame, self.cfg.frame_pix_fmt)
+
+    def start_post_filter(self, current_idx, task_cnt, end_idx=None):
+        """
+        analyse the window of an event from frame cache in a new thread while its clips are being encoded,
+        the clip file is an output only, it is never decoded again
+        :param end_idx: end frame index of the window, current_idx + future_frames if None
+        :return: future of (is_contain_dolphin, traces), None if post filter is disabled
+        """
+        if not self.cfg.post_filter:
+            return None
+        future = Future()
+        begin = max(current_idx - self.future_frames, 1)
+        end = current_idx + self.future_frames if end_idx is None else end_idx
+
+        def analyse():
+            try:
+                future.set_result(self.post_filter.post_filter_frames(self.window_frames(begin, end), task_cnt))
+            except Exception as e:
+                future.set_exception(e)
+
+        threading.Thread(target=analyse, daemon=True).start()
+        return future
+
+    def fetch_frame(self, index):
+        """
+        block until frame index is written into cache, no polling
+        :param index: frame index
+        :return: frame, None if its slot has been lapped by newer frames
+        """
+        if not self.original_frame_cache.wait(index, self.cfg.frame_wait_timeout):
+            raise TimeoutError(f'Frame [{index}] does not arrive in [{self.cfg.frame_wait_timeout}] seconds.')
+        frame = self.original_frame_cache.get(index)
+        if frame is None:
+            logger.info(self.LOG_PREFIX + f'Frame [{index}] was overwritten by newer frames, skipped.')
+        return frame
+
     def write_original_video_work(self, video_write, next_cnt, end_cnt):
         """
-        write original frame into video.
+        write original frame into video, each frame is written as soon as it arrives.
         :param video_write: write video into a pipe, which is directed to ffmpeg command
         :param next_cnt:
         :param end_cnt:
@@ -328,52 +605,48 @@ class DetectionStreamRender(FrameArrivalHandler):
         """
         if next_cnt < 1:
             next_cnt = 1
-        start = time.time()
-        try_times = 0
         while next_cnt < end_cnt:
+            if self.status.get() == SystemStatus.SHUT_DOWN:
+                logger.info(
+                    f'Video Render [{self.index}]: original task interruped by exit signal')
+                return next_cnt
             try:
-                if self.status.get() == SystemStatus.SHUT_DOWN:
-                    logger.info(
-                        f'Video Render [{self.index}]: original task interruped by exit signal')
-                    return False
-                # if next_cnt in frame_cache:
-                frame = self.original_frame_cache[next_cnt % self.cache_size]
-                if frame is not None:
-                    video_write.write(frame)
-                    # frame_cache[next_cnt % self.cache_size] = None
-                    next_cnt += 1
-                else:
-                    try_times += 1
-                    time.sleep(0.5)
-                    if try_times > 100:
-                        try_times = 0
-                        logger.info(f'Try time overflow.round to the next cnt: [{try_times}]')
-                        next_cnt += 1
-                    logger.info(f'Lost frame index: [{next_cnt}]')
-
-                end = time.time()
-                if end - start > 30:
-                    logger.info('Task time overflow, complete previous render task.')
-                    break
-            except Exception as e:
-                end = time.time()
-                if end - start > 30:
-                    logger.info('Task time overflow, complete previous render task.')
-                    break
-                logger.error(e)
+                frame = self.fetch_frame(next_cnt)
+            except TimeoutError as e:
+                logger.info(self.LOG_PREFIX + f'{e} Complete render task.')
+                break
+            if frame is not None:
+                video_write.write(frame)
+            next_cnt += 1
         return next_cnt
 
-    def rect_render_task(self, current_idx, current_time, post_filter_event, msg: ArrivalMessage):
+    def rect_render_task(self, current_idx, current_time, post_filter_event, msg: ArrivalMessage, task_cnt=None,
+                         post_filter_future=None, end_idx=None):
         """
         generate a short-time dolphin video with bbox indicator.
         :param current_idx: start frame index in a slide window
         :param current_time:
         :param post_filter_event:
         :param msg: arrival message
+        :param task_cnt: counting of event, current counting if None
+        :param post_filter_future: post filter decision of the window, see start_post_filter()
+        :param end_idx: end frame index of clip, current_idx + future_frames if None
         :return:
         """
         start = time.time()
-        task_cnt = self.task_cnt
+        task_cnt = self.task_cnt if task_cnt is None else task_cnt
+        end_cnt = current_idx + self.future_frames if end_idx is None else end_idx
+        if not self.render_overlay():
+            # overlay clip is not rendered, the original clip is sent instead
+            target = self.original_stream_path / f'{current_time}_{self.cfg.index}_{str(task_cnt)}.mp4'
+            preview_photo_path = self.save_preview(current_idx, current_time, task_cnt)
+            post_filter_event.wait()
+            # clips cut from segments write their own sidecar, see original_clip_task()
+            if self.cfg.render_sidecar and self.segment_path is None:
+                self.write_bbox_track(max(current_idx - self.future_frames, 1), end_cnt, target.with_suffix('.json'))
+            self.post_handle(current_time, post_filter_event, target, task_cnt, preview_photo_path,
+                             post_filter_future)
+            return
         # raw_target = self.original_stream_path / (current_time + str(self.task_cnt) + '_raw' + '.mp4')
         # target = self.rect_stream_path / (current_time + str(task_cnt) + '.mp4')
         target = self.rect_stream_path / f'{current_time}_{self.cfg.index}_{str(task_cnt)}.mp4'
@@ -381,7 +654,9 @@ class DetectionStreamRender(FrameArrivalHandler):
             f'Video Render [{self.index}]: Rect Render Task [{task_cnt}]: Writing detection stream frame into: [{str(target)}]')
         # fourcc = cv2.VideoWriter_fourcc(*'avc1')
         # video_write = cv2.VideoWriter(str(raw_target), self.fourcc, 24.0, (self.cfg.shape[1], self.cfg.shape[0]), True)
-        video_write = FFMPEG_MP4Writer(str(target), (self.cfg.shape[1], self.cfg.shape[0]), 25)
+        video_write = self.open_writer(self.rect_writer_pool, target)
+        if video_write is None:
+            return
         next_cnt = current_idx - self.future_frames
         # next_cnt = self.write_render_video_work(video_write, next_cnt, current_idx, render_cache, rect_cache,
         #                                         frame_cache)
@@ -389,7 +664,6 @@ class DetectionStreamRender(FrameArrivalHandler):
         # next_frame_cnt = 48
         # wait the futures frames is accessable
         self.wait(task_cnt, 'Rect Render Task', msg)
-        end_cnt = current_idx + self.future_frames
         try:
             next_cnt = self.write_render_video_work(video_write, next_cnt, end_cnt)
         except Exception as e:
@@ -398,40 +672,76 @@ class DetectionStreamRender(FrameArrivalHandler):
         logger.info(
             f'Video Render [{self.index}]: Rect Render Task [{task_cnt}]: Consume [{round(time.time() - start, 2)}] ' +
             f'seconds.Done write detection stream frame into: [{str(target)}]')
-        preview_photo = self.original_frame_cache[current_idx]
-        preview_photo_path = self.preview_path / f'{current_time}_{self.cfg.index}_{str(task_cnt)}.jpg'
-        cv2.imwrite(str(preview_photo_path), cv2.cvtColor(preview_photo, cv2.COLOR_RGB2BGR))
-        self.post_handle(current_time, post_filter_event, target, task_cnt, preview_photo_path)
+        preview_photo_path = self.save_preview(current_idx, current_time, task_cnt)
+        self.post_handle(current_time, post_filter_event, target, task_cnt, preview_photo_path, post_filter_future)
         # if msg.no_wait:
         # release lock status
         # self.original_frame_cache.release()
         # logger.info('Release original frame cache')
 
-    def original_render_task(self, current_idx, current_time, post_filter_event, msg: ArrivalMessage):
+    def save_preview(self, current_idx, current_time, task_cnt):
+        preview_photo = self.original_frame_cache[current_idx]
+        preview_photo_path = self.preview_path / f'{current_time}_{self.cfg.index}_{str(task_cnt)}.jpg'
+        cv2.imwrite(str(preview_photo_path), to_bgr(preview_photo, self.cfg.frame_pix_fmt))
+        return preview_photo_path
+
+    def original_clip_task(self, current_idx, current_time, post_filter_event, task_cnt, end_idx=None):
+        """
+        cut the original clip of a window from recorded segments by stream copy
+        :param end_idx: end frame index of clip, current_idx + future_frames if None
+        """
+        end_idx = current_idx + self.future_frames if end_idx is None else end_idx
+        start = time.time()
+        target = self.original_stream_path / f'{current_time}_{self.cfg.index}_{str(task_cnt)}.mp4'
+        segment_frames = int(round(self.cfg.fps * self.cfg.segment_duration))
+        # the window is still being recorded, wait at most its rest duration plus a segment
+        timeout = (end_idx - current_idx + segment_frames) / self.cfg.fps + 30
+        clip_range = cut_clip(self.segment_path, segment_frames, max(current_idx - self.future_frames, 0), end_idx,
+                              target, timeout, event_index=current_idx)
+        if clip_range is not None:
+            if self.cfg.render_sidecar:
+                # the clip is aligned to segment boundaries, boxes are offset from its actual first frame
+                self.write_bbox_track(*clip_range, target.with_suffix('.json'))
+            logger.info(f'Video Render [{self.index}]: Original Clip Task [{task_cnt}]: Consume '
+                        f'[{round(time.time() - start, 2)}] seconds.Done cut clip from segments: [{str(target)}]')
+        else:
+            logger.error(f'Video Render [{self.index}]: Original Clip Task [{task_cnt}]: '
+                         f'no segment is available for [{str(target)}]')
+        post_filter_event.set()
+
+    def original_render_task(self, current_idx, current_time, post_filter_event, msg: ArrivalMessage,
+                             task_cnt=None, end_idx=None):
         """
         generate a short-time dolphin video without bbox indicator.
         :param msg:
         :param post_filter_event:
         :param current_idx:
         :param current_time:
+        :param task_cnt: counting of event, current counting if None
+        :param end_idx: end frame index of clip, current_idx + future_frames if None
         :return:
         """
+        task_cnt = self.task_cnt if task_cnt is None else task_cnt
+        if self.segment_path is not None:
+            return self.original_clip_task(current_idx, current_time, post_filter_event, task_cnt, end_idx)
         start = time.time()
         post_filter_event.clear()
-        task_cnt = self.task_cnt
         # raw_target = self.original_stream_path / (current_time + str(self.task_cnt) + '_raw' + '.mp4')
         target = self.original_stream_path / f'{current_time}_{self.cfg.index}_{str(task_cnt)}.mp4'
         logger.debug(
             f'Video Render [{self.index}]: Original Render Task [{task_cnt}]: Writing detection stream frame into: [{str(target)}]')
         # video_write = cv2.VideoWriter(str(raw_target), self.fourcc, 24.0, (self.cfg.shape[1], self.cfg.shape[0]), True)
-        video_write = FFMPEG_MP4Writer(str(target), (self.cfg.shape[1], self.cfg.shape[0]), 25)
+        video_write = self.open_writer(self.original_writer_pool, target)
+        if video_write is None:
+            # the rect render task is not blocked by a dropped clip
+            post_filter_event.set()
+            return
         # if not video_write.isOpened():
         #     logger.error(f'Video Render [{self.index}]: Error Opened Video Writer')
 
+        # future frames are written as they arrive, no need to wait for the window
         next_cnt = current_idx - self.future_frames
-        next_cnt = self.write_original_video_work(video_write, next_cnt, current_idx)
-        self.wait(task_cnt, 'Original Render Task', msg)
-        end_cnt = next_cnt + self.future_frames
+        end_cnt = current_idx + self.future_frames if end_idx is None else end_idx
         next_cnt = self.write_original_video_work(video_write, next_cnt, end_cnt)
         video_write.release()
         logger.debug(
@@ -440,7 +750,7 @@ class DetectionStreamRender(FrameArrivalHandler):
         # notify post filter can begin its job
         post_filter_event.set()
 
-    def post_handle(self, current_time, post_filter_event, target, task_cnt, preview):
+    def post_handle(self, current_time, post_filter_event, target, task_cnt, preview, post_filter_future=None):
         """
         post process for each generated video.Can do post filter according its timing information
         :param current_time:
@@ -448,44 +758,62 @@ class DetectionStreamRender(FrameArrivalHandler):
         :param target: video path
         :param preview: preview photo path
         :param task_cnt: current video counting
+        :param post_filter_future: post filter decision analysed from frame cache, the original clip is decoded
+        and analysed if None
         :return:
         """
-        origin_video_path = self.original_stream_path / (current_time + str(task_cnt) + '.mp4')
+        origin_video_path = self.original_stream_path / f'{current_time}_{self.cfg.index}_{str(task_cnt)}.mp4'
         if self.cfg.post_filter:
-            self.do_post_filter(origin_video_path, preview, task_cnt, post_filter_event)
+            self.do_post_filter(origin_video_path, preview, task_cnt, post_filter_event, post_filter_future)
+        elif not target.exists():
+            logger.info(self.LOG_PREFIX + f'Clip [{str(target)}] was dropped, no message is sent.')
         else:
+            track = target.with_suffix('.json')
             msg_json = creat_packaged_msg_json(filename=str(target.name), path=str(target), cfg=self.cfg,
                                                camera_id=self.cfg.camera_id, channel=self.cfg.channel,
-                                               preview_name=str(preview.name))
+                                               preview_name=str(preview.name),
+                                               track_name=track.name if self.cfg.render_sidecar else None)
             self.msg_queue.put(msg_json)
             logger.info(self.LOG_PREFIX + f'Send packaged message: {msg_json} to msg_queue...')
 
-    def do_post_filter(self, target, preview, task_cnt, post_filter_event):
+    def do_post_filter(self, target, preview, task_cnt, post_filter_event, post_filter_future=None):
         """
         execute post filter
         :param preview:
         :param target:
         :param task_cnt:
         :param post_filter_event:
+        :param post_filter_future: decision analysed from frame cache, target is decoded and analysed if None
         :return:
         """
 
         # blocked until original video generation is done.
         post_filter_event.wait()
-        # execute post filter
-        is_contain_dolphin, dol_rects = self.post_filter.post_filter_video(str(target), task_cnt)
+        if not target.exists():
+            logger.info(self.LOG_PREFIX + f'Clip [{str(target)}] was dropped, no message is sent.')
+            return
+        if post_filter_future is not None:
+            # frames were analysed while the clip was being encoded
+            is_contain_dolphin, dol_rects = post_filter_future.result()
+        else:
+            is_contain_dolphin, dol_rects = self.post_filter.post_filter_video(str(target), task_cnt)
         if is_contain_dolphin:
             """
             post filter think it is a video clip with dolphin
             """
+            track = target.with_suffix('.json')
             msg_json = creat_packaged_msg_json(filename=str(target.name), path=str(target), cfg=self.cfg,
                                                camera_id=self.cfg.camera_id, channel=self.cfg.channel,
-                                               preview_name=preview.name)
+                                               preview_name=preview.name,
+                                               track_name=track.name if self.cfg.render_sidecar else None)
             self.msg_queue.put(msg_json)
             logger.info(self.LOG_PREFIX + f'Send packaged message: {msg_json} to msg_queue...')
 
 
 class Obj(object):
+    # 相邻两帧间物体中心的最大位移，超过则不加入轨迹
+    MAX_STEP_DST = 200
+
     def __init__(self, index, cfg: VideoConfig):
         self.index = index  # 当前物体编号
         self.category = None  # 当前物体类别
@@ -516,37 +844,46 @@ class Obj(object):
         w, h = abs(rect[0] - rect[2]), abs(rect[1] - rect[3])
         return w * h
 
+    @staticmethod
+    def centers(rects):
+        """
+        :param rects: [[x1, y1, x2, y2], ...]
+        :return: n x 2 array of rect centers
+        """
+        rects = np.asarray([rect[:4] for rect in rects], dtype=np.float64).reshape(-1, 4)
+        return np.stack([(rects[:, 0] + rects[:, 2]) / 2.0, (rects[:, 1] + rects[:, 3]) / 2.0], axis=1)
+
     @staticmethod
     def linear_func(param, x):
         a, b = param
         return a * x + b
 
-    def linear_error(self, param, x, y):
-        return self.linear_func(param, x) - y
-
-    def solve_linear_lsq(self, x, y):
-        p0 = np.array([0, 0])
-        param = leastsq(self.linear_error, p0, args=(x, y))
-        return param
+    @staticmethod
+    def solve_linear_lsq(x, y):
+        """
+        closed-form least squares line y = a * x + b
+        :return: ((a, b), ier), the layout of scipy.optimize.leastsq
+        """
+        return np.polyfit(x, y, 1), 1
 
     @staticmethod
     def quadratic_func(param, x):
         a, b, c = param
         return a * x * x + b * x + c
 
-    def quadratic_error(self, param, x, y):
-        return self.quadratic_func(param, x) - y
-
-    def solve_quadratic_lsq(self, x, y):
-        p0 = np.array([10, 10, 10])
-        param = leastsq(self.quadratic_error, p0, args=(x, y))
-        return param
+    @staticmethod
+    def solve_quadratic_lsq(x, y):
+        """
+        closed-form least squares parabola y = a * x^2 + b * x + c
+        :return: ((a, b, c), ier), the layout of scipy.optimize.leastsq
+        """
+        return np.polyfit(x, y, 2), 1
 
     def is_quadratic_with_negative_a(self, area_list):
         if len(area_list) < 3:
             return False
-        x = np.array(range(len(area_list)))
-        y = np.array(area_list)
+        x = np.arange(len(area_list))
+        y = np.asarray(area_list, dtype=np.float64)
         param = self.solve_quadratic_lsq(x, y)
         a, b, c = param[0]
         if a < 0:
@@ -577,7 +914,7 @@ class Obj(object):
                 # print(f'append idx={idx}, rect={rect}, idx1-idx>3')
                 return False
             avg_dst = self.cal_dst(rect1, rect) / abs(idx1 - idx)
-            if avg_dst <= 200:
+            if avg_dst <= self.MAX_STEP_DST:
                 # 防止追踪剧烈闪屏
                 self.trace.append((idx, rect))
                 return True
@@ -592,19 +929,14 @@ class Obj(object):
         :param float_trace: 与self.trace格式相同,[(idx1, rect1), (idx2, rect2), ...]
         :return: True->拟合出了近似水平线，False->没有拟合出近似水平线
         """
-        x = []
-        y = []
-        for idx, rect in float_trace:
-            x.append((rect[0] + rect[2]) / 2.0)
-            y.append((rect[1] + rect[3]) / 2.0)
-        for idx, rect in self.trace:
-            x.append((rect[0] + rect[2]) / 2.0)
-            y.append((rect[1] + rect[3]) / 2.0)
-        if len(x) <= 1:
+        centers = self.centers([rect for idx, rect in float_trace] + [rect for idx, rect in self.trace])
+        if len(centers) <= 1:
             # 数据太少，无法拟合
             return False
-        x = np.array(x)
-        y = np.array(y)
+        x, y = centers[:, 0], centers[:, 1]
+        if np.ptp(x) == 0:
+            # 中心点横坐标相同，拟合出的是竖直线
+            return False
         param = self.solve_linear_lsq(x, y)
         a, b = param[0]
         # 转化斜率为角度
@@ -638,19 +970,11 @@ class Obj(object):
         #     # 轨迹长度过短，无法分析物体类别
         #     self.category = 'Unknown'
         #     return
-        avg_speed_list = []
-        continue_idx_sum = 0
-        dst_sum = 0
-        area_list = [self.cal_area(self.trace[0][1])]
-        for i in range(1, len(self.trace)):
-            pre_idx, pre_rect = self.trace[i - 1]
-            current_idx, current_rect = self.trace[i]
-            continue_idx_sum += abs(current_idx - pre_idx)
-            area_list.append(self.cal_area(current_rect))
-            dst = self.cal_dst(pre_rect, current_rect)
-            dst_sum += dst
-            avg_speed = dst / abs(pre_idx - current_idx)
-            avg_speed_list.append(avg_speed)
+        idx_gaps = np.abs(np.diff([idx for idx, rect in self.trace]))
+        steps = np.diff(self.centers([rect for idx, rect in self.trace]), axis=0)
+        avg_speed_list = (np.hypot(steps[:, 0], steps[:, 1]) / idx_gaps).tolist()
+        continue_idx_sum = int(idx_gaps.sum())
+        # area_list = [self.cal_area(rect) for idx, rect in self.trace]
         mid_avg_speed = self.get_median(avg_speed_list)
         self.mid_avg_speed = mid_avg_speed
         self.continue_idx_sum = continue_idx_sum
@@ -679,10 +1003,10 @@ class DetectionSignalHandler(FrameArrivalHandler):
                  rect_stream_path,
                  original_stream_path, render_frame_cache, original_frame_cache, notify_queue,
                  region_path, preview_path, track_requester: TrackRequester, render_queue: Queue,
-                 detect_params=None) -> None:
+                 detect_params=None, float_history=None) -> None:
         super().__init__(cfg, scfg, detect_index, future_frames, msg_queue, rect_stream_path, original_stream_path,
                          render_frame_cache, original_frame_cache, notify_queue, region_path, preview_path,
-                         detect_params)
+                         detect_params, float_history)
         self.track_requester = track_requester
         self.LOG_PREFIX = f'Detection Signal Handler [{self.cfg.index}]: '
         self.render_queue = render_queue
@@ -708,33 +1032,51 @@ class DetectionSignalHandler(FrameArrivalHandler):
         """
         current_idx = msg.current_index
         current_time = generate_time_stamp('%m%d%H%M%S') + '_'
-        # use two independent threads to execute video generation sub-tasks
-        handle_thread = threading.Thread(
-            target=self.handle,
-            args=(msg, current_time,), daemon=True)
-        handle_thread.start()
-        return True
+        window = (current_idx, current_idx + self.cfg.search_window_size)
+        # counted here, handlers run on worker threads concurrently
+        accepted = self.submit(self.handle, window, msg, current_time, self.task_cnt)
+        self.task_cnt += 1
+        return accepted
 
-    def handle(self, msg: ArrivalMessage, current_time):
+    def merge_task(self, waiting_args, new_args):
+        """
+        rects are tracked from the frame they were detected on, signals of the same frame are merged only
+        """
+        waiting, new = waiting_args[0], new_args[0]
+        if waiting.current_index != new.current_index:
+            return None
+        if new.rects is not None:
+            waiting.rects = new.rects if waiting.rects is None else list(waiting.rects) + list(new.rects)
+        return waiting_args
+
+    def handle(self, msg: ArrivalMessage, current_time, task_cnt=None):
         """
         handle detection signal
         :param msg:
         :param current_time:
+        :param task_cnt: counting of signal, current counting if None
         :return:
         """
+        task_cnt = self.task_cnt if task_cnt is None else task_cnt
         current_index = msg.current_index
         if not self.cfg.forward_filter:
             logger.info(self.LOG_PREFIX + f'The signal forward operation is disabled by configuration.')
-        self.wait(self.task_cnt, 'Detection Signal Handle', msg)
+        self.wait(task_cnt, 'Detection Signal Handle', msg)
         # rects = self.render_rect_cache[current_index % self.cache_size]
         # lock the whole window in case cached was covered by the future arrival frames.
         # self.original_frame_cache.lock_cache(current_index - self.cfg.future_frames,
         #                                      current_index + self.cfg.search_window_size)
         rects = msg.rects
-        task_cnt = self.task_cnt
         if rects is not None:
+            kept = self.post_filter.float_history.reject(rects)
+            if len(kept) < len(rects):
+                logger.info(f'{self.LOG_PREFIX}: Rejected [{len(rects) - len(kept)}] rects of known floats.')
+            if not len(kept):
+                return
+            rects = kept
             track_start = time.time()
-            result_sets, _ = self.track_requester.request(self.cfg.index, current_index, rects)
+            result_sets, _ = self.track_requester.request(self.cfg.index, current_index, rects,
+                                                             timeout=self.scfg.track_timeout)
             # is_filter = self.post_filter.filter_by_speed_and_continuous_time(result_sets, task_cnt)
             self.detect_num += 1
             is_contain_dolphin, traces = self.post_filter.filter_by_obj_match_analyze(result_sets, task_cnt)
@@ -743,7 +1085,6 @@ class DetectionSignalHandler(FrameArrivalHandler):
             logger.info(f'{self.LOG_PREFIX}: Filter result: contain dolphin: {is_contain_dolphin}')
             if is_contain_dolphin:
                 self.trigger_rendering(current_index, traces, track_consume)
-                self.task_cnt += 1
                 self.post_num += 1
 
     def trigger_rendering(self, current_index, traces, time_consume):
@@ -788,41 +1129,76 @@ class Filter(object):
     filter post rendering video from a video, or forward detection signal from a bbox set.
     """
 
-    def __init__(self, cfg: VideoConfig, region_path, detect_params=None):
+    def __init__(self, cfg: VideoConfig, region_path, detect_params=None, float_history: FloatTraceIndex = None):
         self.cfg = cfg
         self.region_path = region_path
         self.block_path = region_path / 'blocks'
-        # self.detect_params = self.set_detect_params()
-        self.detect_params = detect_params
+        self.geometry = detect_params[0].geometry if detect_params else FrameGeometry(cfg)
+        self.detect_params = detect_params if detect_params else self.set_detect_params()
         self.speed_thresh_x = self.cfg.alg['speed_x_thresh']
         self.speed_thresh_y = self.cfg.alg['speed_y_thresh']
         self.continuous_time_thresh = self.cfg.alg['continuous_time_thresh']
         self.disappear_frames_thresh = self.cfg.alg['disappear_frames_thresh']
-        self.float_trace_list = []
+        # float traces shared by post filters of the camera, an in-memory one if not given
+        self.float_history = float_history if float_history is not None else FloatTraceIndex(cfg)
+        # post filter profile, frames are analysed at a lower resolution and only every stride frames
+        self.stride = max(int(cfg.post_filter_stride), 1)
+        if cfg.post_filter_scale != 1:
+            profile_cfg = self.profile_cfg(cfg, self.geometry, cfg.post_filter_scale)
+            self.analysis_geometry = FrameGeometry(profile_cfg, self.geometry.shape)
+            self.analysis_params = self.set_detect_params(profile_cfg, self.analysis_geometry)
+        else:
+            self.analysis_geometry = self.geometry
+            self.analysis_params = self.detect_params
 
-    def set_detect_params(self):
-        x_num = self.cfg.routine['col']
-        y_num = self.cfg.routine['row']
-        empty = np.zeros(self.cfg.shape).astype(np.uint8)
-        frame, _ = preprocess(empty, self.cfg)
-        x_step = int(frame.shape[1] / x_num)
-        y_step = int(frame.shape[0] / y_num)
+    @staticmethod
+    def profile_cfg(cfg: VideoConfig, geometry: FrameGeometry, scale):
+        """
+        configuration of post filter analysis, the preprocessed frame is resized by scale again,
+        and sizes of thresh rules in pixels are scaled with it, sizes in original frame are kept
+        :return: a copy of cfg
+        """
+        profile = copy.copy(cfg)
+        profile.resize = {'width': max(int(round(geometry.pre_w * scale)), cfg.routine['col']), 'height': -1,
+                          'scale': -1}
+        alg = dict(cfg.alg)
+        alg['sp'] = max(int(round(alg['sp'] * scale)), 1)
+        # adaptive thresh requires an odd block size greater than 1
+        alg['block_size'] = max(int(round(alg['block_size'] * scale)), 3) | 1
+        for key in ['ok_size', 'dk_size']:
+            if alg[key] != -1:
+                alg[key] = max(int(round(alg[key] * scale)), 1)
+        alg['area'] = alg['area'] * scale * scale
+        profile.alg = alg
+        return profile
+
+    def set_detect_params(self, cfg: VideoConfig = None, geometry: FrameGeometry = None):
+        cfg = cfg if cfg is not None else self.cfg
+        geometry = geometry if geometry is not None else self.geometry
+        x_num = cfg.routine['col']
+        y_num = cfg.routine['row']
+        x_step = geometry.x_step
+        y_step = geometry.y_step
 
         detect_params = []
         for i in range(x_num):
             for j in range(y_num):
                 region_detector_path = self.block_path / (str(i) + '-' + str(j))
                 detect_params.append(
-                    DetectorParams(x_step, y_step, i, j, self.cfg, region_detector_path))
+                    DetectorParams(x_step, y_step, i, j, cfg, region_detector_path, geometry))
         return detect_params
 
     def detect_frame(self, frame, idx, video_path=None):
+        """
+        detect candidates of a frame by the post filter profile
+        :return: rects in original frame, results of blocks
+        """
         # frame = cv2.GaussianBlur(frame, ksize=(3, 3), sigmaX=0)
         rects = []
         sub_results = []
-        frame, original_frame = preprocess(frame, self.cfg)
-        for d in self.detect_params:
-            block = DispatchBlock(crop_by_se(frame, d.start, d.end),
+        frame, original_frame = self.analysis_geometry.preprocess(frame)
+        for d in self.analysis_params:
+            block = DispatchBlock(self.analysis_geometry.block(frame, d),
                                   idx, original_frame.shape)
             # TODO we have to use a more robust frontground extraction algorithm get the binary map
             #  adaptive thresh to get binay map is just a compromise,
@@ -839,44 +1215,45 @@ class Filter(object):
                 rects.append(rect)
         return rects, sub_results
 
-    def detect_video(self, video_path):
+    def detect_frames(self, frames):
         """
-        iterates the whole shot-time video and executes analysis algorithm for timing information
-        :param video_path:
-        :return:
+        executes analysis algorithm on frames of a shot-time clip for timing information
+        :param frames: iterable of (idx, BGR frame), idx is the position of frame in clip
+        :return: result set, [(idx, rects), ...] of frames with candidates
         """
         result_set = []
-        video_capture = cv2.VideoCapture(video_path)
-        ret, frame = video_capture.read()
-        init = False
-        idx = 0
-        video_writer = None
-        while ret:
+        for idx, frame in frames:
+            # positions are kept, so speeds and durations are still measured in frames of clip
+            if idx % self.stride:
+                continue
             temp = []
-            rects, sub_results = self.detect_frame(frame, idx, video_path)
-            sub_results = sub_results[0]
-            if not init:
-                dirname = os.path.dirname(video_path)
-                filename, extention = os.path.splitext(os.path.basename(video_path))
-                # fourcc = cv2.VideoWriter_fourcc(*'MP4V')
-                # out_path = os.path.join(dirname, f'{filename}_binary.mp4')
-                # shape = sub_results.binary.shape
-                # video_writer = cv2.VideoWriter(out_path, fourcc, 25, (shape[1], shape[0]))
-                init = True
-            if video_writer is not None:
-                video_writer.write(cv2.cvtColor(sub_results.binary, cv2.COLOR_GRAY2BGR))
+            rects, sub_results = self.detect_frame(frame, idx)
             for rect in rects:
                 if rect[2] - rect[0] > 15 and rect[3] - rect[1] > 15 and 100 < rect[1] < 900:
                     temp.append(rect)
             if len(temp) > 0:
                 result_set.append((idx, temp))
             # logger.info(f'idx={idx}, temp={temp}, len_rects={len(rects)}')
+        return result_set
+
+    @staticmethod
+    def read_video(video_path):
+        video_capture = cv2.VideoCapture(video_path)
+        ret, frame = video_capture.read()
+        idx = 0
+        while ret:
+            yield idx, frame
             ret, frame = video_capture.read()
             idx += 1
-        if video_writer is not None:
-            video_writer.release()
         video_capture.release()
-        return result_set
+
+    def detect_video(self, video_path):
+        """
+        iterates the whole shot-time video and executes analysis algorithm for timing information
+        :param video_path:
+        :return:
+        """
+        return self.detect_frames(self.read_video(video_path))
 
     @staticmethod
     def get_median(data):
@@ -897,19 +1274,31 @@ class Filter(object):
         input a video to filter object
         :param video_path: the path of the generated video to be filtered
         :param task_cnt:
-        :return: False: no fast-object;
-                 True: exists fast-object or float
+        :return: (False: no fast-object; True: exists fast-object or float, traces)
         """
         logger.info(f'Post filter [{self.cfg.index}, {task_cnt}]: started...')
         if not os.path.exists(video_path):
             logger.info(f'Post filter [{self.cfg.index}, {task_cnt}]: {video_path} is not exists...')
-            return False
+            return False, []
         result_set = self.detect_video(video_path)
         if len(result_set) <= 1:
-            return False
+            return False, []
         # return self.filter_by_speed_and_continuous_time(result_set, task_cnt, video_path)
         return self.filter_by_obj_match_analyze(result_set, task_cnt, video_path)
 
+    def post_filter_frames(self, frames, task_cnt):
+        """
+        filter object from frames of a clip, the same as post_filter_video() without encoding and decoding the clip
+        :param frames: iterable of (idx, BGR frame)
+        :param task_cnt:
+        :return: (True if exists fast-object or float, traces)
+        """
+        logger.info(f'Post filter [{self.cfg.index}, {task_cnt}]: started...')
+        result_set = self.detect_frames(frames)
+        if len(result_set) <= 1:
+            return False, []
+        return self.filter_by_obj_match_analyze(result_set, task_cnt)
+
     def filter_by_speed_and_continuous_time(self, result_set, task_cnt, video_path=None):
         """
         filter thing notified by detection signal, if it's(their) speeds or continuous time
@@ -981,8 +1370,9 @@ class Filter(object):
         traces = {}
         i = 0
         new_float_trace = []
+        float_trace_list = self.float_history.live_traces()
         for obj in obj_list:
-            obj.predict_category(self.float_trace_list)
+            obj.predict_category(self.history_floats(float_trace_list, obj.trace))
             if obj.category == 'float':
                 new_float_trace.append(obj.trace)
             logger.info(
@@ -995,57 +1385,52 @@ class Filter(object):
                         traces[frame_idx] = [rect]
                     else:
                         traces[frame_idx].append(rect)
-        self.float_trace_list = new_float_trace.copy()
+        self.float_history.add(new_float_trace)
         return flag, traces
 
-    @staticmethod
-    def cal_dst(rect1, rect2):
-        rect1_center_x = (rect1[0] + rect1[2]) / 2.0
-        rect1_center_y = (rect1[1] + rect1[3]) / 2.0
-        rect2_center_x = (rect2[0] + rect2[2]) / 2.0
-        rect2_center_y = (rect2[1] + rect2[3]) / 2.0
-        return math.sqrt(
-            math.pow(rect1_center_x - rect2_center_x, 2) + math.pow(rect1_center_y - rect2_center_y, 2))
-
-    def find_nearest_rect(self, obj_last_rect, rects):
-        min_pos = 0
-        min_dst = self.cal_dst(obj_last_rect, rects[0])
-        for i in range(1, len(rects)):
-            dst = self.cal_dst(obj_last_rect, rects[i])
-            if dst < min_dst:
-                min_pos = i
-                min_dst = dst
-        return min_pos
+    def history_floats(self, float_trace_list, trace):
+        """
+        float traces that could make a near-horizontal line with trace
+        """
+        if not len(float_trace_list):
+            return float_trace_list
+        band = math.tan(math.radians(self.cfg.alg['angle_thresh'])) * self.cfg.shape[1]
+        return FloatTraceIndex.near(float_trace_list, trace, band)
 
     def get_obj_list_from_result_set(self, result_set):
+        """
+        associates rects of frames into object traces. In each frame, the objects still tracked are matched to rects
+        one-to-one by the minimum sum of center distances, a pair is kept if the object moves no more than
+        Obj.MAX_STEP_DST pixels per frame, the rects left start new objects.
+        :param result_set: [(frame_idx, [rect, ...]), ...] in order of frame index
+        :return: list of Obj
+        """
         obj_list = []
-        if len(result_set) == 0:
-            return obj_list
-        elif len(result_set) == 1:
-            idx, rects = result_set[0]
-            for rect in rects:
-                obj = Obj(len(obj_list), self.cfg)
-                obj.append_with_rules(idx, rect)
-                obj_list.append(obj)
-            return obj_list
-        else:
-            idx, rects = result_set[0]
-            for rect in rects:
+        for idx, rects in result_set:
+            if not len(rects):
+                continue
+            assigned = np.zeros(len(rects), dtype=bool)
+            active = []
+            for obj in obj_list:
+                if not obj.status:
+                    continue
+                if abs(obj.get_last_rect()[0] - idx) > self.disappear_frames_thresh:
+                    # 超过消失帧数阈值，停止追踪此物体
+                    obj.status = False
+                    continue
+                active.append(obj)
+            if len(active):
+                last_centers = Obj.centers([obj.get_last_rect()[1] for obj in active])
+                idx_gaps = np.abs([obj.get_last_rect()[0] - idx for obj in active]).astype(np.float64)
+                dst = np.linalg.norm(last_centers[:, None, :] - Obj.centers(rects)[None, :, :], axis=2)
+                gated = dst / idx_gaps[:, None] > Obj.MAX_STEP_DST
+                # gated pairs are left to the assignment with a cost no kept pairs can add up to
+                cost = np.where(gated, dst.sum() + 1, dst)
+                for i, j in zip(*linear_sum_assignment(cost)):
+                    if not gated[i, j] and active[i].append_with_rules(idx, rects[j]):
+                        assigned[j] = True
+            for j in np.flatnonzero(~assigned):
                 obj = Obj(len(obj_list), self.cfg)
-                obj.append_with_rules(idx, rect)
+                obj.append_with_rules(idx, rects[j])
                 obj_list.append(obj)
-            for i in range(1, len(result_set)):
-                idx, rects = result_set[i]
-                flag_list = [False] * len(rects)
-                for obj in obj_list:
-                    idx_obj, rect_obj = obj.get_last_rect()
-                    min_pos = self.find_nearest_rect(rect_obj, rects)
-                    if obj.append_with_rules(idx, rects[min_pos]):
-                        flag_list[min_pos] = True
-                for j in range(len(flag_list)):
-                    if not flag_list[j]:
-                        rect = rects[j]
-                        obj = Obj(len(obj_list), self.cfg)
-                        obj.append_with_rules(idx, rect)
-                        obj_list.append(obj)
-            return obj_list
+        return obj_list
@@ -11,7 +11,6 @@ import sys
 # sys.path.append(rootPath)
 import torch.nn as nn
 import torch
-from torch.autograd import Variable
 from .data import BaseTransform, VOC_CLASSES as labelmap
 from .ssd import build_ssd
 import numpy as np
@@ -19,6 +18,7 @@ import time
 import cv2
 # from .logger import make_logger
 from utils import logger as Logger
+from utils.runtime import ModelRuntime
 
 from pathlib import Path
 
@@ -31,8 +31,9 @@ class SSDDetector(nn.Module):
     '''
 
     def __init__(self, size=300, conf=0.5, logger=Logger, model_path=None,
-                 device_id='3'):
+                 device_id='3', runtime: ModelRuntime = None):
         super(SSDDetector, self).__init__()
+        self.runtime = runtime if runtime is not None else ModelRuntime()
 
         # net size
         self.size = size
@@ -44,7 +45,6 @@ class SSDDetector(nn.Module):
             # if self.device_id is not None:
             # self.device = torch.device("cuda:" + str(self.device_id))
             self.device = torch.device("cuda")
-            torch.set_default_tensor_type('torch.cuda.FloatTensor')
         # self.net = torch.load(str(self.model_path))
         else:
             self.device = torch.device("cpu")
@@ -70,17 +70,18 @@ class SSDDetector(nn.Module):
         height, width = x[0].shape[:2]
         if len(x) == 1:
             x = torch.from_numpy(self.transform(x[0])[0]).permute(2, 0, 1)
-            x = Variable(x.unsqueeze(0)).cuda()
+            x = self.runtime.input(x.unsqueeze(0), self.device)
         else:
             frames_set = list()
             for frame in x:
                 frames_set.append(torch.from_numpy(self.transform(frame)[0]).permute(2, 0, 1))
 
             x = torch.stack(frames_set, 0)  # group a batch
-            x = Variable(x).cuda()
+            x = self.runtime.input(x, self.device)
 
         # t0 = time.time()
-        y = self.net(x)  # forward pass output = torch.zeros(num, self.num_classes, self.top_k, 5)
+        with self.runtime.inference():
+            y = self.net(x)  # forward pass output = torch.zeros(num, self.num_classes, self.top_k, 5)
         # t1 = time.time()
 
         # self.logger.info('classify_model detect timer: %.4f sec.' % (t1 - t0))
@@ -148,21 +149,27 @@ class SSDDetector(nn.Module):
                         cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 255), 2, cv2.LINE_AA)
         return frame
 
-    def run(self):
+    def run(self, checkpoint=None):
+        '''
+        :param checkpoint: SharedCheckpoint loaded by monitor, weights are read from model_path if None
+        '''
         # if self.device_id is not None:
         #     os.environ['CUDA_VISIBLE_DEVICES'] = self.device_id
 
-        if self.model_path is not None:
-            if not self.model_path.exists():
-                raise Exception(f'Model init failed: classify_model not exist at [{str(self.model_path)}].')
-        if torch.cuda.is_available():
-            self.net.load_state_dict(torch.load(str(self.model_path)))
+        if checkpoint is not None:
+            checkpoint.bind(self.net)
         else:
-            self.net.load_state_dict(torch.load(str(self.model_path), map_location=torch.device('cpu')))
-        self.net = self.net.to(self.device)
-        self.net.eval()
+            if self.model_path is not None:
+                if not self.model_path.exists():
+                    raise Exception(f'Model init failed: classify_model not exist at [{str(self.model_path)}].')
+            if torch.cuda.is_available():
+                self.net.load_state_dict(torch.load(str(self.model_path)))
+            else:
+                self.net.load_state_dict(torch.load(str(self.model_path), map_location=torch.device('cpu')))
+        self.net = self.runtime.prepare(self.net, self.device)
         print(self.net)
         print(self.device)
+        self.runtime.warm_up(self.forward, [np.zeros((self.size, self.size, 3), dtype=np.uint8)])
 
 
 def init_ssd(model_path, device_id):
@@ -42,7 +42,7 @@ class Detect(Function):
         # Decode predictions into bboxes.
         for i in range(num):
 
-            decoded_boxes = decode(loc_data[i], prior_data, self.variance)
+            decoded_boxes = decode(loc_data[i], prior_data, self.variance.to(loc_data))
             # For each class, perform nms
             conf_scores = conf_preds[i].clone()
 
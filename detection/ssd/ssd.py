@@ -1,7 +1,6 @@
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-from torch.autograd import Variable
 from .layers import *
 from .data import ZH
 import os
@@ -32,8 +31,9 @@ class SSD(nn.Module):
         self.num_classes = num_classes
         self.cfg = ZH
         self.priorbox = PriorBox(self.cfg)
+        # a buffer follows the network in .to(device), it is computed from cfg so checkpoints don't carry it
         with torch.no_grad():
-            self.priors = Variable(self.priorbox.forward())
+            self.register_buffer('priors', self.priorbox.forward(), persistent=False)
         self.size = size
 
         # SSD network
@@ -106,7 +106,7 @@ class SSD(nn.Module):
                 loc.view(loc.size(0), -1, 4),  # loc preds
                 self.softmax(conf.view(conf.size(0), -1,
                                        self.num_classes)),  # conf preds
-                self.priors.type(type(x.data))  # default boxes
+                self.priors.to(loc)  # default boxes
             )
         else:
 
@@ -36,8 +36,37 @@ class BaseTracker(object):
 
 
 class SiameseTracker(BaseTracker):
+    def _context_range(self, pos, original_sz):
+        """
+        context window [xmin, xmax] x [ymin, ymax] (inclusive) of original_sz centered at pos
+        """
+        c = (original_sz + 1) / 2
+        # context_xmin = round(pos[0] - c) # py2 and py3 round
+        context_xmin = int(np.floor(pos[0] - c + 0.5))
+        context_xmax = context_xmin + int(original_sz) - 1
+        # context_ymin = round(pos[1] - c)
+        context_ymin = int(np.floor(pos[1] - c + 0.5))
+        context_ymax = context_ymin + int(original_sz) - 1
+        return context_xmin, context_xmax, context_ymin, context_ymax
+
+    def context_average(self, im, pos, original_sz):
+        """
+        channel average of the in-bounds part of context window, used to fill the out-of-bounds part of patches
+        args:
+            im: bgr based image
+            pos: center position
+            original_sz: context size
+        """
+        xmin, xmax, ymin, ymax = self._context_range(pos, original_sz)
+        region = im[max(0, ymin):max(0, ymax + 1), max(0, xmin):max(0, xmax + 1)]
+        if not region.size:
+            return np.mean(im, axis=(0, 1))
+        return np.mean(region, axis=(0, 1))
+
     def get_subwindow(self, im, pos, model_sz, original_sz, avg_chans, device):
         """
+        crop-then-pad: only the in-bounds part of context window is copied into a patch sized buffer,
+        the rest of buffer is filled with avg_chans. Buffers are reused across calls.
         args:
             im: bgr based image
             pos: center position
@@ -47,43 +76,27 @@ class SiameseTracker(BaseTracker):
         """
         if isinstance(pos, float):
             pos = [pos, pos]
-        sz = original_sz
+        sz = int(original_sz)
         im_sz = im.shape
-        c = (original_sz + 1) / 2
-        # context_xmin = round(pos[0] - c) # py2 and py3 round
-        context_xmin = np.floor(pos[0] - c + 0.5)
-        context_xmax = context_xmin + sz - 1
-        # context_ymin = round(pos[1] - c)
-        context_ymin = np.floor(pos[1] - c + 0.5)
-        context_ymax = context_ymin + sz - 1
+        context_xmin, context_xmax, context_ymin, context_ymax = self._context_range(pos, original_sz)
         left_pad = int(max(0., -context_xmin))
         top_pad = int(max(0., -context_ymin))
         right_pad = int(max(0., context_xmax - im_sz[1] + 1))
         bottom_pad = int(max(0., context_ymax - im_sz[0] + 1))
 
-        context_xmin = context_xmin + left_pad
-        context_xmax = context_xmax + left_pad
-        context_ymin = context_ymin + top_pad
-        context_ymax = context_ymax + top_pad
-
         r, c, k = im.shape
         if any([top_pad, bottom_pad, left_pad, right_pad]):
-            size = (r + top_pad + bottom_pad, c + left_pad + right_pad, k)
-            te_im = np.zeros(size, np.uint8)
-            te_im[top_pad:top_pad + r, left_pad:left_pad + c, :] = im
-            if top_pad:
-                te_im[0:top_pad, left_pad:left_pad + c, :] = avg_chans
-            if bottom_pad:
-                te_im[r + top_pad:, left_pad:left_pad + c, :] = avg_chans
-            if left_pad:
-                te_im[:, 0:left_pad, :] = avg_chans
-            if right_pad:
-                te_im[:, c + left_pad:, :] = avg_chans
-            im_patch = te_im[int(context_ymin):int(context_ymax + 1),
-                       int(context_xmin):int(context_xmax + 1), :]
+            im_patch = self._patch_buffer(sz, k)
+            im_patch[:] = avg_chans
+            # in-bounds sub-rectangle of context window in image and in patch coordinates
+            x1, x2 = max(0, context_xmin), min(c, context_xmax + 1)
+            y1, y2 = max(0, context_ymin), min(r, context_ymax + 1)
+            if x1 < x2 and y1 < y2:
+                im_patch[y1 - context_ymin:y2 - context_ymin, x1 - context_xmin:x2 - context_xmin, :] = \
+                    im[y1:y2, x1:x2, :]
         else:
-            im_patch = im[int(context_ymin):int(context_ymax + 1),
-                       int(context_xmin):int(context_xmax + 1), :]
+            im_patch = im[context_ymin:context_ymax + 1,
+                       context_xmin:context_xmax + 1, :]
 
         if not np.array_equal(model_sz, original_sz):
             im_patch = cv2.resize(im_patch, (model_sz, model_sz))
@@ -94,3 +107,16 @@ class SiameseTracker(BaseTracker):
         if cfg.CUDA:
             im_patch = im_patch.to(device)
         return im_patch
+
+    def _patch_buffer(self, sz, k):
+        """
+        reusable patch sized buffer, the content is consumed before next call since patches are converted to tensors
+        """
+        buffers = self.__dict__.setdefault('_patch_buffers', {})
+        key = (sz, k)
+        if key not in buffers:
+            if len(buffers) > 8:
+                # context size changes with target size, keep the recent ones only
+                buffers.clear()
+            buffers[key] = np.empty((sz, sz, k), np.uint8)
+        return buffers[key]
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: cv_tracker.py
+@time: 10/19/26 7:20 PM
+@version 1.0
+@desc: lightweight CPU tracker backends, they need no model and share the interface of SiamRPNTracker
+"""
+import cv2
+import numpy as np
+
+from pysot.tracker.base_tracker import BaseTracker
+
+
+class CvTracker(BaseTracker):
+    """
+    Base class of CPU trackers. track() returns {'bbox': [x1, y1, x2, y2], 'best_score': score} as SiamRPNTracker,
+    multiple targets are tracked by independent instances.
+    """
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__()
+        self.kwargs = kwargs
+        self.targets = []
+
+    def init_multi(self, img, bboxes):
+        self.targets = []
+        for bbox in bboxes:
+            target = self.__class__(**self.kwargs)
+            target.init(img, bbox)
+            self.targets.append(target)
+
+    def track_multi(self, img, targets=None):
+        if targets is None:
+            targets = range(len(self.targets))
+        return [self.targets[t].track(img) for t in targets]
+
+
+class OpticalFlowTracker(CvTracker):
+    """
+    Track box keypoints by pyramidal Lucas-Kanade optical flow inside a local region around the box.
+    Box moves by the median flow of points passing forward-backward check,
+    score is the ratio of those points.
+    """
+
+    def __init__(self, max_corners=50, fb_thresh=1.0, win_size=15, max_level=3, margin=0.5) -> None:
+        super().__init__(max_corners=max_corners, fb_thresh=fb_thresh, win_size=win_size, max_level=max_level,
+                         margin=margin)
+        self.max_corners = max_corners
+        self.fb_thresh = fb_thresh
+        self.lk_params = dict(winSize=(win_size, win_size), maxLevel=max_level,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        self.margin = margin
+        self.prev = None
+        self.box = None
+
+    def init(self, img, bbox):
+        """
+        args:
+            img(np.ndarray): BGR image
+            bbox: (x, y, w, h) bbox
+        """
+        self.prev = img
+        self.box = np.array([bbox[0], bbox[1], bbox[0] + bbox[2], bbox[1] + bbox[3]], dtype=np.float64)
+
+    def _region(self, shape):
+        w, h = self.box[2] - self.box[0], self.box[3] - self.box[1]
+        mx, my = w * self.margin + self.lk_params['winSize'][0], h * self.margin + self.lk_params['winSize'][1]
+        x1, y1 = int(max(0, self.box[0] - mx)), int(max(0, self.box[1] - my))
+        x2, y2 = int(min(shape[1], self.box[2] + mx)), int(min(shape[0], self.box[3] + my))
+        return x1, y1, x2, y2
+
+    def _keypoints(self, gray, box):
+        mask = np.zeros_like(gray)
+        mask[box[1]:box[3], box[0]:box[2]] = 255
+        points = cv2.goodFeaturesToTrack(gray, self.max_corners, 0.01, 3, mask=mask)
+        if points is None or len(points) < 4:
+            # flat texture, fall back to a grid of points inside box
+            xs = np.linspace(box[0], max(box[0], box[2] - 1), 5)
+            ys = np.linspace(box[1], max(box[1], box[3] - 1), 5)
+            points = np.array(np.meshgrid(xs, ys)).T.reshape(-1, 1, 2)
+        return points.astype(np.float32)
+
+    def track(self, img):
+        x1, y1, x2, y2 = self._region(img.shape)
+        lost = {'bbox': self.box.tolist(), 'best_score': 0.}
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            return lost
+        # only the local region is converted, never the whole frame
+        g0 = cv2.cvtColor(np.ascontiguousarray(self.prev[y1:y2, x1:x2]), cv2.COLOR_BGR2GRAY)
+        g1 = cv2.cvtColor(np.ascontiguousarray(img[y1:y2, x1:x2]), cv2.COLOR_BGR2GRAY)
+        self.prev = img
+        local = np.round(self.box - [x1, y1, x1, y1]).astype(np.int64)
+        local = np.clip(local, 0, [g0.shape[1], g0.shape[0], g0.shape[1], g0.shape[0]])
+        p0 = self._keypoints(g0, local)
+        p1, st1, _ = cv2.calcOpticalFlowPyrLK(g0, g1, p0, None, **self.lk_params)
+        if p1 is None:
+            return lost
+        p0r, st2, _ = cv2.calcOpticalFlowPyrLK(g1, g0, p1, None, **self.lk_params)
+        fb = np.linalg.norm((p0 - p0r).reshape(-1, 2), axis=1)
+        good = (st1.ravel() == 1) & (st2.ravel() == 1) & (fb < self.fb_thresh)
+        score = float(good.mean()) if len(good) else 0.
+        if good.sum() < 3:
+            return {'bbox': self.box.tolist(), 'best_score': score}
+        flow = (p1 - p0).reshape(-1, 2)[good]
+        dx, dy = np.median(flow, axis=0)
+        # scale change by the median ratio of pairwise point distances
+        a0, a1 = p0.reshape(-1, 2)[good], p1.reshape(-1, 2)[good]
+        d0 = np.linalg.norm(a0[:, None] - a0[None], axis=2)
+        d1 = np.linalg.norm(a1[:, None] - a1[None], axis=2)
+        valid = d0 > 1
+        scale = float(np.median(d1[valid] / d0[valid])) if valid.any() else 1.
+        cx, cy = (self.box[0] + self.box[2]) / 2 + dx, (self.box[1] + self.box[3]) / 2 + dy
+        w, h = (self.box[2] - self.box[0]) * scale, (self.box[3] - self.box[1]) * scale
+        self.box = np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+        return {'bbox': self.box.tolist(), 'best_score': score}
+
+
+def opencv_tracker_factory(name):
+    """
+    find creator of OpenCV tracker, it is moved into cv2.legacy since OpenCV 4.5
+    :param name: KCF, CSRT...
+    :return: creator function
+    """
+    creator = getattr(cv2, f'Tracker{name}_create', None)
+    if creator is None and hasattr(cv2, 'legacy'):
+        creator = getattr(cv2.legacy, f'Tracker{name}_create', None)
+    if creator is None:
+        raise Exception(f'OpenCV tracker [{name}] is not available, opencv-contrib-python is required.')
+    return creator
+
+
+class OpenCVTracker(CvTracker):
+    """
+    OpenCV KCF/CSRT tracker wrapper, score is 1 if the tracker reports success otherwise 0
+    """
+
+    def __init__(self, name='KCF') -> None:
+        super().__init__(name=name)
+        self.creator = opencv_tracker_factory(name)
+        self.tracker = None
+        self.box = None
+
+    def init(self, img, bbox):
+        self.tracker = self.creator()
+        self.box = [bbox[0], bbox[1], bbox[0] + bbox[2], bbox[1] + bbox[3]]
+        self.tracker.init(img, tuple(int(v) for v in bbox))
+
+    def track(self, img):
+        ok, bbox = self.tracker.update(img)
+        if ok:
+            self.box = [bbox[0], bbox[1], bbox[0] + bbox[2], bbox[1] + bbox[3]]
+        return {'bbox': list(self.box), 'best_score': 1. if ok else 0.}
+
+
+CV_TRACKERS = {
+    'flow': lambda: OpticalFlowTracker(),
+    'kcf': lambda: OpenCVTracker('KCF'),
+    'csrt': lambda: OpenCVTracker('CSRT'),
+}
+
+
+def build_cv_tracker(backend):
+    if backend not in CV_TRACKERS:
+        raise Exception(f'Unknown tracker backend [{backend}].')
+    return CV_TRACKERS[backend]()
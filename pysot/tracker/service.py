@@ -16,21 +16,28 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import os
+import threading
 import time
 import cv2
 import traceback
-from queue import Empty
+from concurrent.futures import Future, wait
+from collections import deque
+from queue import Empty, Full
 from multiprocessing import Value
 
 from pysot.core.config import cfg
 from pysot.models.model_builder import ModelBuilder
 from pysot.tracker.tracker_builder import build_tracker
-from multiprocessing import Pool, Manager, Queue, Process, Lock
-from utils.cache import SharedMemoryFrameCache
-from stream.rtsp import FFMPEG_MP4Writer
+from pysot.tracker.cv_tracker import build_cv_tracker, CV_TRACKERS
+from multiprocessing import Pool, Manager, Queue, Process, Lock, Semaphore
+from pysot.tracker.transport import CancelledRequests, IdAllocator, SharedRecordRing, request_dtype, result_dtype
+from utils.cache import SharedMemoryFrameCache, TemplateCache
+from utils.runtime import ModelRuntime, SharedCheckpoint
+from stream.rtsp import FFMPEG_MP4Writer, FFMPEGWriterPool
 from typing import List
+import numpy as np
 import torch
-from utils import logger, to_bbox_wh
+from utils import logger, to_bbox_wh, FrameGeometry
 from config import SystemStatus, VideoConfig
 import cv2
 
@@ -40,12 +47,51 @@ class TrackRequest(object):
     Post a tracking request
     """
 
-    def __init__(self, request_id, monitor_index, frame_index, rect, rect_id) -> None:
+    def __init__(self, request_id, monitor_index, frame_index, rect, rect_id, rects=None, rect_ids=None) -> None:
+        """
+        :param rects: all rects of a multi-target request, rect and rect_id are ignored if it is set
+        :param rect_ids: ids of rects, positions in rects by default
+        """
         self.monitor_index = monitor_index
         self.frame_index = frame_index
         self.rect = rect
         self.rect_id = rect_id
         self.request_id = request_id
+        self.rects = rects
+        self.rect_ids = rect_ids
+        self.post_time = time.time()
+        # [(request_id, positions in rects, rect_ids)] of requests coalesced into this one
+        self.parts = None
+
+    def to_record(self, record):
+        """
+        write request into a transport record
+        """
+        multi = self.rects is not None
+        rects = self.rects if multi else [self.rect]
+        rect_ids = (self.rect_ids if self.rect_ids is not None else range(len(rects))) if multi else [self.rect_id]
+        record['request_id'] = self.request_id
+        record['monitor_index'] = self.monitor_index
+        record['frame_index'] = self.frame_index
+        record['multi'] = multi
+        record['num'] = len(rects)
+        record['rect_ids'][:len(rects)] = list(rect_ids)
+        record['rects'][:len(rects)] = rects
+        record['post_time'] = self.post_time
+
+    @staticmethod
+    def from_record(record):
+        num = int(record['num'])
+        rects = record['rects'][:num].tolist()
+        rect_ids = record['rect_ids'][:num].tolist()
+        if record['multi']:
+            req = TrackRequest(int(record['request_id']), int(record['monitor_index']), int(record['frame_index']),
+                               None, None, rects=rects, rect_ids=rect_ids)
+        else:
+            req = TrackRequest(int(record['request_id']), int(record['monitor_index']), int(record['frame_index']),
+                               rects[0], rect_ids[0])
+        req.post_time = float(record['post_time'])
+        return req
 
 
 class TrackResult(object):
@@ -53,21 +99,464 @@ class TrackResult(object):
     Tracking result
     """
 
-    def __init__(self, rect_id, result) -> None:
+    def __init__(self, rect_id, result, scores=None) -> None:
         """
 
         :param rect_id: bbox id
         :param result: list object [[x1,y1,x2,y2],[x2,y2,x3,y3]],
         indicates tracking bbox of each frame
+        :param scores: tracker score of each row of result, nan for the template and interpolated rows,
+        all nan if None
         """
         self.rect_id = rect_id
         self.result = result
+        self.scores = scores if scores is not None else [np.nan] * len(result)
+
+
+def pack_results(record, request_id, results: List[TrackResult]):
+    """
+    write tracking results of a request into a transport record, rows are (frame_idx, x1, y1, x2, y2, score)
+    """
+    window_size = record['tracks'].shape[1]
+    record['request_id'] = request_id
+    record['num'] = len(results)
+    for t, r in enumerate(results):
+        rows = r.result[:window_size]
+        if len(rows) < len(r.result):
+            logger.warning(f'Track result of request [{request_id}] is truncated to [{window_size}] frames.')
+        record['rect_ids'][t] = r.rect_id
+        record['lengths'][t] = len(rows)
+        if len(rows):
+            record['tracks'][t, :len(rows), 0] = [i for i, _ in rows]
+            record['tracks'][t, :len(rows), 1:5] = [bbox for _, bbox in rows]
+            record['tracks'][t, :len(rows), 5] = r.scores[:len(rows)]
+
+
+def unpack_results(record):
+    """
+    :return: request id, [TrackResult]
+    """
+    results = []
+    for t in range(int(record['num'])):
+        rows = record['tracks'][t, :record['lengths'][t]]
+        results.append(TrackResult(int(record['rect_ids'][t]),
+                                   [(int(row[0]), row[1:5].tolist()) for row in rows], rows[:, 5].tolist()))
+    return int(record['request_id']), results
+
+
+class TrackWindowPolicy(object):
+    """
+    decides which frames of a search window are tracked and when a target is given up
+    """
+
+    def __init__(self, cfg: VideoConfig) -> None:
+        super().__init__()
+        self.window_size = cfg.search_window_size
+        self.stride = max(1, cfg.track_stride)
+        self.lost_frames = cfg.track_lost_frames
+        self.lazy_fetch = cfg.track_lazy_fetch
+        self.roi = None
+        if cfg.track_stop_out_roi:
+            geometry = FrameGeometry(cfg)
+            self.roi = (geometry.roi_x, geometry.roi_y, geometry.roi_x + geometry.roi_w,
+                        geometry.roi_y + geometry.roi_h)
+
+    def is_lost(self, lost_cnt):
+        return self.lost_frames > 0 and lost_cnt >= self.lost_frames
+
+    def is_out_of_roi(self, bbox):
+        if self.roi is None:
+            return False
+        cx, cy = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+        return not (self.roi[0] <= cx < self.roi[2] and self.roi[1] <= cy < self.roi[3])
+
+    def interpolate(self, result, scores=None):
+        """
+        fill boxes of frames skipped by stride linearly, gaps caused by low score frames are kept
+        :param result: [(frame_idx, bbox)] in order
+        :param scores: score of each row of result, filled rows are scored nan
+        :return: [(frame_idx, bbox)], or ([(frame_idx, bbox)], scores) if scores is given
+        """
+        if self.stride == 1 or len(result) < 2:
+            return result if scores is None else (result, scores)
+        filled = [result[0]]
+        filled_scores = [scores[0]] if scores is not None else None
+        for k, ((i1, b1), (i2, b2)) in enumerate(zip(result[:-1], result[1:])):
+            if 1 < i2 - i1 <= self.stride:
+                p1, p2 = np.asarray(b1[:4], dtype=np.float64), np.asarray(b2[:4], dtype=np.float64)
+                for i in range(i1 + 1, i2):
+                    filled.append((i, (p1 + (p2 - p1) * (i - i1) / (i2 - i1)).tolist()))
+                    if scores is not None:
+                        filled_scores.append(np.nan)
+            filled.append((i2, b2))
+            if scores is not None:
+                filled_scores.append(scores[k + 1])
+        return filled if scores is None else (filled, filled_scores)
+
+
+def fetch_window(frame_cache, frame_index, track_window_size, stride=1, lazy=False):
+    """
+    fetch frames of a tracking window ASAP in case history caches were covered by the future frames,
+    or one by one if lazy, then frames after an early termination are never fetched
+    :param frame_cache: frame cache of a monitor
+    :param frame_index: index of template frame
+    :param track_window_size: frame number of each tracking request
+    :param stride: fetch every stride frames
+    :param lazy: return a generator which fetches frame on demand
+    :return: [(frame_idx, frame)]
+    """
+
+    def fetch():
+        for i in range(frame_index + stride, frame_index + track_window_size + 1, stride):
+            # verified copy, frames which are not written yet or lapped by the writer are skipped
+            frame = frame_cache.get(i)
+            if frame is None:
+                continue
+            yield i, frame
+
+    return fetch() if lazy else list(fetch())
+
+
+def track_window(track_fn, init_results, frames, track_confidence, policy: TrackWindowPolicy = None,
+                 on_result=None, with_scores=False):
+    """
+    walk frames of a window, targets are dropped by policy once they are lost or leave ROI,
+    the walk ends as soon as no target is left
+    :param track_fn: track_fn(frame, targets) returns tracking results of targets in frame
+    :param init_results: [(frame_idx, rect)] template of each target
+    :param frames: iterable of (frame_idx, frame)
+    :param track_confidence: threshold for filtering low confidence bbox
+    :param policy: window policy, tracks the whole window if None
+    :param on_result: callback on accepted result on_result(frame_idx, frame, track_res)
+    :param with_scores: returns best scores of rows as well, the template row is scored nan
+    :return: [[(frame_idx, bbox)]] of each target, and [[score]] of each target if with_scores
+    """
+    results = [[r] for r in init_results]
+    scores = [[np.nan] for _ in init_results]
+    lost = [0] * len(results)
+    targets = list(range(len(results)))
+    for i, frame in frames:
+        alive = []
+        for t, track_res in zip(targets, track_fn(frame, targets)):
+            if track_res['best_score'] > track_confidence:
+                results[t].append((i, track_res['bbox']))
+                scores[t].append(float(track_res['best_score']))
+                lost[t] = 0
+                if on_result is not None:
+                    on_result(i, frame, track_res)
+                if policy is not None and policy.is_out_of_roi(track_res['bbox']):
+                    logger.debug(f'Target [{t}] leaves ROI at frame [{i}], stop tracking.')
+                    continue
+            else:
+                lost[t] += 1
+                if policy is not None and policy.is_lost(lost[t]):
+                    logger.debug(f'Target [{t}] is lost at frame [{i}], stop tracking.')
+                    continue
+            alive.append(t)
+        targets = alive
+        if not len(targets):
+            break
+    if policy is not None:
+        filled = [policy.interpolate(r, c) for r, c in zip(results, scores)]
+        results, scores = [r for r, _ in filled], [c for _, c in filled]
+    return (results, scores) if with_scores else results
+
+
+def init_templates(tracker, frame_index, rects, init_frame, multi, template_cache: TemplateCache = None):
+    """
+    init tracker templates of rects, exemplar features of targets found in template cache are reused
+    :param tracker: tracker
+    :param frame_index: index of template frame
+    :param rects: [[x1, y1, x2, y2]]
+    :param init_frame: template frame
+    :param multi: init by init_multi(), otherwise rects has only one rect
+    :param template_cache: TemplateCache of camera, only SiamRPNTracker supports it, None disables reuse
+    """
+    bboxes = [to_bbox_wh(rect) for rect in rects]
+    if template_cache is None:
+        if multi:
+            tracker.init_multi(init_frame, bboxes)
+        else:
+            tracker.init(init_frame, bboxes[0])
+        return
+    cached = [template_cache.lookup(frame_index, rect) for rect in rects]
+    if multi:
+        tracker.init_multi(init_frame, bboxes, cached)
+        templates = tracker.templates_multi
+    else:
+        tracker.init(init_frame, bboxes[0], cached[0])
+        templates = [tracker.template]
+    for rect, hit, template in zip(rects, cached, templates):
+        if hit is None:
+            template_cache.update(frame_index, rect, template)
+
+
+def track_single(tracker, req: TrackRequest, init_frame, frames, track_confidence, show_windows, model_index,
+                 policy: TrackWindowPolicy = None, template_cache: TemplateCache = None,
+                 writer_pool: FFMPEGWriterPool = None):
+    """
+    track one rect in a slice window
+    :param writer_pool: warm encoders of result videos in show mode, a new encoder is launched if None
+    :return: TrackResult of rect
+    """
+    init_templates(tracker, req.frame_index, [req.rect], init_frame, False, template_cache)
+    video_writer = None
+    if show_windows:
+        filename = f'track_{req.monitor_index}_{req.request_id}.mp4'
+        if writer_pool is not None:
+            video_writer = writer_pool.start(filename)
+        else:
+            video_writer = FFMPEG_MP4Writer(filename, (init_frame.shape[1], init_frame.shape[0]), 25)
+
+    def show(i, frame, track_res):
+        if show_windows:
+            frame = cv2.rectangle(frame.copy(),
+                                  (int(track_res['bbox'][0]), int(track_res['bbox'][1])),
+                                  (int(track_res['bbox'][2]), int(track_res['bbox'][3])),
+                                  color=(0, 0, 255), thickness=3)
+            cv2.namedWindow(f'Track Result {model_index}', cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)
+            cv2.imshow(f'Track Result {model_index}', frame)
+            cv2.waitKey(1)
+            video_writer.write(frame)
+
+    results, scores = track_window(lambda frame, targets: [tracker.track(frame)], [(req.frame_index, req.rect)],
+                                   frames, track_confidence, policy, show, with_scores=True)
+    if show_windows and video_writer is not None:
+        video_writer.release()
+    return TrackResult(req.rect_id, results[0], scores[0])
+
+
+def track_multi(tracker, req: TrackRequest, init_frame, frames, track_confidence, policy: TrackWindowPolicy = None,
+                template_cache: TemplateCache = None):
+    """
+    track all rects of a request together, templates are initialized in one batch,
+    each frame of window is cropped for every target and tracked by one batched forward
+    :return: [TrackResult], one per rect in order of req.rects
+    """
+    init_templates(tracker, req.frame_index, req.rects, init_frame, True, template_cache)
+    results, scores = track_window(tracker.track_multi, [(req.frame_index, rect) for rect in req.rects], frames,
+                                   track_confidence, policy, with_scores=True)
+    rect_ids = req.rect_ids if req.rect_ids is not None else range(len(req.rects))
+    return [TrackResult(rect_id, result, score) for rect_id, result, score in zip(rect_ids, results, scores)]
+
+
+def deliver(result_rings, req: TrackRequest, output, timeout=5):
+    """
+    output tracking results into the result ring of monitor, results of a coalesced request are
+    split back to the original requests
+    :param result_rings: {monitor_index: SharedRecordRing} written by this tracker
+    """
+    if req.parts is None:
+        parts = [(req.request_id, output if isinstance(output, list) else [output])]
+    else:
+        parts = [(request_id, [TrackResult(rect_id, output[p].result, output[p].scores)
+                               for p, rect_id in zip(positions, rect_ids)])
+                 for request_id, positions, rect_ids in req.parts]
+    ring = result_rings[req.monitor_index]
+    for request_id, results in parts:
+        if not ring.put(lambda record: pack_results(record, request_id, results), timeout):
+            logger.warning(f'Result ring of monitor [{req.monitor_index}] is full, '
+                           f'drop result of request [{request_id}].')
+
+
+def drop_cancelled(cancelled, req: TrackRequest):
+    """
+    remove cancelled requests, parts of a coalesced request are removed one by one
+    :return: True if nothing is left to track
+    """
+    if cancelled is None:
+        return False
+    if req.parts is None:
+        return cancelled.pop((req.monitor_index, req.request_id), None) is not None
+    req.parts = [p for p in req.parts if cancelled.pop((req.monitor_index, p[0]), None) is None]
+    return not len(req.parts)
+
+
+class TrackScheduler(object):
+    """
+    Schedule tracking requests of all monitors before they are dispatched to tracker processes.
+    Requests wait in per-camera queues and are dequeued round-robin, so a burst on one camera can't starve the others.
+    A request expires once its template frame is evicted from the frame ring, requests posted on the same frame of
+    a camera are coalesced into a single multi-target request.
+    """
+
+    def __init__(self, video_configs, frame_caches, request_rings, dispatch_pipe, cancelled=None, coalesce=True,
+                 max_targets=None, metric_interval=60) -> None:
+        """
+        :param video_configs: {monitor_index: VideoConfig}
+        :param frame_caches: {monitor_index: frame cache} frame rings requests are tracked on
+        :param request_rings: {monitor_index: SharedRecordRing} requests posted by requesters
+        :param dispatch_pipe: small bounded queue consumed by tracker processes
+        :param cancelled: requests cancelled by requesters
+        :param coalesce: coalesce requests of the same frame, trackers must support multi-target tracking
+        :param max_targets: max rects of a coalesced request
+        :param metric_interval: seconds between two metric logs
+        """
+        super().__init__()
+        self.frame_caches = frame_caches
+        self.request_rings = request_rings
+        self.dispatch_pipe = dispatch_pipe
+        self.cancelled = cancelled
+        self.coalesce = coalesce
+        self.max_targets = max_targets
+        self.metric_interval = metric_interval
+        self.queues = {index: deque() for index in video_configs}
+        # a frame is overwritten after cache_size frames, the whole window must still be there when tracking ends,
+        # measured in frames written since the template frame, so that stalled or bursty streams expire nothing early
+        self.horizon = {index: max(0, c.cache_size - c.search_window_size) for index, c in video_configs.items()}
+        self.order = list(self.queues.keys())
+        self.cursor = 0
+        self.metrics = {index: {'dispatched': 0, 'expired': 0, 'coalesced': 0, 'cancelled': 0, 'wait': 0.,
+                                'max_wait': 0., 'max_depth': 0} for index in video_configs}
+        self.last_report = time.time()
+
+    def put(self, req: TrackRequest):
+        queue = self.queues[req.monitor_index]
+        if self.coalesce:
+            for pending in queue:
+                if pending.frame_index == req.frame_index and self.mergeable(pending, req):
+                    self.merge(pending, req)
+                    self.metrics[req.monitor_index]['coalesced'] += 1
+                    return
+        queue.append(req)
+        metric = self.metrics[req.monitor_index]
+        metric['max_depth'] = max(metric['max_depth'], len(queue))
+
+    def mergeable(self, pending: TrackRequest, req: TrackRequest):
+        if self.max_targets is None:
+            return True
+        size = lambda r: 1 if r.rects is None else len(r.rects)
+        return size(pending) + size(req) <= self.max_targets
+
+    @staticmethod
+    def _as_parts(req: TrackRequest):
+        if req.parts is not None:
+            return req.rects, req.parts
+        if req.rects is None:
+            return [req.rect], [(req.request_id, [0], [req.rect_id])]
+        rect_ids = list(req.rect_ids) if req.rect_ids is not None else list(range(len(req.rects)))
+        return list(req.rects), [(req.request_id, list(range(len(req.rects))), rect_ids)]
+
+    def merge(self, pending: TrackRequest, req: TrackRequest):
+        rects, parts = self._as_parts(pending)
+        new_rects, new_parts = self._as_parts(req)
+        offset = len(rects)
+        parts = parts + [(request_id, [p + offset for p in positions], rect_ids)
+                         for request_id, positions, rect_ids in new_parts]
+        pending.rects = rects + new_rects
+        pending.parts = parts
+        pending.rect = None
+        pending.rect_id = None
+        pending.rect_ids = None
+
+    def is_expired(self, req: TrackRequest, latest):
+        """
+        :param latest: latest frame index written into the frame cache of the request
+        """
+        return latest - req.frame_index >= self.horizon[req.monitor_index]
+
+    def next(self):
+        """
+        dequeue the next valid request round-robin, expired and cancelled requests are dropped
+        :return: request or None
+        """
+        num = len(self.order)
+        for k in range(num):
+            index = self.order[(self.cursor + k) % num]
+            queue = self.queues[index]
+            latest = self.frame_caches[index].latest() if len(queue) else None
+            while len(queue):
+                req = queue.popleft()
+                if self.is_expired(req, latest):
+                    # an expired request never reaches a tracker, forget its cancellations
+                    drop_cancelled(self.cancelled, req)
+                    self.metrics[index]['expired'] += 1
+                    logger.info(f'Track Scheduler: request [{req.request_id}] of monitor [{index}] expired, '
+                                f'frames were evicted from cache.')
+                    continue
+                if drop_cancelled(self.cancelled, req):
+                    self.metrics[index]['cancelled'] += 1
+                    continue
+                self.cursor = (self.cursor + k + 1) % num
+                return req
+        return None
+
+    def backlog(self):
+        return sum(len(q) for q in self.queues.values())
+
+    def ingest(self, block, timeout=1):
+        """
+        move posted requests into camera queues
+        :param block: wait for a request to be posted if no request is pending or posted
+        :param timeout: max seconds to wait, request rings share the semaphore of the first one
+        """
+        received = 0
+        for ring in self.request_rings.values():
+            record = ring.pop()
+            while record is not None:
+                self.put(TrackRequest.from_record(record))
+                received += 1
+                record = ring.pop()
+        if block and not received and len(self.request_rings):
+            next(iter(self.request_rings.values())).wait(timeout)
+
+    def dispatch(self, req: TrackRequest):
+        try:
+            self.dispatch_pipe.put(req, timeout=0.05)
+        except Full:
+            # all tracker processes are busy, keep the request reorderable
+            self.queues[req.monitor_index].appendleft(req)
+            return False
+        metric = self.metrics[req.monitor_index]
+        wait = time.time() - req.post_time
+        metric['dispatched'] += 1
+        metric['wait'] += wait
+        metric['max_wait'] = max(metric['max_wait'], wait)
+        return True
+
+    def report(self):
+        for index, m in self.metrics.items():
+            mean_wait = m['wait'] / m['dispatched'] if m['dispatched'] else 0
+            logger.info(f'Track Scheduler: monitor [{index}] queue depth [{len(self.queues[index])}], '
+                        f'max depth [{m["max_depth"]}], dispatched [{m["dispatched"]}], '
+                        f'mean wait [{round(mean_wait, 3)}]s, max wait [{round(m["max_wait"], 3)}]s, '
+                        f'expired [{m["expired"]}], coalesced [{m["coalesced"]}], cancelled [{m["cancelled"]}]')
+        self.last_report = time.time()
+
+    def run(self, status):
+        last_check = 0
+        while True:
+            # system status lives in manager process, do not ask it on every poll
+            if time.time() - last_check > 1:
+                if status.get() == SystemStatus.SHUT_DOWN:
+                    return
+                last_check = time.time()
+            try:
+                self.ingest(block=not self.backlog())
+                req = self.next()
+                if req is not None:
+                    self.dispatch(req)
+                if time.time() - self.last_report > self.metric_interval:
+                    self.report()
+            except (EOFError, BrokenPipeError, ConnectionError):
+                logger.info('Track Scheduler: pipe closed, exit scheduler.')
+                return
+            except Exception as e:
+                logger.error(e)
+                traceback.print_exc()
+
+
+def warm_up_tracker(tracker, shape=(360, 640, 3)):
+    frame = np.zeros(shape, dtype=np.uint8)
+    tracker.init(frame, [shape[1] // 2, shape[0] // 2, 40, 40])
+    tracker.track(frame)
 
 
 def track_service(model_index, video_cfgs, checkpoint,
                   frame_caches,
                   recv_pipe: Queue,
-                  output_pipes, status, lock):
+                  result_rings, status, lock, cancelled=None, backend='siamrpn', runtime: ModelRuntime = None,
+                  shared_checkpoint: SharedCheckpoint = None, backend_confidence=None):
     """
     Each track service maintains a tracker model instance, which must be init inside a subprocess
     :param model_index: model index
@@ -76,37 +565,68 @@ def track_service(model_index, video_cfgs, checkpoint,
     :param checkpoint: tracker model parameters
     :param frame_caches: global video frames cache
     :param recv_pipe: receive tracking request from the other processes,it's multi-processing shared queue
-    :param output_pipes: output tracking result into a monitor-specified pipe independently
+    :param result_rings: output tracking result into a monitor-specified shared memory ring of this tracker
     :param status: system status, such as SHUT_DOWN,RESUME, RUNNING
     :param lock: gpu lock
+    :param cancelled: requests cancelled by requester, skipped if not started yet
+    :param backend: siamrpn or a CPU tracker backend of cv_tracker, such as flow, kcf, csrt
+    :param runtime: model runtime settings
+    :param shared_checkpoint: weights loaded once by tracking service, checkpoint is read from file if None
+    :param backend_confidence: confidence threshold of backend, alg['track_confidence'] of each camera is used if None
     :return:
     """
+    runtime = runtime if runtime is not None else ModelRuntime()
+    runtime.setup_process()
+
+    if backend == 'siamrpn':
+        if torch.cuda.is_available():
+            device = torch.device('cuda:' + str(model_index))
+        else:
+            device = torch.device('cpu')
 
-    if torch.cuda.is_available():
-        device = torch.device('cuda:' + str(model_index))
+        # Build model instance
+        model = ModelBuilder()
+        tracker = build_tracker(model, device)
+        if shared_checkpoint is not None:
+            shared_checkpoint.bind(model)
+        else:
+            model.load_state_dict(torch.load(checkpoint,
+                                             map_location=lambda storage, loc: storage.cpu()))
+        # now model is running inside a sub-process, depthwise xcorr reshapes features by view(),
+        # so they must stay contiguous
+        tracker.model = runtime.prepare(model, device, channels_last=False)
+        runtime.warm_up(warm_up_tracker, tracker)
+        logger.info(
+            f'Tracker [{model_index}]: Running Tracker Services: checkpoint from {checkpoint}')
     else:
-        device = torch.device('cpu')
-
-    # Build model instance
-    model = ModelBuilder()
-    tracker = build_tracker(model, device)
-    model.load_state_dict(torch.load(checkpoint,
-                                     map_location=lambda storage, loc: storage.cpu()))
-    # now model is running inside a sub-process
-    model.eval().to(device)
-    logger.info(
-        f'Tracker [{model_index}]: Running Tracker Services: checkpoint from {checkpoint}')
+        tracker = build_cv_tracker(backend)
+        logger.info(f'Tracker [{model_index}]: Running Tracker Services: CPU backend [{backend}]')
     LOGGER_PREFIX = f'Tracker [{model_index}]: '
+    policies = {index: TrackWindowPolicy(c) for index, c in video_cfgs.items()}
+    # exemplar features are reused by SiamRPNTracker only
+    template_caches = {}
+    if backend == 'siamrpn' and cfg.TRACK.TYPE == 'SiamRPNTracker':
+        template_caches = {index: TemplateCache(c.template_cache_size, c.template_cache_quant,
+                                                c.template_cache_max_gap)
+                           for index, c in video_cfgs.items() if c.template_cache_size > 0}
+    # result videos of show mode
+    writer_pools = {}
     while True:
         try:
             if status.get() == SystemStatus.SHUT_DOWN:
                 logger.info(f'Tracker [{model_index}]: Exit Tracker Service')
+                for pool in writer_pools.values():
+                    pool.close()
                 break
             # fetch a tracking request from a global sync queue
             # monitor_index, frame_index, rect, rect_id = recv_pipe.get()
             req: TrackRequest = recv_pipe.get(timeout=5)
-            # threshold for filtering low confidence bbox
-            track_confidence = video_cfgs[req.monitor_index].alg['track_confidence']
+            if drop_cancelled(cancelled, req):
+                logger.info(f'{LOGGER_PREFIX}request [{req.request_id}] was cancelled, skip.')
+                continue
+            # threshold for filtering low confidence bbox, scores of CPU backends are on their own scales
+            track_confidence = video_cfgs[req.monitor_index].alg['track_confidence'] \
+                if backend_confidence is None else backend_confidence
             # frame number of each tracking request
             track_window_size = video_cfgs[req.monitor_index].search_window_size
             show_windows = video_cfgs[req.monitor_index].show_window
@@ -119,46 +639,27 @@ def track_service(model_index, video_cfgs, checkpoint,
                     f'Tracker [{model_index}]: Empty frame from cache [{req.frame_index}] of monitor [{req.monitor_index}].')
                 continue
             # lock the whole model in case it is busy and throw exception if multiple requests post
-            with lock:
+            with lock, runtime.inference():
                 s = time.time()
-                tracker.init(init_frame, to_bbox_wh(req.rect))
-                end_index = req.frame_index + track_window_size + 1
-                result = []
-                result.append((req.frame_index, req.rect))
-                # fetch frames ASAP in case history caches were covered by the future frames
-                frames = []
-                for i in range(req.frame_index + 1, end_index):
-                    frame = frame_caches[req.monitor_index][i]
-                    if frame is None:
-                        continue
-                    frames.append((i, frame))
-
-                # track in a slice windows
-                video_writer = None
-                if show_windows:
-                    video_writer = FFMPEG_MP4Writer(f'track_{req.monitor_index}_{req.request_id}.mp4',
-                                                    (init_frame.shape[1], init_frame.shape[0]),
-                                                    25)
-
-                for i, frame in frames:
-                    track_res = tracker.track(frame)
-                    best_score = track_res['best_score']
-                    if best_score > track_confidence:
-                        result.append((i, track_res['bbox']))
-                        if show_windows:
-                            frame = cv2.rectangle(frame.copy(),
-                                                  (int(track_res['bbox'][0]), int(track_res['bbox'][1])),
-                                                  (int(track_res['bbox'][2]), int(track_res['bbox'][3])),
-                                                  color=(0, 0, 255), thickness=3)
-                            cv2.namedWindow(f'Track Result {model_index}', cv2.WINDOW_NORMAL | cv2.WINDOW_KEEPRATIO)
-                            cv2.imshow(f'Track Result {model_index}', frame)
-                            cv2.waitKey(1)
-                            video_writer.write(frame)
-
-                if show_windows and video_writer is not None:
-                    video_writer.release()
+                policy = policies[req.monitor_index]
+                frames = fetch_window(frame_caches[req.monitor_index], req.frame_index, track_window_size,
+                                      policy.stride, policy.lazy_fetch)
+                template_cache = template_caches.get(req.monitor_index)
+                if req.rects is not None:
+                    output = track_multi(tracker, req, init_frame, frames, track_confidence, policy,
+                                         template_cache)
+                else:
+                    if show_windows and req.monitor_index not in writer_pools:
+                        writer_pools[req.monitor_index] = FFMPEGWriterPool(
+                            (init_frame.shape[1], init_frame.shape[0]), 25, '.', workers=1,
+                            pix_fmt=video_cfgs[req.monitor_index].frame_pix_fmt)
+                    output = track_single(tracker, req, init_frame, frames, track_confidence, show_windows,
+                                          model_index, policy, template_cache, writer_pools.get(req.monitor_index))
+                if template_cache is not None:
+                    logger.info(f'{LOGGER_PREFIX}template cache hit rate of monitor [{req.monitor_index}]: '
+                                f'[{round(template_cache.hit_rate(), 3)}]')
                 # output results into the corresponding pipe of each monitor
-                output_pipes[req.monitor_index][req.request_id] = TrackResult(req.rect_id, result)
+                deliver(result_rings, req, output)
                 e = time.time() - s
                 logger.info(f'{LOGGER_PREFIX} tracking consumes: {round(e, 2)} seconds')
         except Empty as e:
@@ -172,45 +673,175 @@ def track_service(model_index, video_cfgs, checkpoint,
 
 
 class TrackRequester(object):
+    """
+    Post tracking requests and wait for results by futures.
+    Requests and results travel through shared memory rings, each monitor has its own request ring and one result
+    ring per tracker, a dispatcher thread inside the consuming process resolves the futures as soon as results arrive.
+    Requests of a monitor must be posted from a single process.
+    """
 
-    def __init__(self, recv_pipe, output_pipes):
+    def __init__(self, request_rings, result_rings, multi_target=True, cancelled=None, max_targets=16):
+        """
+        :param request_rings: {monitor_index: SharedRecordRing} of requests
+        :param result_rings: {monitor_index: [SharedRecordRing]} of results, one ring per tracker
+        :param multi_target: track all rects of a call by one request
+        :param cancelled: requests cancelled before tracking started, shared with tracking services
+        :param max_targets: max rects of a request, more rects are split into several requests
+        """
         super().__init__()
-        self.rec_pipe = recv_pipe
-        self.output_pipes = output_pipes
-        self.r_id = Manager().Value('i', 0)
+        self.request_rings = request_rings
+        self.result_rings = result_rings
+        self.ids = IdAllocator()
+        self.multi_target = multi_target
+        self.cancelled = cancelled
+        self.max_targets = max_targets
+        self._init_local()
+
+    def _init_local(self):
+        # futures and dispatchers are private to the process which uses the requester
+        self._pid = os.getpid()
+        self._futures = {}
+        self._dispatchers = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ['_pid', '_futures', '_dispatchers', '_lock']:
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local()
+
+    def _ensure_dispatcher(self, monitor_index):
+        if self._pid != os.getpid():
+            # inherited by fork, the parent's threads are not running here
+            self._init_local()
+        with self._lock:
+            if monitor_index not in self._dispatchers:
+                t = threading.Thread(target=self._dispatch, args=(monitor_index,), daemon=True)
+                self._dispatchers[monitor_index] = t
+                t.start()
+
+    def _dispatch(self, monitor_index):
+        """
+        resolve futures by results from the result queue of a monitor
+        :param monitor_index:
+        :return:
+        """
+        rings = self.result_rings[monitor_index]
+        while True:
+            record = None
+            try:
+                for ring in rings:
+                    record = ring.pop()
+                    if record is not None:
+                        break
+                if record is None:
+                    # result rings of a monitor share a semaphore released by every delivery
+                    rings[0].wait(1)
+                    continue
+            except (EOFError, TypeError, BrokenPipeError, ConnectionError):
+                logger.info(f'Track Requester [{monitor_index}]: result ring closed, exit dispatcher.')
+                return
+            req_id, output = unpack_results(record)
+            with self._lock:
+                future = self._futures.pop((monitor_index, req_id), None)
+                running = future is not None and future.set_running_or_notify_cancel()
+                # the request was cancelled after it reached a tracker, its cancellation is never consumed
+                if not running and self.cancelled is not None:
+                    self.cancelled.pop((monitor_index, req_id), None)
+            # drop results of cancelled or unknown requests
+            if not running:
+                logger.debug(f'Track Requester [{monitor_index}]: drop result of request id [{req_id}]')
+                continue
+            logger.info(f'Track Requester [{monitor_index}]: tracking result done for request id [{req_id}], '
+                        f'latency [{round(time.time() - future.submit_time, 3)}] seconds')
+            future.set_result(output)
+
+    def _next_id(self):
+        return self.ids.next()
 
-    def request(self, monitor_index, frame_index, rects):
+    def submit(self, monitor_index, frame_index, rects) -> List[Future]:
+        """
+        post tracking requests of rects without blocking
+        :param monitor_index: monitor index
+        :param frame_index: frame unique id
+        :param rects: rects template
+        :return: futures of posted requests, each future resolves to a list of TrackResult
+        """
+        self._ensure_dispatcher(monitor_index)
+        if self.multi_target:
+            # rects are tracked together, a request carries at most max_targets rects
+            reqs = [TrackRequest(self._next_id(), monitor_index, frame_index, None, None,
+                                 rects=list(rects[i:i + self.max_targets]),
+                                 rect_ids=list(range(i, min(i + self.max_targets, len(rects)))))
+                    for i in range(0, len(rects), self.max_targets)]
+        else:
+            reqs = [TrackRequest(self._next_id(), monitor_index, frame_index, rect, rect_id)
+                    for rect_id, rect in enumerate(rects)]
+        futures = []
+        for req in reqs:
+            future = Future()
+            future.request_id = req.request_id
+            future.monitor_index = monitor_index
+            future.submit_time = time.time()
+            with self._lock:
+                self._futures[(monitor_index, req.request_id)] = future
+            futures.append(future)
+            if not self.request_rings[monitor_index].put(req.to_record, timeout=1):
+                with self._lock:
+                    self._futures.pop((monitor_index, req.request_id), None)
+                future.set_exception(Exception(f'Request ring of monitor [{monitor_index}] is full.'))
+        return futures
+
+    def cancel(self, futures: List[Future]):
+        """
+        cancel pending requests, a request is skipped by tracker if it has not been started,
+        otherwise its result is dropped on arrival
+        :param futures: futures from submit()
+        :return:
+        """
+        for future in futures:
+            # serialized with result arrival, so that a cancellation is never recorded after its result is dropped
+            with self._lock:
+                if future.cancel():
+                    self._futures.pop((future.monitor_index, future.request_id), None)
+                    if self.cancelled is not None:
+                        self.cancelled[(future.monitor_index, future.request_id)] = True
+
+    def request(self, monitor_index, frame_index, rects, timeout=None):
         """
         post a tracking request to a GPU model, request will be blocked until tracker finishing
         services for all rects tracking
         :param monitor_index: monitor index
         :param frame_index: frame unique id
         :param rects: rects template
+        :param timeout: max seconds to wait for all results, requests not done in time are cancelled
         :return:  res: WINDOW_SIZE * (frame_idx,[[x1,y1,x2,y2],[x3,y3,x4,y4],...](one frame with all rects);
                   seq: N * WINDOW_SIZE * (frame_idx,[x1,y1,x2,y2]); N is rects' number
         """
         res = []
         organize = {}
         seq = [[]] * len(rects)
-        req_ids = []
         if not len(rects):
             return [], []
-        else:
-            for rect_id, rect in enumerate(rects):
-                c_id = self.r_id.get()
-                self.r_id.set(c_id + 1)
-                req_ids.append(c_id)
-                # post to a single
-                self.rec_pipe.put(TrackRequest(c_id, monitor_index, frame_index, rect, rect_id))
-            for i in range(len(rects)):
-                # frames of each monitor arrival in order, track request is also in order
-                # in corresponding receive pipe
-                while req_ids[i] not in self.output_pipes[monitor_index]:
-                    logger.debug(f'Wait for tracking result for request id [{req_ids[i]}]')
-                    time.sleep(1)
-                logger.info(f'Tracking result done for request id [{req_ids[i]}]')
-                track_result: TrackResult = self.output_pipes[monitor_index][req_ids[i]]
-                # but track result may be out of order at each request, should sort by original rect id
+        start = time.time()
+        futures = self.submit(monitor_index, frame_index, rects)
+        done, not_done = wait(futures, timeout=timeout)
+        if len(not_done):
+            logger.warning(f'Track Requester [{monitor_index}]: [{len(not_done)}] requests timeout after '
+                           f'[{timeout}] seconds, cancelled.')
+            self.cancel(list(not_done))
+        for future in futures:
+            if future not in done or future.cancelled() or future.exception() is not None:
+                continue
+            track_results = future.result()
+            if isinstance(track_results, TrackResult):
+                track_results = [track_results]
+            for track_result in track_results:
+                # track result may be out of order at each request, should sort by original rect id
                 seq[track_result.rect_id] = track_result.result
                 frame_seq = track_result.result
                 for f_idx, rect in frame_seq:
@@ -218,11 +849,12 @@ class TrackRequester(object):
                     if f_idx not in organize:
                         organize[f_idx] = []
                     organize[f_idx].append(rect)
-            # organize data structure for filter input
-            for k, v in organize.items():
-                if len(v):
-                    res.append((k, v))
-            # logger.info(f'tracking results: {result_set}')
+        # organize data structure for filter input
+        for k, v in organize.items():
+            if len(v):
+                res.append((k, v))
+        logger.info(f'Track Requester [{monitor_index}]: track [{len(rects)}] rects end to end latency '
+                    f'[{round(time.time() - start, 3)}] seconds')
         return res, seq
 
 
@@ -232,27 +864,40 @@ class TrackingService(object):
     """
 
     def __init__(self, model_cfg_path, video_configs: List[VideoConfig], checkpoint, frame_caches,
-                 size=3) -> None:
+                 size=3, multi_target=True, backend='siamrpn', max_targets=16,
+                 runtime: ModelRuntime = None, share_weights=False, backend_confidence=None) -> None:
+        """
+        :param backend_confidence: {backend: confidence threshold}, cameras use alg['track_confidence'] if backend
+        is not in it
+        """
         super().__init__()
-        if not os.path.exists(model_cfg_path):
-            raise Exception('Track model configuration not found.')
+        self.backend = backend
+        self.backend_confidence = (backend_confidence or {}).get(backend)
+        self.runtime = runtime
+        self.shared_checkpoint = None
+        if backend == 'siamrpn':
+            if not os.path.exists(model_cfg_path):
+                raise Exception('Track model configuration not found.')
 
-        if not os.path.exists(checkpoint):
-            raise Exception('Track model checkpoint not found.')
+            if not os.path.exists(checkpoint):
+                raise Exception('Track model checkpoint not found.')
 
-        cfg.merge_from_file(model_cfg_path)
-        logger.info(cfg.BACKBONE.TYPE)
+            cfg.merge_from_file(model_cfg_path)
+            logger.info(cfg.BACKBONE.TYPE)
+            if share_weights:
+                # tracker processes bind the same weights instead of loading the checkpoint one by one
+                self.shared_checkpoint = SharedCheckpoint.load(checkpoint)
+        elif backend not in CV_TRACKERS:
+            raise Exception(f'Unknown tracker backend [{backend}].')
 
         # self.devices = []
         self.models = []
         self.pipe_manager = Manager()
         self.frame_caches = {}
         self.video_configs = {}
-        self.output_pipes = {}
         for idx, c in enumerate(video_configs):
             self.frame_caches[c.index] = frame_caches[idx]
             self.video_configs[c.index] = c
-            self.output_pipes[c.index] = self.pipe_manager.dict()
             # self.video_configs = video_configs
         self.checkpoint = checkpoint
         # if torch.cuda.is_available():
@@ -264,8 +909,29 @@ class TrackingService(object):
         #     devices = [torch.device('cpu') for i in range(size)]
         #     devices.append(torch.device('cpu'))
         self.device_num = size
-        # self.rec_pipes = [self.pipe_manager.Queue() for i in range(self.device_num)]
-        self.rec_pipe = self.pipe_manager.Queue()
+        # batched multi-target tracking is only implemented by SiamRPNTracker, CPU backends track targets in turn
+        multi_capable = backend != 'siamrpn' or cfg.TRACK.TYPE == 'SiamRPNTracker'
+        self.multi_target = multi_target and multi_capable
+        # requests and results are fixed-size records in shared memory rings
+        self.max_targets = max_targets
+        window_size = max(c.search_window_size for c in video_configs) + 1
+        # consumers block on native semaphores of rings, the scheduler reads all request rings and a dispatcher
+        # reads all result rings of a monitor, so rings read by one consumer share a semaphore.
+        # Processes using the rings must be forked after this service is created to inherit the semaphores
+        request_ready = Semaphore(0)
+        self.request_rings = {index: SharedRecordRing(request_dtype(max_targets), 64, ready=request_ready)
+                              for index in self.video_configs}
+        # each tracker writes its own result ring of a monitor, so that rings keep a single producer
+        self.result_rings = {}
+        for index in self.video_configs:
+            result_ready = Semaphore(0)
+            self.result_rings[index] = [SharedRecordRing(result_dtype(max_targets, window_size), 8, ready=result_ready)
+                                        for i in range(self.device_num)]
+        self.cancelled = CancelledRequests(list(self.video_configs))
+        # requests are scheduled inside this process, trackers only see a small dispatch queue
+        self.dispatch_pipe = Queue(1)
+        self.scheduler = TrackScheduler(self.video_configs, self.frame_caches, self.request_rings, self.dispatch_pipe,
+                                        self.cancelled, coalesce=multi_capable, max_targets=max_targets)
         # self.rec_pipe = recv_pipe
         self.status = self.pipe_manager.Value('i', SystemStatus.RUNNING)
         # self.output_pipes = [self.pipe_manager.Queue() for i in range(self.device_num)]
@@ -278,11 +944,13 @@ class TrackingService(object):
         run tracking post service
         :return:
         """
+        threading.Thread(target=self.scheduler.run, args=(self.status,), daemon=True).start()
         for idx in range(self.device_num):
             p = Process(target=track_service,
-                        args=(idx, self.video_configs, self.checkpoint, self.frame_caches, self.rec_pipe,
-                              self.output_pipes,
-                              self.status, self.gpu_locks[idx]),
+                        args=(idx, self.video_configs, self.checkpoint, self.frame_caches, self.dispatch_pipe,
+                              {index: rings[idx] for index, rings in self.result_rings.items()},
+                              self.status, self.gpu_locks[idx], self.cancelled, self.backend, self.runtime,
+                              self.shared_checkpoint, self.backend_confidence),
                         daemon=True)
             p.start()
             self.proc_instances.append(p)
@@ -290,10 +958,14 @@ class TrackingService(object):
             # self.tracker_pool.
 
     def get_request_instance(self):
-        return TrackRequester(self.rec_pipe, self.output_pipes)
+        return TrackRequester(self.request_rings, self.result_rings, self.multi_target, self.cancelled,
+                              self.max_targets)
 
     def cancel(self):
         self.status.set(SystemStatus.SHUT_DOWN)
         for p in self.proc_instances:
             p.join()
             p.close()
+        for ring in list(self.request_rings.values()) + [r for rings in self.result_rings.values() for r in rings]:
+            ring.close()
+        self.cancelled.close()
@@ -68,11 +68,12 @@ class SiamRPNTracker(SiameseTracker):
         height = max(10, min(height, boundary[0]))
         return cx, cy, width, height
 
-    def init(self, img, bbox):
+    def init(self, img, bbox, template=None):
         """
         args:
             img(np.ndarray): BGR image
             bbox: (x, y, w, h) bbox
+            template: (zf, channel_average) of a previous target, the exemplar is not computed again if it is set
         """
         self.center_pos = np.array([bbox[0] + (bbox[2] - 1) / 2,
                                     bbox[1] + (bbox[3] - 1) / 2])
@@ -83,14 +84,20 @@ class SiamRPNTracker(SiameseTracker):
         h_z = self.size[1] + cfg.TRACK.CONTEXT_AMOUNT * np.sum(self.size)
         s_z = round(np.sqrt(w_z * h_z))
 
-        # calculate channle average
-        self.channel_average = np.mean(img, axis=(0, 1))
+        if template is not None:
+            self.model.zf, self.channel_average = template
+            self.template = template
+            return
+
+        # calculate channle average inside the context region only
+        self.channel_average = self.context_average(img, self.center_pos, s_z)
 
         # get crop
         z_crop = self.get_subwindow(img, self.center_pos,
                                     cfg.TRACK.EXEMPLAR_SIZE,
                                     s_z, self.channel_average, self.device)
         self.model.template(z_crop)
+        self.template = (self.model.zf, self.channel_average)
 
     def track(self, img):
         """
@@ -99,11 +106,7 @@ class SiamRPNTracker(SiameseTracker):
         return:
             bbox(list):[x, y, width, height]
         """
-        w_z = self.size[0] + cfg.TRACK.CONTEXT_AMOUNT * np.sum(self.size)
-        h_z = self.size[1] + cfg.TRACK.CONTEXT_AMOUNT * np.sum(self.size)
-        s_z = np.sqrt(w_z * h_z)
-        scale_z = cfg.TRACK.EXEMPLAR_SIZE / s_z
-        s_x = s_z * (cfg.TRACK.INSTANCE_SIZE / cfg.TRACK.EXEMPLAR_SIZE)
+        scale_z, s_x = self._search_scale(self.size)
         x_crop = self.get_subwindow(img, self.center_pos,
                                     cfg.TRACK.INSTANCE_SIZE,
                                     round(s_x), self.channel_average, self.device)
@@ -112,6 +115,130 @@ class SiamRPNTracker(SiameseTracker):
 
         score = self._convert_score(outputs['cls'])
         pred_bbox = self._convert_bbox(outputs['loc'], self.anchors)
+        self.center_pos, self.size, bbox, best_score = \
+            self._update_state(score, pred_bbox, self.center_pos, self.size, scale_z, img.shape[:2])
+        return {
+            'bbox': bbox,
+            'best_score': best_score
+        }
+
+    def init_multi(self, img, bboxes, templates=None):
+        """
+        init templates of several targets in the same image by a single batched forward
+        args:
+            img(np.ndarray): BGR image
+            bboxes: [(x, y, w, h)] bboxes
+            templates: [(zf, channel_average) or None] one per bbox, only targets without template are computed
+        """
+        if templates is None:
+            templates = [None] * len(bboxes)
+        self.center_pos_multi = []
+        self.size_multi = []
+        self.channel_average_multi = []
+        z_crops = []
+        for bbox, template in zip(bboxes, templates):
+            center_pos = np.array([bbox[0] + (bbox[2] - 1) / 2,
+                                   bbox[1] + (bbox[3] - 1) / 2])
+            size = np.array([bbox[2], bbox[3]])
+            self.center_pos_multi.append(center_pos)
+            self.size_multi.append(size)
+            if template is not None:
+                self.channel_average_multi.append(template[1])
+                continue
+            w_z = size[0] + cfg.TRACK.CONTEXT_AMOUNT * np.sum(size)
+            h_z = size[1] + cfg.TRACK.CONTEXT_AMOUNT * np.sum(size)
+            s_z = round(np.sqrt(w_z * h_z))
+            channel_average = self.context_average(img, center_pos, s_z)
+            z_crops.append(self.get_subwindow(img, center_pos,
+                                              cfg.TRACK.EXEMPLAR_SIZE,
+                                              s_z, channel_average, self.device))
+            self.channel_average_multi.append(channel_average)
+        zfs = []
+        if len(z_crops):
+            self.model.template(torch.cat(z_crops, dim=0))
+            zfs = [self._zf_index(self.model.zf, slice(i, i + 1)) for i in range(len(z_crops))]
+        zfs = iter(zfs)
+        # templates of all targets, in order of bboxes
+        self.templates_multi = [template if template is not None else (next(zfs), self.channel_average_multi[i])
+                                for i, template in enumerate(templates)]
+        self.zf_multi = self._zf_cat([template[0] for template in self.templates_multi])
+        self.model.zf = self.zf_multi
+        self.zf_targets = list(range(len(bboxes)))
+
+    def track_multi(self, img, targets=None):
+        """
+        track targets of init_multi() in img, search crops are stacked into one batched forward
+        args:
+            img(np.ndarray): BGR image
+            targets: indices of targets to track, all targets by default
+        return:
+            list of {'bbox': [x1, y1, x2, y2], 'best_score': score}, one per target
+        """
+        if targets is None:
+            targets = range(len(self.center_pos_multi))
+        targets = list(targets)
+        scales = []
+        x_crops = []
+        for t in targets:
+            center_pos, size = self.center_pos_multi[t], self.size_multi[t]
+            scale_z, s_x = self._search_scale(size)
+            scales.append(scale_z)
+            x_crops.append(self.get_subwindow(img, center_pos,
+                                              cfg.TRACK.INSTANCE_SIZE,
+                                              round(s_x), self.channel_average_multi[t], self.device))
+        if self.zf_targets != targets:
+            self._select_template(targets)
+        outputs = self.model.track(torch.cat(x_crops, dim=0))
+        results = []
+        for i, (t, scale_z) in enumerate(zip(targets, scales)):
+            score = self._convert_score(outputs['cls'][i:i + 1])
+            pred_bbox = self._convert_bbox(outputs['loc'][i:i + 1], self.anchors)
+            self.center_pos_multi[t], self.size_multi[t], bbox, best_score = \
+                self._update_state(score, pred_bbox, self.center_pos_multi[t], self.size_multi[t], scale_z,
+                                   img.shape[:2])
+            results.append({
+                'bbox': bbox,
+                'best_score': best_score
+            })
+        return results
+
+    def _select_template(self, targets):
+        """
+        keep templates of given targets only, batch of templates must match batch of search crops
+        """
+        index = torch.as_tensor(targets, dtype=torch.long)
+        if isinstance(self.zf_multi, (list, tuple)):
+            self.model.zf = [zf[index.to(zf.device)] for zf in self.zf_multi]
+        else:
+            self.model.zf = self.zf_multi[index.to(self.zf_multi.device)]
+        self.zf_targets = targets
+
+    @staticmethod
+    def _zf_index(zf, index):
+        if isinstance(zf, (list, tuple)):
+            return [z[index] for z in zf]
+        return zf[index]
+
+    @staticmethod
+    def _zf_cat(zfs):
+        if len(zfs) == 1:
+            return zfs[0]
+        if isinstance(zfs[0], (list, tuple)):
+            return [torch.cat(level, dim=0) for level in zip(*zfs)]
+        return torch.cat(zfs, dim=0)
+
+    def _search_scale(self, size):
+        w_z = size[0] + cfg.TRACK.CONTEXT_AMOUNT * np.sum(size)
+        h_z = size[1] + cfg.TRACK.CONTEXT_AMOUNT * np.sum(size)
+        s_z = np.sqrt(w_z * h_z)
+        scale_z = cfg.TRACK.EXEMPLAR_SIZE / s_z
+        s_x = s_z * (cfg.TRACK.INSTANCE_SIZE / cfg.TRACK.EXEMPLAR_SIZE)
+        return scale_z, s_x
+
+    def _update_state(self, score, pred_bbox, center_pos, size, scale_z, boundary):
+        """
+        select the best anchor with penalties, return the new state and bbox of a target
+        """
 
         def change(r):
             return np.maximum(r, 1. / r)
@@ -122,10 +249,10 @@ class SiamRPNTracker(SiameseTracker):
 
         # scale penalty
         s_c = change(sz(pred_bbox[2, :], pred_bbox[3, :]) /
-                     (sz(self.size[0] * scale_z, self.size[1] * scale_z)))
+                     (sz(size[0] * scale_z, size[1] * scale_z)))
 
         # aspect ratio penalty
-        r_c = change((self.size[0] / self.size[1]) /
+        r_c = change((size[0] / size[1]) /
                      (pred_bbox[2, :] / pred_bbox[3, :]))
         penalty = np.exp(-(r_c * s_c - 1) * cfg.TRACK.PENALTY_K)
         pscore = penalty * score
@@ -138,22 +265,20 @@ class SiamRPNTracker(SiameseTracker):
         bbox = pred_bbox[:, best_idx] / scale_z
         lr = penalty[best_idx] * score[best_idx] * cfg.TRACK.LR
 
-        cx = bbox[0] + self.center_pos[0]
-        cy = bbox[1] + self.center_pos[1]
+        cx = bbox[0] + center_pos[0]
+        cy = bbox[1] + center_pos[1]
 
         # smooth bbox
-        width = self.size[0] * (1 - lr) + bbox[2] * lr
-        height = self.size[1] * (1 - lr) + bbox[3] * lr
+        width = size[0] * (1 - lr) + bbox[2] * lr
+        height = size[1] * (1 - lr) + bbox[3] * lr
 
         # clip boundary
         cx, cy, width, height = self._bbox_clip(cx, cy, width,
-                                                height, img.shape[:2])
+                                                height, boundary)
 
         # udpate state
         best_score = score[best_idx]
         # if best_score > 0.8:
-        self.center_pos = np.array([cx, cy])
-        self.size = np.array([width, height])
         # bbox = [cx - width / 2,
         #         cy - height / 2,
         #         width,
@@ -163,7 +288,4 @@ class SiamRPNTracker(SiameseTracker):
         bbox_p2_x = bbox_p1_x + width
         bbox_p2_y = bbox_p1_y + height
         bbox = [bbox_p1_x, bbox_p1_y, bbox_p2_x, bbox_p2_y]
-        return {
-            'bbox': bbox,
-            'best_score': best_score
-        }
+        return np.array([cx, cy]), np.array([width, height]), bbox, best_score
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: transport.py
+@time: 10/19/26 9:50 PM
+@version 1.0
+@desc: shared memory transport of tracking requests and results, records are fixed-size numpy structures
+in single-producer single-consumer rings, no manager process is involved.
+"""
+import itertools
+import multiprocessing
+import os
+import threading
+from multiprocessing import context, shared_memory
+
+import numpy as np
+
+# columns of a tracking result row
+RESULT_COLUMNS = ('frame_idx', 'x1', 'y1', 'x2', 'y2', 'score')
+
+# shared memory name -> (ready, free) semaphores of rings created or attached by this process,
+# forked children inherit it, so that rings pickled into a process pool find their semaphores by name
+_SEMAPHORES = {}
+
+
+def request_dtype(max_targets):
+    return np.dtype([('request_id', np.int64), ('monitor_index', np.int32), ('frame_index', np.int64),
+                     ('multi', np.int8), ('num', np.int32), ('rect_ids', np.int32, (max_targets,)),
+                     ('rects', np.float64, (max_targets, 4)), ('post_time', np.float64)])
+
+
+def result_dtype(max_targets, window_size):
+    """
+    :param max_targets: max targets of a request
+    :param window_size: max result rows of a target
+    """
+    return np.dtype([('request_id', np.int64), ('num', np.int32), ('rect_ids', np.int32, (max_targets,)),
+                     ('lengths', np.int32, (max_targets,)),
+                     ('tracks', np.float64, (max_targets, window_size, len(RESULT_COLUMNS)))])
+
+
+class IdAllocator(object):
+    """
+    Allocate request ids unique among all processes without any lock or IPC:
+    the id is the pid of allocating process followed by a per-process sequence number.
+    """
+
+    SEQ_BITS = 32
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._init_local()
+
+    def _init_local(self):
+        self._pid = os.getpid()
+        # next() of itertools.count is atomic under GIL, so threads of a process never get the same number
+        self._seq = itertools.count()
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self._init_local()
+
+    def next(self):
+        if self._pid != os.getpid():
+            # inherited by fork
+            self._init_local()
+        return (self._pid << self.SEQ_BITS) | (next(self._seq) & ((1 << self.SEQ_BITS) - 1))
+
+
+class SharedRecordRing(object):
+    """
+    Ring of fixed-size records in shared memory with one producer process and one consumer.
+    The producer only moves head and the consumer only moves tail, both are aligned int64 so no lock is needed
+    between processes; threads of the producing process are serialized by a local lock.
+    Each commit releases a semaphore, the consumer blocks on it by wait() instead of polling, and each pop releases
+    a free-slot semaphore the producer blocks on while the ring is full.
+    Semaphores are native ones, they reach child processes by inheritance: a ring is pickled by the name of its
+    shared memory block only, and the semaphores are looked up by name in the process which unpickles it.
+    """
+
+    def __init__(self, dtype, capacity, name=None, ready=None) -> None:
+        """
+        :param dtype: numpy dtype of a record
+        :param capacity: max records in ring
+        :param name: attach to an existing ring of this process or its parents, a new ring is created if None
+        :param ready: semaphore released by each commit, rings read by one consumer may share it,
+        a new one is created if None
+        """
+        super().__init__()
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        size = 16 + self.dtype.itemsize * capacity
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+            _SEMAPHORES[self.shm.name] = (ready if ready is not None else multiprocessing.Semaphore(0),
+                                          multiprocessing.Semaphore(capacity))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self._attach_semaphores()
+        self._bind()
+        if self.owner:
+            self.index[:] = 0
+
+    def _attach_semaphores(self):
+        if self.shm.name not in _SEMAPHORES:
+            raise RuntimeError(f'Semaphores of ring [{self.shm.name}] are not inherited, '
+                               f'processes using the ring must be started after it is created.')
+        self.ready, self.free = _SEMAPHORES[self.shm.name]
+
+    def _bind(self):
+        # index[0] is head (next record to write), index[1] is tail (next record to read)
+        self.index = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        self.records = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self.shm.buf, offset=16)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = {'dtype': self.dtype, 'capacity': self.capacity, 'name': self.shm.name}
+        if context.get_spawning_popen() is not None:
+            # a spawned child inherits nothing, semaphores travel with its process arguments
+            state['semaphores'] = (self.ready, self.free)
+        return state
+
+    def __setstate__(self, state):
+        self.dtype = state['dtype']
+        self.capacity = state['capacity']
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self.owner = False
+        if 'semaphores' in state:
+            _SEMAPHORES[self.shm.name] = state['semaphores']
+        self._attach_semaphores()
+        self._bind()
+
+    def __len__(self):
+        return int(self.index[0] - self.index[1])
+
+    def reserve(self, timeout=0):
+        """
+        reserve the next record to write, fill it and then call commit()
+        :param timeout: seconds to wait for a free record, wait forever if None
+        :return: record view, None if ring is still full after timeout
+        """
+        if not self.free.acquire(timeout=timeout):
+            return None
+        self._lock.acquire()
+        return self.records[self.index[0] % self.capacity]
+
+    def commit(self):
+        """
+        publish the reserved record to consumer
+        """
+        self.index[0] += 1
+        self._lock.release()
+        self.ready.release()
+
+    def abort(self):
+        """
+        give up the reserved record
+        """
+        self._lock.release()
+        self.free.release()
+
+    def put(self, fill, timeout=0):
+        """
+        :param fill: fill(record) writes fields of a record
+        :param timeout: seconds to wait for a free record
+        :return: True if record is published
+        """
+        record = self.reserve(timeout)
+        if record is None:
+            return False
+        try:
+            fill(record)
+        except Exception:
+            self.abort()
+            raise
+        self.commit()
+        return True
+
+    def wait(self, timeout=None):
+        """
+        block until a record is committed into this ring or a ring sharing its semaphore, each commit wakes up
+        one wait(), a consumer draining several records at once may get a few wake-ups with nothing to pop
+        :param timeout: seconds, wait forever if None
+        :return: False if timeout
+        """
+        return self.ready.acquire(timeout=timeout)
+
+    def pop(self):
+        """
+        consume the oldest record
+        :return: a copy of record, None if ring is empty
+        """
+        if self.records is None:
+            raise EOFError('Ring is closed.')
+        tail = self.index[1]
+        if tail >= self.index[0]:
+            return None
+        record = self.records[tail % self.capacity].copy()
+        self.index[1] = tail + 1
+        self.free.release()
+        return record
+
+    def close(self):
+        # views must be released before the block is closed
+        self.index = None
+        self.records = None
+        self.shm.close()
+        if self.owner:
+            _SEMAPHORES.pop(self.shm.name, None)
+            self.shm.unlink()
+
+
+class CancelledRequests(object):
+    """
+    Ids of cancelled requests in shared memory, one row per monitor, used as a mapping
+    keyed by (monitor_index, request_id) in place of a manager dict.
+    Each row is written by the single requester of its monitor as a ring, the oldest cancellation is overwritten
+    once a row is full; consumers only clear the entries they take.
+    The set is pickled by the name of its shared memory block.
+    """
+
+    def __init__(self, monitor_indexes, capacity=64, name=None) -> None:
+        """
+        :param monitor_indexes: indexes of monitors
+        :param capacity: max pending cancellations of a monitor
+        :param name: attach to an existing set, a new set is created if None
+        """
+        super().__init__()
+        self.rows = {index: row for row, index in enumerate(monitor_indexes)}
+        self.capacity = capacity
+        # a head column is followed by the request ids of each row, request id 0 marks a free entry
+        size = 8 * len(self.rows) * (capacity + 1)
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self._bind()
+        if self.owner:
+            self.table[:] = 0
+
+    def _bind(self):
+        self.table = np.ndarray((len(self.rows), self.capacity + 1), dtype=np.int64, buffer=self.shm.buf)
+
+    def __getstate__(self):
+        return {'rows': self.rows, 'capacity': self.capacity, 'name': self.shm.name}
+
+    def __setstate__(self, state):
+        self.rows = state['rows']
+        self.capacity = state['capacity']
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        self.owner = False
+        self._bind()
+
+    def __len__(self):
+        return int(np.count_nonzero(self.table[:, 1:]))
+
+    def __contains__(self, key):
+        monitor_index, request_id = key
+        return bool(np.any(self.table[self.rows[monitor_index], 1:] == request_id))
+
+    def __setitem__(self, key, value):
+        monitor_index, request_id = key
+        row = self.table[self.rows[monitor_index]]
+        row[1 + row[0] % self.capacity] = request_id
+        row[0] += 1
+
+    def pop(self, key, default=None):
+        """
+        take a cancellation
+        :return: True if request was cancelled, default otherwise
+        """
+        monitor_index, request_id = key
+        entries = self.table[self.rows[monitor_index], 1:]
+        hit = np.flatnonzero(entries == request_id)
+        if not len(hit):
+            return default
+        entries[hit] = 0
+        return True
+
+    def close(self):
+        self.table = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -10,10 +10,13 @@
 @version 1.0
 @desc:
 """
+import itertools
+import shutil
 import subprocess
 import threading
 import traceback
 from multiprocessing import Manager
+from pathlib import Path
 from threading import Thread
 from typing import List
 
@@ -28,14 +31,70 @@ import time
 
 import numpy as np
 from config import VideoConfig, SystemStatus
-from utils import logger, bbox_points, generate_time_stamp
+from utils import logger, generate_time_stamp, copy_on_write, FrameGeometry
+
+# raw pixel formats of frames piped into ffmpeg, frame caches hold config.FRAME_PIX_FMTS only,
+# nv12 frames are a (height * 3 / 2, width) plane of luma followed by interleaved chroma, written by callers
+PIX_FMTS = ('rgb24', 'bgr24', 'nv12')
+
+
+def check_pix_fmt(pix_fmt):
+    if pix_fmt not in PIX_FMTS:
+        raise Exception(f'Unsupported raw pixel format [{pix_fmt}], expect one of {PIX_FMTS}.')
+    return pix_fmt
+
+
+def blank_frame(size, pix_fmt='rgb24'):
+    """
+    :param size: (width, height) of frame
+    :return: a black frame in pixel format
+    """
+    if pix_fmt == 'nv12':
+        frame = np.zeros((size[1] * 3 // 2, size[0]), dtype=np.uint8)
+        # zero chroma is green in YUV, neutral chroma is 128
+        frame[size[1]:] = 128
+        return frame
+    return np.zeros((size[1], size[0], 3), dtype=np.uint8)
+
+
+def to_bgr(frame, pix_fmt='rgb24'):
+    """
+    convert a frame into BGR for OpenCV, such as cv2.imwrite(), bgr24 frames are returned as they are
+    """
+    if pix_fmt == 'bgr24':
+        return frame
+    if pix_fmt == 'nv12':
+        return cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_NV12)
+    return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+
+class RawFrameWriter(object):
+    """
+    Write frames into stdin of ffmpeg straight from their buffers.
+    moviepy writers call tobytes() which copies every frame once more, a frame cache slot in shared memory
+    is written without any copy here, only non-contiguous views are compacted first.
+    """
+
+    def write_frame(self, img_array):
+        if not img_array.flags['C_CONTIGUOUS']:
+            img_array = np.ascontiguousarray(img_array)
+        try:
+            self.proc.stdin.write(memoryview(img_array).cast('B'))
+        except IOError as err:
+            _, ffmpeg_error = self.proc.communicate()
+            raise IOError(f'{err}\nFFMPEG encountered the following error while writing file '
+                          f'{self.filename}:\n{ffmpeg_error}')
 
 
-class FFMPEG_VideoStreamer(FFMPEG_VideoWriter):
+class FFMPEG_VideoStreamer(RawFrameWriter, FFMPEG_VideoWriter):
 
     def __init__(self, rtsp_addr, size, fps, filename='default.mp4', codec="libx264", audiofile=None, preset="medium",
                  bitrate=None,
-                 withmask=False, logfile=None, threads=None, ffmpeg_params=None):
+                 withmask=False, logfile=None, threads=None, ffmpeg_params=None, pix_fmt='rgb24', fmt='rtsp'):
+        """
+        :param pix_fmt: raw pixel format of written frames, rgb24, bgr24 or nv12
+        :param fmt: output format, rtsp by default
+        """
         super().__init__(filename, size, fps, codec, audiofile, preset, bitrate, withmask, logfile, threads,
                          ffmpeg_params)
         if logfile is None:
@@ -52,11 +111,11 @@ class FFMPEG_VideoStreamer(FFMPEG_VideoWriter):
             '-loglevel', 'error' if logfile == sp.PIPE else 'info',
             '-f', 'rawvideo',
             '-vcodec', 'rawvideo',
-            '-pix_fmt', 'rgba' if withmask else 'rgb24',
+            '-pix_fmt', 'rgba' if withmask else check_pix_fmt(pix_fmt),
             '-s', '%dx%d' % (size[0], size[1]),
             '-r', '%.02f' % fps,
             '-i', '-', '-an',
-            '-f', 'rtsp'
+            '-f', fmt
         ]
         if audiofile is not None:
             cmd.extend([
@@ -102,7 +161,7 @@ class FFMPEG_VideoStreamer(FFMPEG_VideoWriter):
         self.proc = sp.Popen(cmd, **popen_params)
 
 
-class FFMPEG_MP4Writer(FFMPEG_VideoWriter):
+class FFMPEG_MP4Writer(RawFrameWriter, FFMPEG_VideoWriter):
 
     def write(self, frame):
         self.write_frame(frame)
@@ -111,7 +170,10 @@ class FFMPEG_MP4Writer(FFMPEG_VideoWriter):
         self.close()
 
     def __init__(self, filename, size, fps, codec="libx264", audiofile=None, preset="ultrafast", bitrate=None,
-                 withmask=False, logfile=None, threads=2, ffmpeg_params=None):
+                 withmask=False, logfile=None, threads=2, ffmpeg_params=None, pix_fmt='rgb24'):
+        """
+        :param pix_fmt: raw pixel format of written frames, rgb24, bgr24 or nv12
+        """
         if logfile is None:
             logfile = sp.PIPE
 
@@ -127,7 +189,7 @@ class FFMPEG_MP4Writer(FFMPEG_VideoWriter):
             '-f', 'rawvideo',
             '-vcodec', 'rawvideo',
             '-s', '%dx%d' % (size[0], size[1]),
-            '-pix_fmt', 'rgba' if withmask else 'rgb24',
+            '-pix_fmt', 'rgba' if withmask else check_pix_fmt(pix_fmt),
             '-r', '%.02f' % fps,
             '-i', '-', '-an',
         ]
@@ -175,6 +237,247 @@ class FFMPEG_MP4Writer(FFMPEG_VideoWriter):
         #                  ffmpeg_params)
 
 
+class PooledMP4Writer(object):
+    """
+    A clip writer taken from FFMPEGWriterPool, the encoder writes into a hidden temporary file
+    which is renamed to the clip path by release().
+    """
+
+    def __init__(self, pool, writer: FFMPEG_MP4Writer, target) -> None:
+        super().__init__()
+        self.pool = pool
+        self.writer = writer
+        self.target = target
+        self.released = False
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        try:
+            self.writer.release()
+            shutil.move(self.writer.filename, str(self.target))
+        finally:
+            self.pool.finish()
+
+
+class FFMPEGWriterPool(object):
+    """
+    Keep warm ffmpeg encoder processes of a fixed resolution, so that process launch and library loading
+    are done before a clip starts instead of on the detection path.
+    An ffmpeg process can't switch its output file, so each warm process serves exactly one clip:
+    it writes into a hidden file of the pool directory that is renamed to the clip path when the clip ends,
+    and a new process is spawned to take its place.
+    Clips are limited to max_clips at the same time, start() blocks when all of them are busy,
+    clips still waiting after timeout are rejected and counted, the bound is never exceeded.
+    A pool must be created inside the process which writes clips.
+    """
+
+    def __init__(self, size, fps, work_dir, workers=2, max_clips=None, **writer_kwargs) -> None:
+        """
+        :param size: (width, height) of frames
+        :param fps: frame rate of clips
+        :param work_dir: directory of temporary files, it should be on the same file system as clips
+        :param workers: warm encoder processes kept in pool
+        :param max_clips: max clips written at the same time, equals to workers if None
+        :param writer_kwargs: options of FFMPEG_MP4Writer
+        """
+        super().__init__()
+        self.size = size
+        self.fps = fps
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(exist_ok=True, parents=True)
+        self.workers = workers
+        self.max_clips = max_clips if max_clips is not None else max(workers, 1)
+        self.writer_kwargs = writer_kwargs
+        self.slots = threading.BoundedSemaphore(self.max_clips)
+        self.warm = []
+        self.lock = threading.Lock()
+        self.seq = itertools.count()
+        self.closed = False
+        # clips rejected since all slots were busy
+        self.rejected = 0
+        for _ in range(workers):
+            self.warm.append(self._spawn())
+
+    def _spawn(self):
+        filename = self.work_dir / f'.encoding_{os.getpid()}_{next(self.seq)}.mp4'
+        return FFMPEG_MP4Writer(str(filename), self.size, self.fps, **self.writer_kwargs)
+
+    def start(self, target, timeout=None):
+        """
+        start a clip
+        :param target: clip path
+        :param timeout: seconds to wait for a free slot, wait forever if None
+        :return: PooledMP4Writer, None if all slots are still busy after timeout
+        """
+        if not self.slots.acquire(timeout=timeout):
+            with self.lock:
+                self.rejected += 1
+            return None
+        try:
+            with self.lock:
+                writer = None
+                while len(self.warm):
+                    candidate = self.warm.pop(0)
+                    # an encoder may die while waiting, e.g. killed by OOM
+                    if candidate.proc.poll() is None:
+                        writer = candidate
+                        break
+                if writer is None:
+                    writer = self._spawn()
+            return PooledMP4Writer(self, writer, target)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def finish(self):
+        """
+        called by a released clip writer, refill the pool and free a slot
+        """
+        try:
+            with self.lock:
+                if not self.closed and len(self.warm) < self.workers:
+                    self.warm.append(self._spawn())
+        finally:
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            warm, self.warm = self.warm, []
+        for writer in warm:
+            writer.release()
+            if os.path.exists(writer.filename):
+                os.remove(writer.filename)
+
+
+class Rendition(object):
+    """
+    An output of a live stream: resolution, bitrate, frame rate and target.
+    A target starting with rtsp:// is pushed to a RTSP server, any other target is a local directory of HLS playlist.
+    """
+
+    def __init__(self, target, width=-1, height=-1, bitrate=None, fps=None, preset='veryfast') -> None:
+        """
+        :param target: rtsp url or HLS directory
+        :param width: output width, -1 keeps source width or aspect ratio
+        :param height: output height, -1 keeps source height or aspect ratio
+        :param bitrate: such as 2M, encoder default if None
+        :param fps: output frame rate, source frame rate if None
+        :param preset: x264 preset
+        """
+        super().__init__()
+        self.target = target
+        self.width = width
+        self.height = height
+        self.bitrate = bitrate
+        self.fps = fps
+        self.preset = preset
+
+    @staticmethod
+    def from_dict(d):
+        return Rendition(**d)
+
+    def is_rtsp(self):
+        return str(self.target).startswith('rtsp://')
+
+    def filters(self, size, fps):
+        """
+        :return: filters of this rendition after split, null if it is the same as source
+        """
+        filters = []
+        if (self.width, self.height) != (-1, -1) and (self.width, self.height) != tuple(size):
+            # -2 keeps aspect ratio with an even size which yuv420p requires
+            w = self.width if self.width > 0 else -2
+            h = self.height if self.height > 0 else -2
+            filters.append(f'scale={w}:{h}')
+        if self.fps is not None and self.fps != fps:
+            filters.append(f'fps={self.fps}')
+        return ','.join(filters) if len(filters) else 'null'
+
+    def output_args(self, fps):
+        args = ['-vcodec', 'libx264', '-preset', self.preset, '-tune', 'zerolatency', '-pix_fmt', 'yuv420p',
+                # a key frame every 2 seconds, new viewers and HLS segments start from it
+                '-g', str(int(round((self.fps or fps) * 2)))]
+        if self.bitrate is not None:
+            # constrained bitrate, a rendition for remote users must not burst above its budget
+            args.extend(['-b:v', str(self.bitrate), '-maxrate', str(self.bitrate), '-bufsize', str(self.bitrate)])
+        if self.is_rtsp():
+            return args + ['-f', 'rtsp', str(self.target)]
+        Path(self.target).mkdir(exist_ok=True, parents=True)
+        return args + ['-f', 'hls', '-hls_time', '2', '-hls_list_size', '6',
+                       '-hls_flags', 'delete_segments', str(Path(self.target) / 'index.m3u8')]
+
+
+class FFMPEG_LadderStreamer(RawFrameWriter):
+    """
+    Encode all renditions of a live stream by one ffmpeg process.
+    Frames are piped once, decoded raw input is split and each branch is scaled and encoded for its target,
+    so frames are neither copied nor converted once per rendition.
+    """
+
+    def __init__(self, size, fps, renditions: List[Rendition], pix_fmt='rgb24', logfile=None) -> None:
+        """
+        :param size: (width, height) of frames
+        :param fps: frame rate of frames
+        :param renditions: outputs
+        :param pix_fmt: raw pixel format of written frames, rgb24, bgr24 or nv12
+        """
+        super().__init__()
+        if not len(renditions):
+            raise Exception('At least one rendition is required.')
+        if logfile is None:
+            logfile = sp.PIPE
+        self.filename = ', '.join(str(r.target) for r in renditions)
+        self.renditions = renditions
+        n = len(renditions)
+        graph = [f'[0:v]split={n}' + ''.join(f'[s{i}]' for i in range(n))]
+        graph += [f'[s{i}]{r.filters(size, fps)}[v{i}]' for i, r in enumerate(renditions)]
+        cmd = [
+            get_setting("FFMPEG_BINARY"),
+            '-y',
+            '-loglevel', 'error' if logfile == sp.PIPE else 'info',
+            '-f', 'rawvideo',
+            '-vcodec', 'rawvideo',
+            '-pix_fmt', check_pix_fmt(pix_fmt),
+            '-s', '%dx%d' % (size[0], size[1]),
+            '-r', '%.02f' % fps,
+            '-i', '-', '-an',
+            '-filter_complex', ';'.join(graph),
+        ]
+        for i, r in enumerate(renditions):
+            cmd.extend(['-map', f'[v{i}]'] + r.output_args(fps))
+        popen_params = {"stdout": DEVNULL,
+                        "stderr": logfile,
+                        "stdin": sp.PIPE}
+        if os.name == "nt":
+            popen_params["creationflags"] = 0x08000000  # CREATE_NO_WINDOW
+        self.proc = sp.Popen(cmd, **popen_params)
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            if self.proc.stderr is not None:
+                self.proc.stderr.close()
+            self.proc.wait()
+        self.proc = None
+
+
+def build_renditions(cfg: VideoConfig):
+    """
+    :return: full resolution push_to stream followed by the configured renditions of a camera
+    """
+    renditions = []
+    if cfg.push_to:
+        renditions.append(Rendition(cfg.push_to))
+    renditions.extend(Rendition.from_dict(r) for r in cfg.renditions)
+    return renditions
+
+
 class Live(object):
     def __init__(self, ffmpeg_path, file_path, rtsp_url, proto="udp", logger=None):
         '''
@@ -283,12 +586,110 @@ if __name__ == "__main__":
     # live.run()
 
 
+class StreamPacer(object):
+    """
+    Pace a live stream at a fixed frame rate by a monotonic clock, independent of how frames arrive.
+    The pacer follows the newest frame of the frame cache delay frames behind to absorb capture jitter,
+    each tick emits the next frame in order; the last frame is repeated if no frame is in reserve,
+    and frames are skipped to catch up once the stream falls more than max_lag frames behind.
+    """
+
+    def __init__(self, fps=25, delay=2, max_lag=25, name='Stream Pacer', metric_interval=60,
+                 clock=time.monotonic) -> None:
+        """
+        :param fps: output frame rate
+        :param delay: frames kept behind the newest frame
+        :param max_lag: max frames behind the newest frame before skipping
+        :param name: log prefix
+        :param metric_interval: seconds between two metric logs
+        :param clock: monotonic clock in seconds
+        """
+        super().__init__()
+        self.interval = 1 / fps
+        self.delay = delay
+        self.max_lag = max(max_lag, delay)
+        self.name = name
+        self.metric_interval = metric_interval
+        self.clock = clock
+        self.deadline = None
+        self.emitted = None
+        self.metrics = {'frames': 0, 'duplicated': 0, 'dropped': 0, 'overrun': 0, 'jitter': 0., 'max_jitter': 0.}
+        self.last_report = clock()
+
+    def wait(self):
+        """
+        sleep until the next tick
+        :return: seconds the tick is late
+        """
+        now = self.clock()
+        if self.deadline is None:
+            self.deadline = now
+        if self.deadline > now:
+            time.sleep(self.deadline - now)
+            now = self.clock()
+        late = now - self.deadline
+        if late > self.interval:
+            # writing is slower than fps, start a new schedule instead of bursting to make up the lost ticks
+            self.metrics['overrun'] += 1
+            self.deadline = now
+        self.deadline += self.interval
+        self.metrics['jitter'] += late
+        self.metrics['max_jitter'] = max(self.metrics['max_jitter'], late)
+        return late
+
+    def next_index(self, latest):
+        """
+        choose the frame of current tick
+        :param latest: the newest frame index in frame cache, negative if no frame has arrived
+        :return: frame index, the same as the last tick if the last frame is repeated, None if no frame yet
+        """
+        self.metrics['frames'] += 1
+        if self.emitted is None:
+            if latest < 0:
+                return None
+            self.emitted = max(latest - self.delay, 0)
+        elif self.emitted >= latest - self.delay:
+            # keep delay frames in reserve, a stall shorter than that is never seen in output
+            self.metrics['duplicated'] += 1
+        elif latest - self.emitted > self.max_lag:
+            target = latest - self.delay
+            self.metrics['dropped'] += target - self.emitted - 1
+            self.emitted = target
+        else:
+            self.emitted += 1
+        return self.emitted
+
+    def skip(self):
+        """
+        the chosen frame is unavailable, e.g. lapped in frame cache, repeat the last frame instead
+        """
+        self.metrics['dropped'] += 1
+        self.metrics['duplicated'] += 1
+
+    def report(self, force=False):
+        if not force and self.clock() - self.last_report <= self.metric_interval:
+            return None
+        self.last_report = self.clock()
+        m = dict(self.metrics)
+        mean_jitter = m['jitter'] / m['frames'] if m['frames'] else 0
+        logger.info(f'{self.name}: frames [{m["frames"]}], duplicated [{m["duplicated"]}], '
+                    f'dropped [{m["dropped"]}], overrun [{m["overrun"]}], '
+                    f'mean jitter [{round(mean_jitter * 1000, 2)}]ms, max jitter [{round(m["max_jitter"] * 1000, 2)}]ms')
+        return m
+
+
 class PushStreamer(object):
-    def __init__(self, cfg: VideoConfig, stream_stack: List) -> None:
+    # frames drawn with boxes of a detection
+    RECT_HOLD_FRAMES = 36
 
+    def __init__(self, cfg: VideoConfig, stream_stack: List) -> None:
+        """
+        :param stream_stack: [frame cache, Manager().list() of (frame index, rects of each detection result)]
+        """
         super().__init__()
         self.cfg = cfg
         self.stream_stack = stream_stack
+        self.geometry = FrameGeometry(cfg)
         self.LOG_PREFIX = f'Push Streamer [{self.cfg.index}]: '
         self.quit = Manager().Event()
         self.quit.clear()
@@ -299,105 +700,89 @@ class PushStreamer(object):
             self.status.set(SystemStatus.SHUT_DOWN)
             # self.stream_render.quit.set()
 
+    def pop_detections(self):
+        """
+        :return: all (frame index, rects) posted by controller since the last call, in order
+        """
+        detections = self.stream_stack[1]
+        n = len(detections)
+        if not n:
+            return []
+        posted = detections[:n]
+        # controller only appends, so the first n items are exactly the popped ones
+        del detections[:n]
+        return posted
+
+    def draw(self, frame, rects_list):
+        # frame is a read-only view of the shared cache, draw on a private copy
+        frame = copy_on_write(frame)
+        for rects in rects_list:
+            boxes = self.geometry.square_boxes(rects)
+            for box in boxes:
+                color = np.random.randint(0, 255, size=(3,))
+                color = [int(c) for c in color]
+                p1, p2 = (int(box[0]), int(box[1])), (int(box[2]), int(box[3]))
+                cv2.putText(frame, 'Asaeorientalis', p1,
+                            cv2.FONT_HERSHEY_COMPLEX, 2, color, 2, cv2.LINE_AA)
+                cv2.rectangle(frame, p1, p2, color, 2)
+        return frame
+
     def push_stream(self):
         logger.info(
             f'*******************************Controller [{self.cfg.index}]: Init push stream service********************************')
-        draw_cnt = 0
-        tmp_results = []
-        video_streamer = FFMPEG_VideoStreamer(self.cfg.push_to, size=(self.cfg.shape[1], self.cfg.shape[0]), fps=25,
-                                              codec='h264', )
-        video_streamer.write_frame(np.zeros((self.cfg.shape[1], self.cfg.shape[0], 3), dtype=np.uint8))
-        # time.sleep(6)
-        pre_index = 0
+        frame_cache = self.stream_stack[0]
+        size = (self.cfg.shape[1], self.cfg.shape[0])
+        # frames are pushed in the pixel format they are stored, ffmpeg converts them while encoding
+        if len(self.cfg.renditions):
+            video_streamer = FFMPEG_LadderStreamer(size, self.cfg.fps, build_renditions(self.cfg),
+                                                   pix_fmt=self.cfg.frame_pix_fmt)
+        else:
+            video_streamer = FFMPEG_VideoStreamer(self.cfg.push_to, size=size, fps=self.cfg.fps, codec='h264',
+                                                  pix_fmt=self.cfg.frame_pix_fmt)
+        pacer = StreamPacer(self.cfg.fps, self.cfg.push_delay_frames, self.cfg.push_max_lag,
+                            name=self.LOG_PREFIX + 'Pacer')
         threading.Thread(target=self.listen, daemon=True).start()
+        # detections waiting for their frame, and the one being drawn
+        detections = []
+        drawing = None
+        frame = blank_frame(size, self.cfg.frame_pix_fmt)
+        index = None
         while self.status.get() == SystemStatus.RUNNING:
             try:
-                ps = time.time()
-                # if self.status.get() == SystemStatus.SHUT_DOWN:
-                #     video_streamer.close()
-                #     break
-                # se = 1 / (time.time() - ps)
-                # logger.debug(self.LOG_PREFIX + f'Get Signal Speed Rate: [{round(se, 2)}]/FPS')
-                # gs = time.time()
-                if self.cfg.use_sm:
-                    # 4K frame has large size, get it from shared memory instead pipe serialization between
-                    # multi-processes
-                    frame = self.stream_stack[0][0]
-                    # current index and other info are smaller than frame buffer,so we can use Manager().list()
-                    if not len(self.stream_stack[1]):
-                        continue
-                    proc_res, frame_index = self.stream_stack[1].pop()
-                else:
-                    # if frame shape is 4K, obtain FPS from Manager().list is around 10,which is over slow than video fps(25)
-                    # it causes much latent when pushing stream
-                    if not len(self.stream_stack):
-                        continue
-                    frame, proc_res, frame_index = self.stream_stack.pop()
-                    logger.debug(f'Push Streamer [{self.cfg.index}]: Cache queue size: [{len(self.stream_stack)}]')
-
-                if not self.cfg.use_sm and len(self.stream_stack) > 1000:
-                    self.stream_stack[:] = []
-                    logger.info(self.LOG_PREFIX + 'Too much frames blocked in stream queue.Cleared')
+                if index is None and frame_cache.latest() < 0:
+                    # nothing to stream before the first frame arrives, no need to pace
+                    video_streamer.write_frame(frame)
+                    frame_cache.wait(0, timeout=1)
                     continue
-
-                if pre_index < frame_index:
-                    pre_index = frame_index
-                else:
-                    continue
-
-                # end = 1 / (time.time() - gs)
-                # logger.debug(self.LOG_PREFIX + f'Get Frame Speed Rate: [{round(end, 2)}]/FPS')
-                detect_flag = (proc_res is not None and proc_res.detect_flag)
-                # logger.info(f'Draw cnt: [{draw_cnt}]')
-                # if proc_res is not None:
-                #     logger.info(f'Detect flag: [{proc_res.detect_flag}]')
-                # ds = time.time()
-                if detect_flag:
-                    # logger.info('Detect flag~~~~~~~~~~')
-                    draw_cnt = 0
-                    tmp_results = proc_res.results
-                is_draw_over = draw_cnt <= 36
-                if is_draw_over:
-                    # logger.info('Draw next frames~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-                    for r in tmp_results:
-                        for rect in r.rects:
-                            color = np.random.randint(0, 255, size=(3,))
-                            color = [int(c) for c in color]
-                            p1, p2 = bbox_points(self.cfg, rect, frame.shape)
-                            # p1 = (int(rect[0]), int(rect[1]))
-                            # p2 = (int(rect[2]), int(rect[3]))
-
-                            cv2.putText(frame, 'Asaeorientalis', p1,
-                                        cv2.FONT_HERSHEY_COMPLEX, 2, color, 2, cv2.LINE_AA)
-                            cv2.rectangle(frame, p1, p2, color, 2)
-                            # if self.server_cfg.detect_mode == ModelType.SSD:
-                            #     cv2.putText(frame, str(round(r[4], 2)), (p2[0], p2[1]),
-                            #                 cv2.FONT_HERSHEY_COMPLEX, 2, color, 2, cv2.LINE_AA)
-                    draw_cnt += 1
-                if self.cfg.write_timestamp:
-                    time_stamp = generate_time_stamp("%Y-%m-%d %H:%M:%S")
-                    cv2.putText(frame, time_stamp, (100, 100),
-                                cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 2, cv2.LINE_AA)
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                # de = 1 / (time.time() - ds)
-                # logger.debug(self.LOG_PREFIX + f'Draw Speed Rate: [{round(de, 2)}]/FPS')
-                # logger.info(f'Frame index [{frame_index}]')
-                # if frame_index % self.cfg.sample_rate == 0:
-                #     for _ in range(2):
-                #         video_streamer.write_frame(frame)
-                # else:
-                #     video_streamer.write_frame(frame)
-                # end = 1 / (time.time() - ps)
-                # ws = time.time()
+                pacer.wait()
+                next_index = pacer.next_index(frame_cache.latest())
+                if next_index != index:
+                    index = next_index
+                    detections.extend(self.pop_detections())
+                    while len(detections) and detections[0][0] <= index:
+                        drawing = detections.pop(0)
+                    current = frame_cache.get(index)
+                    if current is None:
+                        # lapped by capture, repeat the last frame
+                        pacer.skip()
+                    else:
+                        # the last emitted frame is repeated while capture stalls or laps, it must be a private
+                        # copy instead of a view of a slot being overwritten, get() of frame caches returns one
+                        frame = copy_on_write(current)
+                        # boxes are held for RECT_HOLD_FRAMES frames after detection
+                        if drawing is not None and index - drawing[0] <= self.RECT_HOLD_FRAMES:
+                            frame = self.draw(frame, drawing[1])
+                        if self.cfg.write_timestamp:
+                            time_stamp = generate_time_stamp("%Y-%m-%d %H:%M:%S")
+                            cv2.putText(frame, time_stamp, (100, 100),
+                                        cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 2, cv2.LINE_AA)
                 video_streamer.write_frame(frame)
-                # w_end = 1 / (time.time() - ws)
-                end = 1 / (time.time() - ps)
-                # logger.debug(self.LOG_PREFIX + f'Writing Speed Rate: [{round(w_end, 2)}]/FPS')
-                logger.info(f'Streamer [{self.cfg.index}]: Streaming Speed Rate: [{round(end, 2)}]/FPS')
+                pacer.report()
             except Exception as e:
                 logger.error(e)
-                traceback.print_stack()
-                # logger.warning(e)
+                traceback.print_exc()
+        pacer.report(force=True)
+        video_streamer.close()
         logger.info(
             '*******************************Controller [{}]:  Push stream service exit********************************'.format(
                 self.cfg.index))
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: segment.py
+@time: 10/19/26 11:40 PM
+@version 1.0
+@desc: continuous recording of a camera into short rolling segments, event clips are cut from them by stream copy.
+Segments are aligned to frame indices: segment n holds frames [n * segment_frames, (n + 1) * segment_frames),
+so any process can find the segments of a frame range from the directory alone.
+"""
+import os
+import queue
+import re
+import subprocess as sp
+import threading
+import time
+from pathlib import Path
+
+from moviepy.compat import DEVNULL
+from moviepy.config import get_setting
+
+from utils import logger
+
+SEGMENT_PATTERN = re.compile(r'^seg_(\d+)\.mkv$')
+
+
+def segment_path(segment_dir, number):
+    return Path(segment_dir) / f'seg_{number:010d}.mkv'
+
+
+def list_segments(segment_dir):
+    """
+    :return: sorted numbers of segments in directory
+    """
+    numbers = []
+    for name in os.listdir(str(segment_dir)):
+        matched = SEGMENT_PATTERN.match(name)
+        if matched:
+            numbers.append(int(matched.group(1)))
+    return sorted(numbers)
+
+
+class SegmentRecorder(object):
+    """
+    Encode every frame of a camera once into rolling matroska segments.
+    Frames are read from the shared frame cache by a background thread, so the capture thread only posts indices.
+    Recording (re)starts at the next index aligned to a segment boundary whenever the frame sequence breaks,
+    e.g. the recorder lags behind more than the frame cache keeps, and the segment broken by it is dropped.
+    Only the newest keep segments are kept in directory.
+    """
+
+    def __init__(self, segment_dir, frame_cache, size, fps=25, duration=2, keep=30, cache_size=None,
+                 codec='libx264', preset='ultrafast', pix_fmt='rgb24') -> None:
+        """
+        :param segment_dir: directory of segments, a tmpfs directory such as /dev/shm/... avoids disk writes
+        :param frame_cache: frame cache indexed by global frame index
+        :param size: (width, height) of frames
+        :param fps: nominal frame rate of stream
+        :param duration: seconds of a segment
+        :param keep: max segments kept in directory
+        :param cache_size: frames kept by frame_cache, older frames are skipped
+        :param pix_fmt: raw pixel format of frames in frame_cache, rgb24 or bgr24
+        """
+        super().__init__()
+        self.segment_dir = Path(segment_dir)
+        self.segment_dir.mkdir(exist_ok=True, parents=True)
+        self.frame_cache = frame_cache
+        self.size = size
+        self.fps = fps
+        self.segment_frames = int(round(fps * duration))
+        self.keep = keep
+        self.cache_size = cache_size
+        self.codec = codec
+        self.preset = preset
+        self.pix_fmt = pix_fmt
+        self.proc = None
+        self.next_index = None
+        self.latest = -1
+        self.indices = queue.Queue()
+        self.thread = threading.Thread(target=self.record, daemon=True)
+        self.thread.start()
+
+    def feed(self, index):
+        """
+        post a frame index which has been written into frame cache, called by the capture thread
+        """
+        self.latest = index
+        self.indices.put(index)
+
+    def open(self, index):
+        number = index // self.segment_frames
+        cmd = [
+            get_setting("FFMPEG_BINARY"),
+            '-y',
+            '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-vcodec', 'rawvideo',
+            '-s', '%dx%d' % (self.size[0], self.size[1]),
+            '-pix_fmt', self.pix_fmt,
+            '-r', '%.02f' % self.fps,
+            '-i', '-', '-an',
+            '-vcodec', self.codec,
+            '-preset', self.preset,
+            '-pix_fmt', 'yuv420p',
+            # a key frame at each segment boundary, so that segments are cut exactly there
+            '-force_key_frames', f'expr:gte(n,n_forced*{self.segment_frames})',
+            '-f', 'segment',
+            '-segment_time', '%.06f' % (self.segment_frames / self.fps),
+            '-segment_format', 'matroska',
+            '-segment_start_number', str(number),
+            '-reset_timestamps', '1',
+            str(self.segment_dir / 'seg_%010d.mkv'),
+        ]
+        self.proc = sp.Popen(cmd, stdin=sp.PIPE, stdout=DEVNULL, stderr=DEVNULL)
+        self.next_index = index
+        logger.info(f'Segment Recorder: start recording at frame [{index}], segment [{number}].')
+
+    def close(self, drop_partial=False):
+        """
+        :param drop_partial: remove the current segment if it ends early, so that every segment left in directory
+        holds all of its frames
+        """
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait()
+            except Exception as e:
+                logger.error(e)
+            if drop_partial and self.next_index % self.segment_frames != 0:
+                try:
+                    os.remove(str(segment_path(self.segment_dir, self.next_index // self.segment_frames)))
+                except OSError:
+                    pass
+        self.proc = None
+        self.next_index = None
+
+    def clean(self, number):
+        for old in list_segments(self.segment_dir):
+            if old > number - self.keep:
+                break
+            try:
+                os.remove(str(segment_path(self.segment_dir, old)))
+            except OSError:
+                pass
+
+    def write(self, index):
+        lagged = self.cache_size is not None and self.latest - index >= self.cache_size
+        if self.proc is not None and (index != self.next_index or lagged or self.proc.poll() is not None):
+            # sequence breaks, current segment ends early
+            logger.info(f'Segment Recorder: frame sequence breaks at [{index}], restart recording.')
+            self.close(drop_partial=True)
+        if lagged:
+            return
+        if self.proc is None and index % self.segment_frames != 0:
+            return
+        # verified copy of the slot, a frame lapped by the writer can't be recorded
+        frame = self.frame_cache.get(index)
+        if frame is None:
+            logger.info(f'Segment Recorder: frame [{index}] was overwritten, restart recording.')
+            self.close(drop_partial=True)
+            return
+        if self.proc is None:
+            self.open(index)
+        if index % self.segment_frames == 0:
+            self.clean(index // self.segment_frames)
+        self.proc.stdin.write(memoryview(frame).cast('B'))
+        self.next_index = index + 1
+
+    def record(self):
+        while True:
+            index = self.indices.get()
+            if index is None:
+                break
+            try:
+                self.write(index)
+            except Exception as e:
+                logger.error(e)
+                self.close()
+        self.close()
+
+    def stop(self):
+        self.indices.put(None)
+        self.thread.join()
+
+
+def cut_clip(segment_dir, segment_frames, start_index, end_index, target, timeout=30, event_index=None):
+    """
+    join segments covering a frame range into a clip by stream copy, no frame is re-encoded.
+    The clip is aligned to segment boundaries, so it may be up to a segment longer at both ends.
+    If some segments of the range are missing, only the contiguous segments around the event are joined.
+    :param segment_dir: directory of SegmentRecorder
+    :param segment_frames: frames of a segment
+    :param start_index: first frame of clip
+    :param end_index: end frame of clip, exclusive
+    :param target: clip path
+    :param timeout: seconds to wait for the last segment to be completed
+    :param event_index: frame of the event, start_index if None
+    :return: (first, end) frame indices of clip, end is exclusive, None if no clip is written
+    """
+    first = start_index // segment_frames
+    last = (end_index - 1) // segment_frames
+    event = (start_index if event_index is None else event_index) // segment_frames
+    # a segment is completed once a later one is opened
+    deadline = time.time() + timeout
+    while True:
+        numbers = list_segments(segment_dir)
+        if len(numbers) and numbers[-1] > last:
+            break
+        if time.time() >= deadline:
+            logger.info(f'Segment Recorder: wait segment [{last}] time out, cut the recorded part.')
+            break
+        time.sleep(0.1)
+    numbers = set(numbers)
+    if event not in numbers:
+        return None
+    # segments on both sides of a gap are not continuous in time, they are never joined
+    begin = event
+    while begin > first and begin - 1 in numbers:
+        begin -= 1
+    end = event
+    while end < last and end + 1 in numbers:
+        end += 1
+    if end - begin < last - first:
+        logger.info(f'Segment Recorder: segments of frames [{start_index}, {end_index}) are missing, '
+                    f'cut frames [{begin * segment_frames}, {(end + 1) * segment_frames}) only.')
+    covered = list(range(begin, end + 1))
+    list_file = Path(segment_dir) / f'.concat_{os.getpid()}_{threading.get_ident()}.txt'
+    with open(str(list_file), 'w') as f:
+        for n in covered:
+            f.write(f"file '{segment_path(segment_dir, n).resolve()}'\n")
+    cmd = [
+        get_setting("FFMPEG_BINARY"),
+        '-y',
+        '-loglevel', 'error',
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', str(list_file),
+        '-c', 'copy',
+        '-movflags', '+faststart',
+        str(target),
+    ]
+    try:
+        if sp.run(cmd, stdout=DEVNULL, stderr=sp.PIPE).returncode != 0:
+            return None
+        return begin * segment_frames, (end + 1) * segment_frames
+    finally:
+        os.remove(str(list_file))
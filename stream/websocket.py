@@ -172,7 +172,7 @@ def creat_detect_msg_json(video_stream, channel, timestamp, rects, dol_id, camer
     return msg_json
 
 
-def creat_packaged_msg_json(filename, path, cfg: VideoConfig, camera_id, channel, preview_name):
+def creat_packaged_msg_json(filename, path, cfg: VideoConfig, camera_id, channel, preview_name, track_name=None):
     url = os.path.join(cfg.dip, 'video', cfg.date, str(cfg.index), filename)
     preview = os.path.join(cfg.dip, 'preview', cfg.date, str(cfg.index), preview_name)
     msg = {
@@ -188,5 +188,8 @@ def creat_packaged_msg_json(filename, path, cfg: VideoConfig, camera_id, channel
             'preview': preview
         }
     }
+    if track_name is not None:
+        # bbox track of the clip, it lives beside the clip
+        msg['data']['track'] = os.path.join(cfg.dip, 'video', cfg.date, str(cfg.index), track_name)
     msg_json = json.dumps(msg)
     return msg_json
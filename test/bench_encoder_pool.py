@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_encoder_pool.py
+@time: 10/19/26 11:20 PM
+@version 1.0
+@desc: clip turnaround at 1080p and 4K, a new encoder per clip versus warm encoders of FFMPEGWriterPool.
+Turnaround is from the clip request to the clip file being complete, the first frame latency is the time
+to open the writer and push the first frame.
+usage: python test/bench_encoder_pool.py [clips] [frames]
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from stream.rtsp import FFMPEG_MP4Writer, FFMPEGWriterPool
+
+
+def clip(open_writer, frames):
+    s = time.time()
+    writer = open_writer()
+    writer.write(frames[0])
+    first = time.time() - s
+    for frame in frames[1:]:
+        writer.write(frame)
+    writer.release()
+    return first, time.time() - s
+
+
+def bench(name, open_writer, frames, clips):
+    results = np.array([clip(lambda: open_writer(i), frames) for i in range(clips)])
+    first, total = results.mean(axis=0) * 1000
+    print(f'{name}: first frame [{round(first, 1)}] ms, turnaround [{round(total, 1)}] ms')
+
+
+if __name__ == '__main__':
+    clips = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    num = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rng = np.random.RandomState(0)
+    for label, (w, h) in [('1080p', (1920, 1080)), ('4K', (3840, 2160))]:
+        base = rng.randint(0, 255, size=(h, w, 3)).astype(np.uint8)
+        frames = [np.roll(base, i * 4, axis=1) for i in range(num)]
+        with tempfile.TemporaryDirectory() as work_dir:
+            bench(f'{label} new encoder', lambda i: FFMPEG_MP4Writer(f'{work_dir}/cold_{i}.mp4', (w, h), 25),
+                  frames, clips)
+            pool = FFMPEGWriterPool((w, h), 25, work_dir, workers=2)
+            # let warm encoders finish launching as they would between events
+            time.sleep(1)
+            bench(f'{label} warm encoder', lambda i: pool.start(f'{work_dir}/warm_{i}.mp4'), frames, clips)
+            pool.close()
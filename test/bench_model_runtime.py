@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_model_runtime.py
+@time: 10/19/26 11:00 PM
+@version 1.0
+@desc: CPU latency of detector, classifier and tracker models with and without model runtime.
+Weights are random, only speed is measured.
+usage: python test/bench_model_runtime.py [threads] [iterations]
+"""
+import sys
+import time
+
+import numpy as np
+import torch
+import torchvision
+
+from config import PROJECT_DIR
+from detection.ssd.ssd import build_ssd
+from pysot.core.config import cfg
+from pysot.models.model_builder import ModelBuilder
+from pysot.tracker.siamrpn_tracker import SiamRPNTracker
+from utils.runtime import ModelRuntime
+
+
+def timeit(fn, iterations):
+    fn()
+    s = time.time()
+    for _ in range(iterations):
+        fn()
+    return (time.time() - s) / iterations * 1000
+
+
+def ssd(runtime: ModelRuntime, baseline):
+    # train phase returns raw head outputs, the legacy Detect function does not run on recent torch
+    net = build_ssd('train', torch.device('cpu'), 300, 2)
+    x = torch.rand(1, 3, 300, 300)
+    if baseline:
+        return lambda: net(x)
+    net = runtime.prepare(net)
+    x = runtime.input(x)
+    return lambda: runtime.run(net, x)
+
+
+def classifier(runtime: ModelRuntime, baseline):
+    net = torchvision.models.resnet50(num_classes=2).eval()
+    x = torch.rand(1, 3, 224, 224)
+    if baseline:
+        return lambda: net(x)
+    net = runtime.prepare(net)
+    x = runtime.input(x)
+    return lambda: runtime.run(net, x)
+
+
+def tracker(runtime: ModelRuntime, baseline):
+    cfg.merge_from_file(str(PROJECT_DIR / 'pysot/configs/config.yaml'))
+    model = ModelBuilder().eval()
+    # keep random box regression in a sane range
+    for m in model.rpn_head.modules():
+        if isinstance(m, torch.nn.Conv2d):
+            m.weight.data.mul_(0.01)
+    if not baseline:
+        model = runtime.prepare(model, channels_last=False)
+    t = SiamRPNTracker(model, torch.device('cpu'))
+    frame = np.random.randint(0, 255, size=(1080, 1920, 3), dtype=np.uint8)
+    t.init(frame, [900, 500, 60, 40])
+    if baseline:
+        return lambda: t.track(frame)
+    return lambda: runtime.run(t.track, frame)
+
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    runtime = ModelRuntime(num_threads=threads, channels_last=True, fuse_bn=True)
+    runtime.setup_process()
+    for name, build in [('ssd', ssd), ('classifier', classifier), ('tracker', tracker)]:
+        base = timeit(build(runtime, True), iterations)
+        opt = timeit(build(runtime, False), iterations)
+        print(f'{name}: baseline [{round(base, 1)}] ms, runtime [{round(opt, 1)}] ms, '
+              f'speed up [{round(base / opt, 2)}]x, threads [{threads}]')
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_post_filter_profile.py
+@time: 10/20/26 5:30 AM
+@version 1.0
+@desc: compare a post filter profile with the full-rate analysis over a folder of stored clips,
+reports decision agreement and speedup, frames are decoded once before timing.
+usage: python test/bench_post_filter_profile.py [clip_dir [scale stride [video_cfg]]]
+video_cfg is vcfg/test/video-11.yml by default, its roi and resize must suit the clips.
+without a clip directory, synthetic clips of a dolphin, a float, a bird and empty water are used.
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from config import PROJECT_DIR, VideoConfig
+from detection.render import Filter
+from stream.rtsp import FFMPEG_MP4Writer
+
+
+def load_cfg(path, shape, **kwargs):
+    with open(str(path)) as f:
+        cfg = VideoConfig.from_yaml(yaml.safe_load(f))
+    cfg.shape = list(shape)
+    cfg.show_window = False
+    for k, v in kwargs.items():
+        setattr(cfg, k, v)
+    return cfg
+
+
+def synthetic_clips(clip_dir, shape=(540, 960, 3)):
+    rng = np.random.RandomState(0)
+    # (name, frames, first frame of target, last frame of target, x speed per frame)
+    events = [('dolphin', 50, 15, 40, 2), ('float', 75, 0, 75, 1), ('bird', 50, 10, 30, 40), ('empty', 50, 0, 0, 0)]
+    for name, n, begin, end, speed in events:
+        writer = FFMPEG_MP4Writer(str(clip_dir / f'{name}.mp4'), (shape[1], shape[0]), 25, pix_fmt='bgr24')
+        for i in range(n):
+            frame = (150 + rng.randint(-10, 10, size=shape)).astype(np.uint8)
+            if begin <= i < end:
+                x = 100 + speed * (i - begin)
+                frame[300:330, x:x + 60] = 30
+            writer.write(frame)
+        writer.release()
+
+
+def read_frames(path):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    grabbed, frame = cap.read()
+    while grabbed:
+        frames.append((len(frames), frame))
+        grabbed, frame = cap.read()
+    cap.release()
+    return frames
+
+
+def run(post_filter, frames):
+    s = time.time()
+    decision, _ = post_filter.post_filter_frames(frames, 0)
+    return decision, time.time() - s
+
+
+def compare(clip_dir, scale, stride, cfg_path):
+    clips = sorted(p for p in Path(clip_dir).iterdir() if p.suffix.lower() in ['.mp4', '.avi', '.mkv'])
+    if not len(clips):
+        print(f'No clip in [{clip_dir}].')
+        return
+    shape = read_frames(clips[0])[0][1].shape
+    with tempfile.TemporaryDirectory() as region_path:
+        # each filter keeps its own float history across clips, as a camera does
+        full = Filter(load_cfg(cfg_path, shape), Path(region_path))
+        profile = Filter(load_cfg(cfg_path, shape, post_filter_scale=scale, post_filter_stride=stride),
+                         Path(region_path))
+        agree, full_time, profile_time = 0, 0., 0.
+        for clip in clips:
+            frames = read_frames(clip)
+            full_decision, ft = run(full, frames)
+            profile_decision, pt = run(profile, frames)
+            agree += full_decision == profile_decision
+            full_time += ft
+            profile_time += pt
+            print(f'{clip.name}: full [{full_decision}] in [{round(ft, 2)}]s, '
+                  f'profile [{profile_decision}] in [{round(pt, 2)}]s')
+    print(f'scale [{scale}], stride [{stride}]: decision agreement [{agree}/{len(clips)}], '
+          f'speedup [{round(full_time / max(profile_time, 1e-6), 2)}]x')
+
+
+if __name__ == '__main__':
+    scale = float(sys.argv[2]) if len(sys.argv) > 3 else 0.5
+    stride = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    cfg_path = sys.argv[4] if len(sys.argv) > 4 else PROJECT_DIR / 'vcfg/test/video-11.yml'
+    if len(sys.argv) > 1:
+        compare(sys.argv[1], scale, stride, cfg_path)
+    else:
+        with tempfile.TemporaryDirectory() as clip_dir:
+            synthetic_clips(Path(clip_dir))
+            # synthetic clips are full frames of 960 x 540
+            with open(str(cfg_path)) as f:
+                yml = yaml.safe_load(f)
+            yml.update(roi={'x': 0, 'y': 0, 'width': -1, 'height': -1},
+                       resize={'width': 480, 'height': -1, 'scale': -1})
+            synthetic_cfg = Path(clip_dir) / 'video.yml'
+            with open(str(synthetic_cfg), 'w') as f:
+                yaml.safe_dump(yml, f)
+            compare(clip_dir, scale, stride, synthetic_cfg)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_push_stream.py
+@time: 10/20/26 1:30 AM
+@version 1.0
+@desc: streaming speed of 4K frames from a shared memory frame cache into ffmpeg,
+colour conversion plus tobytes() as PushStreamer did before, against frames piped as they are stored.
+usage: python test/bench_push_stream.py [frames [width height]]
+output is discarded by the null muxer, 'pipe only' passes frames through without encoding.
+"""
+import sys
+import time
+from multiprocessing.managers import SharedMemoryManager
+
+import cv2
+import numpy as np
+
+from stream.rtsp import FFMPEG_VideoStreamer
+from utils.cache import SharedMemoryFrameCache
+
+
+def converted(streamer, frame):
+    streamer.proc.stdin.write(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).tobytes())
+
+
+def raw(streamer, frame):
+    streamer.write_frame(frame)
+
+
+def bench(label, cache, size, frames, write, codec, params):
+    streamer = FFMPEG_VideoStreamer('-', size, 25, codec=codec, preset='ultrafast', fmt='null',
+                                    pix_fmt='bgr24', ffmpeg_params=params)
+    s = time.time()
+    for i in range(frames):
+        write(streamer, cache[i % cache.cache_size])
+    streamer.proc.stdin.close()
+    streamer.proc.wait()
+    e = time.time() - s
+    print(f'{label}: [{round(frames / e, 2)}]/FPS')
+
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    w, h = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (3840, 2160)
+    shape = (h, w, 3)
+    with SharedMemoryManager() as smm:
+        cache = SharedMemoryFrameCache(smm, 8, h * w * 3, shape)
+        rng = np.random.RandomState(0)
+        for i in range(cache.cache_size):
+            cache[i] = rng.randint(0, 255, size=shape, dtype=np.uint8)
+        for codec, params, name in [('rawvideo', None, 'pipe only'), ('libx264', ['-tune', 'zerolatency'], 'h264')]:
+            bench(f'{name}, cvtColor + tobytes', cache, (w, h), frames, converted, codec, params)
+            bench(f'{name}, raw pix_fmt from shared memory', cache, (w, h), frames, raw, codec, params)
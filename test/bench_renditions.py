@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_renditions.py
+@time: 10/20/26 3:20 AM
+@version 1.0
+@desc: ffmpeg CPU time per rendition count, one process splitting the input against one process per rendition.
+usage: python test/bench_renditions.py [frames [width height]]
+renditions are written as HLS into a temporary directory.
+"""
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from stream.rtsp import FFMPEG_LadderStreamer, Rendition
+
+LADDER = [dict(bitrate='4M'), dict(width=1280, height=720, bitrate='2M'),
+          dict(width=854, height=480, bitrate='800k', fps=15), dict(width=640, height=360, bitrate='400k', fps=10)]
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench(streamers, frames):
+    c, s = children_cpu(), time.time()
+    for frame in frames:
+        for streamer in streamers:
+            streamer.write_frame(frame)
+    for streamer in streamers:
+        streamer.close()
+    return children_cpu() - c, time.time() - s
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    w, h = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (1920, 1080)
+    rng = np.random.RandomState(0)
+    base = rng.randint(0, 255, size=(h, w, 3), dtype=np.uint8)
+    # a moving pattern, a static frame is too cheap to encode
+    frames = [np.roll(base, i * 8, axis=1) for i in range(n)]
+    with tempfile.TemporaryDirectory() as work_dir:
+        for count in range(1, len(LADDER) + 1):
+            renditions = [Rendition(f'{work_dir}/{count}_{i}', **r) for i, r in enumerate(LADDER[:count])]
+            cpu, elapse = bench([FFMPEG_LadderStreamer((w, h), 25, renditions, pix_fmt='bgr24')], frames)
+            print(f'[{count}] renditions, one process: CPU [{round(cpu / n * 1000, 1)}]ms/frame, '
+                  f'[{round(n / elapse, 2)}]/FPS')
+            renditions = [Rendition(f'{work_dir}/{count}_sep_{i}', **r) for i, r in enumerate(LADDER[:count])]
+            cpu, elapse = bench([FFMPEG_LadderStreamer((w, h), 25, [r], pix_fmt='bgr24') for r in renditions], frames)
+            print(f'[{count}] renditions, a process each: CPU [{round(cpu / n * 1000, 1)}]ms/frame, '
+                  f'[{round(n / elapse, 2)}]/FPS')
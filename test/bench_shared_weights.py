@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_shared_weights.py
+@time: 10/19/26 11:50 PM
+@version 1.0
+@desc: startup time and memory of camera processes, each loading its checkpoint versus binding
+a checkpoint shared by monitor. Processes are pool workers as in the monitor.
+RSS counts shared pages in every process, PSS splits them among processes.
+usage: python test/bench_shared_weights.py [cameras] [checkpoint]
+without a checkpoint a random resnet101 state dict is used.
+"""
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import torch
+import torchvision
+
+from utils.runtime import SharedCheckpoint
+
+
+def memory():
+    """
+    :return: rss, pss in MB of current process
+    """
+    stats = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                stats[parts[0][:-1]] = int(parts[1]) / 1024
+    return stats['Rss'], stats['Pss']
+
+
+def build(path, checkpoint, barrier):
+    s = time.time()
+    model = torchvision.models.resnet101()
+    if checkpoint is not None:
+        checkpoint.bind(model)
+    else:
+        model.load_state_dict(torch.load(path))
+    model.eval()
+    e = time.time() - s
+    # hold the model until all cameras are up, so that memory is measured with every process alive
+    barrier.wait()
+    rss, pss = memory()
+    barrier.wait()
+    return e, rss, pss
+
+
+def bench(pool, manager, cameras, path, shared):
+    barrier = manager.Barrier(cameras)
+    s = time.time()
+    checkpoint = SharedCheckpoint.load(path) if shared else None
+    futures = [pool.apply_async(build, (path, checkpoint, barrier)) for _ in range(cameras)]
+    results = [f.get() for f in futures]
+    total = time.time() - s
+    rss = sum(r[1] for r in results)
+    pss = sum(r[2] for r in results)
+    print(f'{"shared" if shared else "per process"}: startup [{round(total, 2)}] s, '
+          f'mean build [{round(sum(r[0] for r in results) / cameras, 2)}] s, '
+          f'total RSS [{round(rss)}] MB, total PSS [{round(pss)}] MB over [{cameras}] cameras')
+
+
+if __name__ == '__main__':
+    from multiprocessing import Manager
+
+    cameras = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    path = sys.argv[2] if len(sys.argv) > 2 else None
+    tmp = None
+    if path is None:
+        tmp = tempfile.NamedTemporaryFile(suffix='.pth', delete=False)
+        torch.save(torchvision.models.resnet101().state_dict(), tmp.name)
+        path = tmp.name
+    print(f'checkpoint [{path}] size [{round(os.path.getsize(path) / 1024 / 1024)}] MB')
+    with Manager() as manager:
+        for shared in [False, True]:
+            # fresh workers for each run, forked before any checkpoint is loaded as in monitor
+            with Pool(cameras) as pool:
+                bench(pool, manager, cameras, path, shared)
+    if tmp is not None:
+        os.unlink(tmp.name)
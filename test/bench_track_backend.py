@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_track_backend.py
+@time: 10/19/26 8:00 PM
+@version 1.0
+@desc: compare tracker backends on a recorded event, speed and agreement with SiamRPN.
+usage: python test/bench_track_backend.py [video x1 y1 x2 y2 [window]]
+without a video a synthetic moving target is used and backends are compared to its ground truth.
+"""
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from config import PROJECT_DIR
+from pysot.core.config import cfg
+from pysot.models.model_builder import ModelBuilder
+from pysot.tracker.cv_tracker import build_cv_tracker
+from pysot.tracker.tracker_builder import build_tracker
+from utils import to_bbox_wh
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0
+
+
+def load_event(path, window):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    grabbed, frame = cap.read()
+    while grabbed and len(frames) <= window:
+        frames.append(frame)
+        grabbed, frame = cap.read()
+    cap.release()
+    return frames
+
+
+def synthetic_event(window=50, shape=(2160, 3840, 3)):
+    rng = np.random.RandomState(0)
+    texture = rng.randint(0, 255, size=(80, 120, 3)).astype(np.uint8)
+    frames, boxes = [], []
+    for i in range(window + 1):
+        frame = np.full(shape, 40, dtype=np.uint8)
+        x, y = 1000 + 8 * i, 1500 + 2 * i
+        frame[y:y + 80, x:x + 120] = texture
+        frames.append(frame)
+        boxes.append([x, y, x + 120, y + 80])
+    return frames, boxes
+
+
+def siamrpn():
+    checkpoint = PROJECT_DIR / 'model/0315-track.pth'
+    if not checkpoint.exists():
+        return None
+    cfg.merge_from_file(str(PROJECT_DIR / 'pysot/configs/config.yaml'))
+    model = ModelBuilder()
+    model.load_state_dict(torch.load(str(checkpoint), map_location=lambda storage, loc: storage.cpu()))
+    return build_tracker(model.eval(), torch.device('cpu'))
+
+
+def run(tracker, frames, rect):
+    boxes = [rect]
+    with torch.no_grad():
+        tracker.init(frames[0], to_bbox_wh(rect))
+        s = time.time()
+        for frame in frames[1:]:
+            boxes.append(tracker.track(frame)['bbox'])
+        e = time.time() - s
+    return boxes, (len(frames) - 1) / e
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 6:
+        window = int(sys.argv[6]) if len(sys.argv) > 6 else 50
+        frames = load_event(sys.argv[1], window)
+        reference = None
+        rect = [int(v) for v in sys.argv[2:6]]
+    else:
+        frames, reference = synthetic_event()
+        rect = reference[0]
+    backends = {'siamrpn': siamrpn()}
+    for name in ['flow', 'kcf', 'csrt']:
+        try:
+            backends[name] = build_cv_tracker(name)
+        except Exception as e:
+            print(f'{name}: skipped, {e}')
+    results = {}
+    for name, tracker in backends.items():
+        if tracker is None:
+            print(f'{name}: skipped, checkpoint not found')
+            continue
+        results[name] = run(tracker, frames, rect)
+    if reference is None and 'siamrpn' in results:
+        reference = results['siamrpn'][0]
+    for name, (boxes, fps) in results.items():
+        agreement = ''
+        if reference is not None:
+            agreement = f', mean IoU [{round(float(np.mean([iou(a, b) for a, b in zip(boxes, reference)])), 3)}]'
+        print(f'{name}: [{round(fps, 2)}]/FPS over [{len(frames) - 1}] frames{agreement}')
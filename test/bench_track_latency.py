@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: bench_track_latency.py
+@time: 10/19/26 5:40 PM
+@version 1.0
+@desc: end-to-end track request latency, dict polling versus future-based delivery over shared memory rings.
+A fake tracking service with fixed cost replaces the model, so only the delivery overhead differs.
+"""
+import time
+from multiprocessing import Manager, Process
+
+import numpy as np
+
+from pysot.tracker.service import TrackRequest, TrackRequester, TrackResult, deliver
+from pysot.tracker.transport import SharedRecordRing, request_dtype, result_dtype
+
+TRACK_COST = 0.05
+REQUESTS = 10
+
+
+def ring_service(request_ring, result_ring, num):
+    served = 0
+    while served < num:
+        record = request_ring.pop()
+        if record is None:
+            request_ring.wait()
+            continue
+        req = TrackRequest.from_record(record)
+        time.sleep(TRACK_COST)
+        output = [TrackResult(i, [(req.frame_index, rect)]) for i, rect in zip(req.rect_ids, req.rects)]
+        deliver({0: result_ring}, req, output)
+        served += 1
+
+
+def dict_service(rec_pipe, output_dict):
+    while True:
+        req = rec_pipe.get()
+        if req is None:
+            return
+        time.sleep(TRACK_COST)
+        output_dict[req[0]] = TrackResult(0, [(req[1], req[2])])
+
+
+def bench_polling(manager):
+    rec_pipe = manager.Queue()
+    output_dict = manager.dict()
+    p = Process(target=dict_service, args=(rec_pipe, output_dict), daemon=True)
+    p.start()
+    latency = []
+    for i in range(REQUESTS):
+        s = time.time()
+        rec_pipe.put((i, i, [0, 0, 10, 10]))
+        # the legacy wait loop of TrackRequester.request
+        while i not in output_dict:
+            time.sleep(1)
+        _ = output_dict[i]
+        latency.append(time.time() - s)
+    rec_pipe.put(None)
+    p.join()
+    return latency, len(output_dict)
+
+
+def bench_future(manager):
+    request_rings = {0: SharedRecordRing(request_dtype(16), 64)}
+    result_rings = {0: [SharedRecordRing(result_dtype(16, 8), 8)]}
+    p = Process(target=ring_service, args=(request_rings[0], result_rings[0][0], REQUESTS), daemon=True)
+    p.start()
+    requester = TrackRequester(request_rings, result_rings, True, manager.dict())
+    latency = []
+    for i in range(REQUESTS):
+        s = time.time()
+        requester.request(0, i, [[0, 0, 10, 10]], timeout=10)
+        latency.append(time.time() - s)
+    p.join()
+    retained = len(result_rings[0][0])
+    for ring in [request_rings[0], result_rings[0][0]]:
+        ring.close()
+    return latency, retained
+
+
+if __name__ == '__main__':
+    with Manager() as manager:
+        for name, bench in [('dict polling', bench_polling), ('future over shared memory', bench_future)]:
+            latency, retained = bench(manager)
+            print(f'{name}: mean latency [{round(float(np.mean(latency)) * 1000, 1)}] ms, '
+                  f'max [{round(float(np.max(latency)) * 1000, 1)}] ms, retained results [{retained}], '
+                  f'tracking cost [{TRACK_COST * 1000}] ms')
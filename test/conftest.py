@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: conftest.py
+@time: 10/20/26 2:30 PM
+@version 1.0
+@desc: configurations, synthetic frames and builders shared by tests, test modules get them as fixtures
+instead of importing each other
+"""
+import queue
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+import yaml
+
+from config import PROJECT_DIR, VideoConfig, ModelType, SystemStatus
+from detection.render import DetectionStreamRender
+from pysot.core.config import cfg as track_cfg
+from pysot.models.model_builder import ModelBuilder
+from pysot.tracker.siamrpn_tracker import SiamRPNTracker
+from stream.segment import SegmentRecorder
+from utils import FrameGeometry
+from utils.cache import SharedMemoryFrameCache
+
+
+def load_video_cfg(**kwargs):
+    """
+    :param kwargs: fields overriding the test camera configuration
+    :return: VideoConfig of vcfg/test/video-11.yml
+    """
+    with open(PROJECT_DIR / 'vcfg/test/video-11.yml') as f:
+        cfg = VideoConfig.from_yaml(yaml.safe_load(f))
+    for k, v in kwargs.items():
+        setattr(cfg, k, v)
+    return cfg
+
+
+def load_blob_cfg(**kwargs):
+    """
+    configuration of a small full-frame camera, which suits moving_blob() frames
+    """
+    return load_video_cfg(**{'shape': [540, 960, 3], 'roi': {'x': 0, 'y': 0, 'width': -1, 'height': -1},
+                             'resize': {'width': 480, 'height': -1, 'scale': -1}, **kwargs})
+
+
+def level_frame(i):
+    """
+    a small frame filled by a level of its index, levels are told apart after encoding
+    """
+    return np.full((48, 64, 3), (i * 3) % 256, dtype=np.uint8)
+
+
+@pytest.fixture
+def load_cfg():
+    return load_video_cfg
+
+
+@pytest.fixture
+def blob_cfg():
+    return load_blob_cfg
+
+
+@pytest.fixture
+def trajectory_cfg():
+    def load(**kwargs):
+        cfg = load_blob_cfg(**kwargs)
+        # the threshold of production configurations, test ones predate float line fitting
+        cfg.alg['angle_thresh'] = 3
+        return cfg
+
+    return load
+
+
+@pytest.fixture
+def moving_blob():
+    def frames(n=10):
+        """
+        a dark blob moving right over a noisy background
+        :return: [(frame_idx, frame)]
+        """
+        rng = np.random.RandomState(0)
+        result = []
+        for i in range(n):
+            frame = (150 + rng.randint(-10, 10, size=(540, 960, 3))).astype(np.uint8)
+            frame[300:330, 200 + 2 * i:260 + 2 * i] = 30
+            result.append((i, frame))
+        return result
+
+    return frames
+
+
+@pytest.fixture
+def segment_frame():
+    return level_frame
+
+
+@pytest.fixture
+def record():
+    def run(segment_dir, indices, keep=30):
+        """
+        record level frames of indices into one second segments at 25 fps
+        """
+        cache = {}
+        recorder = SegmentRecorder(segment_dir, cache, (64, 48), fps=25, duration=1, keep=keep)
+        for i in indices:
+            cache[i] = level_frame(i)
+            recorder.feed(i)
+        recorder.stop()
+        return recorder
+
+    return run
+
+
+@pytest.fixture
+def build_render():
+    def build(tmp_path, smm, **kwargs):
+        """
+        a stream render of a small camera without any service, frames [1, 40) are in its frame cache
+        and frame 18 has a box
+        :param smm: SharedMemoryManager of frame cache
+        :param kwargs: fields overriding the camera configuration
+        """
+        cfg = load_video_cfg(shape=[96, 128, 3], roi={'x': 0, 'y': 0, 'width': -1, 'height': -1},
+                             resize={'width': -1, 'height': -1, 'scale': -1}, bbox={'w': 32, 'h': 32},
+                             post_filter=False, date='today')
+        for k, v in kwargs.items():
+            setattr(cfg, k, v)
+        render = DetectionStreamRender.__new__(DetectionStreamRender)
+        render.cfg = cfg
+        render.scfg = SimpleNamespace(detect_mode=ModelType.SSD)
+        render.index = cfg.index
+        render.future_frames = 10
+        render.cache_size = 100
+        render.geometry = FrameGeometry(cfg)
+        render.original_frame_cache = SharedMemoryFrameCache(smm, 100, int(np.prod(cfg.shape)), cfg.shape)
+        for i in range(1, 40):
+            render.original_frame_cache[i] = np.full(cfg.shape, i * 4, dtype=np.uint8)
+        render.render_rect_cache = {18: [[40, 40, 60, 60, 0.9]]}
+        render.status = SimpleNamespace(get=lambda: SystemStatus.RUNNING)
+        render.lock_window = threading.Event()
+        render.lock_window.set()
+        render.msg_queue = queue.Queue()
+        render.LOG_PREFIX = ''
+        render.segment_path = None
+        render.rect_writer_pool = None
+        render.original_writer_pool = None
+        for name in ['rect_stream_path', 'original_stream_path', 'preview_path']:
+            setattr(render, name, tmp_path / name)
+            (tmp_path / name).mkdir()
+        return render
+
+    return build
+
+
+@pytest.fixture
+def build_tracker():
+    def build():
+        """
+        SiamRPN tracker of random weights on CPU
+        """
+        track_cfg.merge_from_file(str(PROJECT_DIR / 'pysot/configs/config.yaml'))
+        torch.manual_seed(0)
+        model = ModelBuilder()
+        # keep random box regression in a sane range
+        for m in model.rpn_head.modules():
+            if isinstance(m, torch.nn.Conv2d):
+                m.weight.data.mul_(0.01)
+        return SiamRPNTracker(model.eval(), torch.device('cpu'))
+
+    return build
+
+
+@pytest.fixture
+def synthetic_frames():
+    def frames(num=4):
+        """
+        two bright blocks moving in opposite directions over a dark noisy background
+        """
+        rng = np.random.RandomState(0)
+        result = []
+        for i in range(num):
+            frame = rng.randint(0, 60, size=(360, 640, 3)).astype(np.uint8)
+            frame[100:140, 100 + 4 * i:160 + 4 * i] = 220
+            frame[220:260, 400 - 3 * i:450 - 3 * i] = 160
+            result.append(frame)
+        return result
+
+    return frames
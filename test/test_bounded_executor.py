@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_bounded_executor.py
+@time: 10/20/26 12:10 AM
+@version 1.0
+@desc: queueing, overlap policies and cancellation of BoundedExecutor
+"""
+import threading
+
+from utils import BoundedExecutor
+
+
+def blocker():
+    gate = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        gate.wait(5)
+        return 'blocked'
+
+    return block, started, gate
+
+
+def echo(value):
+    return value
+
+
+def test_merge_and_reject():
+    block, started, gate = blocker()
+    merged = []
+    executor = BoundedExecutor(workers=1, max_queue=2, policy='merge',
+                               merge=lambda waiting, new: merged.append(new) or waiting)
+    try:
+        running = executor.submit(block, window=(0, 10))
+        assert started.wait(5)
+        # running tasks are never merged into
+        early = executor.submit(echo, 'early', window=(5, 8))
+        late = executor.submit(echo, 'late', window=(20, 40))
+        assert executor.depth() == 2
+        # overlaps the waiting late task, it shares the future of late
+        assert executor.submit(echo, 'overlap', window=(30, 50)) is late
+        assert merged == [('overlap',)]
+        assert executor.submit(echo, 'full', window=(100, 120)) is None
+        gate.set()
+        assert running.result(5) == 'blocked'
+        assert early.result(5) == 'early' and late.result(5) == 'late'
+    finally:
+        executor.shutdown()
+    m = executor.report()
+    assert (m['submitted'], m['merged'], m['rejected'], m['done'], m['max_depth']) == (5, 1, 1, 3, 2)
+
+
+def test_drop_overlapping():
+    block, started, gate = blocker()
+    executor = BoundedExecutor(workers=1, max_queue=4, policy='drop')
+    try:
+        executor.submit(block, window=(0, 10))
+        assert started.wait(5)
+        assert executor.submit(echo, 'overlap', window=(10, 20)) is None
+        assert executor.submit(echo, 'apart', window=(11, 20)) is not None
+    finally:
+        gate.set()
+        executor.shutdown(cancel=False)
+    assert executor.metrics['dropped'] == 1
+
+
+def test_cancel_on_shutdown():
+    block, started, gate = blocker()
+    executor = BoundedExecutor(workers=1, max_queue=4, policy='none')
+    running = executor.submit(block, window=(0, 10))
+    assert started.wait(5)
+    waiting = executor.submit(echo, 'waiting', window=(0, 10))
+    threading.Timer(0.1, gate.set).start()
+    executor.shutdown(cancel=True)
+    assert running.result(5) == 'blocked'
+    assert waiting.cancelled()
+    assert executor.submit(echo, 'closed') is None
+    assert executor.metrics['cancelled'] == 1
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_copy_free.py
+@time: 10/19/26 10:12 AM
+@version 1.0
+@desc: preprocess and dispatch path must read the shared memory slot without mutating it
+"""
+import queue
+from multiprocessing.managers import SharedMemoryManager
+from types import SimpleNamespace
+
+import numpy as np
+
+from config import ModelType
+from detection.controller import TaskBasedDetectorController
+from utils import preprocess, copy_on_write, crop_by_rect
+from utils.cache import SharedMemoryFrameCache
+
+# a camera sampling every frame, no GUI window is shown
+CAMERA = {'show_window': False, 'forward_filter': False, 'render': True, 'push_stream': True, 'use_sm': False,
+          'sample_rate': 1, 'ssd_divide_four': False}
+
+
+def build_slot(cfg, smm):
+    frame = np.random.randint(0, 255, size=cfg.shape, dtype=np.uint8)
+    cache = SharedMemoryFrameCache(smm, 3, frame.nbytes, cfg.shape)
+    cache[0] = frame
+    return cache, frame
+
+
+def test_preprocess_is_copy_free(load_cfg):
+    cfg = load_cfg(**CAMERA)
+    with SharedMemoryManager() as smm:
+        cache, snapshot = build_slot(cfg, smm)
+        slot = cache[0]
+        frame, original_frame = preprocess(slot, cfg)
+        assert np.shares_memory(original_frame, slot)
+        assert not original_frame.flags.writeable
+        try:
+            original_frame[0, 0, 0] = 0
+            assert False, 'read-only view must reject in-place writes'
+        except ValueError:
+            pass
+        # a drawing stage works on its own copy
+        canvas = copy_on_write(original_frame)
+        canvas[:] = 0
+        crop_by_rect(cfg, [100, 100, 200, 200], original_frame)
+        assert np.array_equal(cache[0], snapshot)
+
+
+def test_dispatch_never_mutates_slot(load_cfg):
+    cfg = load_cfg(**CAMERA)
+
+    def model(frames):
+        # a model must not be handed a writeable slot
+        assert not frames[0].flags.writeable
+        return [np.array([[10, 10, 120, 120, 0.99]])]
+
+    controller = TaskBasedDetectorController.__new__(TaskBasedDetectorController)
+    controller.cfg = cfg
+    controller.server_cfg = SimpleNamespace(detect_mode=ModelType.SSD)
+    controller.result_queue = queue.Queue()
+    controller.render_notify_queue = queue.Queue()
+    # [frame cache, boxes of detected frames], push streamer reads frames from the cache by index
+    controller.push_stream_queue = [None, []]
+    controller.recorder = SimpleNamespace(record=lambda: None)
+    controller.dol_gone = True
+    controller.reuse_cache = None
+    controller.LOG_PREFIX = ''
+    with SharedMemoryManager() as smm:
+        cache, snapshot = build_slot(cfg, smm)
+        controller.dispatch(cache[0], None, model, None, 0)
+        assert not controller.result_queue.empty()
+        assert np.array_equal(cache[0], snapshot)
+        assert [index for index, _ in controller.push_stream_queue[1]] == [0]
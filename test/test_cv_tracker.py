@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_cv_tracker.py
+@time: 10/19/26 7:45 PM
+@version 1.0
+@desc: CPU tracker backends follow a moving target and keep TrackResult format
+"""
+import numpy as np
+import yaml
+
+from config import PROJECT_DIR, ServerConfig
+from pysot.tracker.cv_tracker import CV_TRACKERS, build_cv_tracker
+from pysot.tracker.service import TrackRequest, track_multi
+
+
+def moving_frames(num=10, step=(6, 3)):
+    rng = np.random.RandomState(1)
+    texture = rng.randint(0, 255, size=(60, 80, 3)).astype(np.uint8)
+    frames, boxes = [], []
+    for i in range(num):
+        frame = np.full((480, 640, 3), 30, dtype=np.uint8)
+        x, y = 100 + step[0] * i, 120 + step[1] * i
+        frame[y:y + 60, x:x + 80] = texture
+        frames.append(frame)
+        boxes.append([x, y, x + 80, y + 60])
+    return frames, boxes
+
+
+def test_flow_tracker_follows_target():
+    frames, boxes = moving_frames()
+    tracker = build_cv_tracker('flow')
+    req = TrackRequest(0, 0, 0, None, None, rects=[boxes[0]])
+    results = track_multi(tracker, req, frames[0], list(enumerate(frames[1:], start=1)), 0.5)
+    assert len(results) == 1 and results[0].rect_id == 0
+    result = results[0].result
+    assert len(result) == len(frames)
+    for (i, bbox), expected in zip(result, boxes):
+        assert np.abs(np.array(bbox[:4]) - expected).max() < 4
+
+
+def test_flow_tracker_loses_vanished_target():
+    frames, boxes = moving_frames(3)
+    tracker = build_cv_tracker('flow')
+    tracker.init(frames[0], [boxes[0][0], boxes[0][1], 80, 60])
+    res = tracker.track(np.full_like(frames[0], 30))
+    assert res['best_score'] < 0.5
+
+
+def test_backend_confidence():
+    with open(PROJECT_DIR / 'vcfg/test/server.yml') as f:
+        scfg = ServerConfig.from_yaml(yaml.safe_load(f))
+    # every CPU backend has its own threshold, siamrpn ones of cameras don't apply
+    assert set(CV_TRACKERS) <= set(scfg.track_backend_confidence)
+    thresh = scfg.track_backend_confidence['flow']
+    frames, boxes = moving_frames()
+    tracker = build_cv_tracker('flow')
+    tracker.init(frames[0], [boxes[0][0], boxes[0][1], 80, 60])
+    assert all(tracker.track(frame)['best_score'] >= thresh for frame in frames[1:])
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_encoder_pool.py
+@time: 10/19/26 11:10 PM
+@version 1.0
+@desc: clips written by warm encoders of FFMPEGWriterPool
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from stream.rtsp import FFMPEGWriterPool
+
+
+def write_clip(writer, frames=10, size=(64, 48)):
+    for i in range(frames):
+        writer.write(np.full((size[1], size[0], 3), i * 20, dtype=np.uint8))
+    writer.release()
+
+
+def count_frames(path):
+    cap = cv2.VideoCapture(str(path))
+    cnt = 0
+    while cap.read()[0]:
+        cnt += 1
+    cap.release()
+    return cnt
+
+
+def test_clip_renamed_and_pool_refilled(tmp_path):
+    pool = FFMPEGWriterPool((64, 48), 25, tmp_path, workers=2)
+    try:
+        targets = [tmp_path / f'{i}.mp4' for i in range(3)]
+        for target in targets:
+            write_clip(pool.start(target))
+        for target in targets:
+            assert count_frames(target) == 10
+        assert len(pool.warm) == 2
+        assert sorted(f for f in os.listdir(tmp_path) if not f.startswith('.')) == ['0.mp4', '1.mp4', '2.mp4']
+    finally:
+        pool.close()
+    assert sorted(os.listdir(tmp_path)) == ['0.mp4', '1.mp4', '2.mp4']
+
+
+def test_back_pressure(tmp_path):
+    pool = FFMPEGWriterPool((64, 48), 25, tmp_path, workers=1)
+    try:
+        first = pool.start(tmp_path / 'first.mp4')
+        # the only encoder is busy
+        assert pool.start(tmp_path / 'second.mp4', timeout=0.1) is None
+        assert pool.rejected == 1
+        threading.Timer(0.2, write_clip, args=(first,)).start()
+        s = time.time()
+        second = pool.start(tmp_path / 'second.mp4', timeout=10)
+        assert second is not None and time.time() - s >= 0.15
+        write_clip(second)
+        assert count_frames(tmp_path / 'second.mp4') == 10
+    finally:
+        pool.close()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_float_history.py
+@time: 10/20/26 7:10 AM
+@version 1.0
+@desc: float history shared by post filters of a camera, rejects known debris before tracking
+"""
+import pickle
+from multiprocessing import Manager, Process
+from types import SimpleNamespace
+
+from detection.history import FloatTraceIndex
+from detection.render import ArrivalMessage, ArrivalMsgType, DetectionSignalHandler, Filter
+
+
+def float_trace(x=400, y=300, n=50):
+    # a float drifting right slowly, lasting longer than continuous_time_thresh
+    return [(i, [x + i // 5, y, x + i // 5 + 40, y + 20]) for i in range(n)]
+
+
+def add_in_process(history):
+    history.add([float_trace()], now=1000)
+
+
+def test_grid_weight_and_decay(trajectory_cfg):
+    cfg = trajectory_cfg()
+    history = FloatTraceIndex(cfg)
+    history.add([float_trace()], now=1000)
+    rect = [400, 300, 440, 320]
+    assert history.weight(rect, now=1000) == 1
+    # one float is not known debris yet
+    assert history.reject([rect], now=1000) == [rect]
+    history.add([float_trace()], now=1000 + cfg.float_history_half_life)
+    assert history.weight(rect, now=1000 + cfg.float_history_half_life) == 1.5
+    assert history.reject([rect, [100, 100, 140, 120]], now=1000 + cfg.float_history_half_life) == \
+           [[100, 100, 140, 120]]
+    # weights halve every half life
+    assert history.weight(rect, now=1000 + 2 * cfg.float_history_half_life) == 0.75
+    assert history.reject([rect], now=1000 + 2 * cfg.float_history_half_life) == [rect]
+    assert len(history.live_traces(now=1000 + cfg.float_history_half_life)) == 2
+    assert len(history.live_traces(now=1001 + cfg.float_history_half_life)) == 1
+    # expired cells and traces are dropped on update
+    history.add([float_trace(x=1000)], now=1000 + 3 * cfg.float_history_half_life)
+    assert history.weight(rect, now=1000 + 3 * cfg.float_history_half_life) == 0
+    assert len(history.traces) == 1
+
+
+def test_near_traces():
+    trace = float_trace(y=300)
+    traces = [float_trace(y=310), float_trace(y=500)]
+    assert FloatTraceIndex.near(traces, trace, 50) == traces[:1]
+
+
+def test_snapshot(tmp_path, trajectory_cfg):
+    cfg = trajectory_cfg()
+    path = tmp_path / 'float_history' / '0.json'
+    history = FloatTraceIndex(cfg, path)
+    history.add([float_trace(), float_trace()])
+    loaded = FloatTraceIndex(cfg, path)
+    assert dict(loaded.cells) == dict(history.cells)
+    assert loaded.live_traces() == history.live_traces()
+    assert loaded.reject([[400, 300, 440, 320]]) == []
+    (tmp_path / 'broken.json').write_text('{')
+    assert len(FloatTraceIndex(cfg, tmp_path / 'broken.json').cells) == 0
+
+
+def test_shared_by_processes(trajectory_cfg):
+    cfg = trajectory_cfg()
+    history = FloatTraceIndex(cfg, manager=Manager())
+    p = Process(target=add_in_process, args=(history,))
+    p.start()
+    p.join()
+    assert history.weight([400, 300, 440, 320], now=1000) == 1
+    assert len(history.live_traces(now=1000)) == 1
+    # an in-memory index can be sent to a process too
+    local = pickle.loads(pickle.dumps(FloatTraceIndex(cfg)))
+    local.add([float_trace()], now=1000)
+    assert local.weight([400, 300, 440, 320], now=1000) == 1
+
+
+def test_filters_share_floats(tmp_path, trajectory_cfg):
+    cfg = trajectory_cfg()
+    history = FloatTraceIndex(cfg)
+    render_filter, signal_filter = Filter(cfg, tmp_path, float_history=history), Filter(cfg, tmp_path,
+                                                                                        float_history=history)
+    assert render_filter.filter_by_obj_match_analyze([(idx, [rect]) for idx, rect in float_trace()], 0) == (False, {})
+    assert len(history.live_traces()) == 1
+    # a short trace on the line of the float is a float too, a trace far below it is a dolphin
+    on_line = [(i, [[700 + 2 * i, 302, 740 + 2 * i, 322]]) for i in range(10)]
+    below = [(i, [[700 + 2 * i, 600, 740 + 2 * i, 620]]) for i in range(10)]
+    assert signal_filter.filter_by_obj_match_analyze(on_line, 0) == (False, {})
+    flag, traces = signal_filter.filter_by_obj_match_analyze(below, 0)
+    assert flag and len(traces) == 10
+
+
+def test_known_debris_is_not_tracked(tmp_path, trajectory_cfg):
+    cfg = trajectory_cfg()
+    cfg.forward_filter = True
+    history = FloatTraceIndex(cfg)
+    handler = DetectionSignalHandler.__new__(DetectionSignalHandler)
+    handler.cfg = cfg
+    handler.scfg = SimpleNamespace(track_timeout=1)
+    handler.task_cnt = 0
+    handler.detect_num = 0
+    handler.LOG_PREFIX = ''
+    handler.wait = lambda task_cnt, task_type, msg: None
+    handler.post_filter = Filter(cfg, tmp_path, float_history=history)
+    requests = []
+    handler.track_requester = SimpleNamespace(
+        request=lambda index, current_index, rects, timeout: (requests.append(rects), ([], None))[1])
+    debris, other = [400, 300, 440, 320, 0.9], [100, 600, 140, 620, 0.9]
+    history.add([float_trace(), float_trace()])
+    handler.handle(ArrivalMessage(10, ArrivalMsgType.DETECTION, rects=[debris]), 'now')
+    assert requests == []
+    handler.handle(ArrivalMessage(10, ArrivalMsgType.DETECTION, rects=[debris, other]), 'now')
+    assert requests == [[other]]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_frame_arrival.py
+@time: 10/20/26 1:10 AM
+@version 1.0
+@desc: renderer waits for frames on the frame cache instead of polling, lapped slots are detected
+"""
+import threading
+import time
+from multiprocessing.managers import SharedMemoryManager
+
+import numpy as np
+
+from config import SystemStatus
+from utils.cache import SharedMemoryFrameCache
+
+SHAPE = (4, 4, 3)
+
+
+def test_wait_and_lapped_slot():
+    with SharedMemoryManager() as smm:
+        cache = SharedMemoryFrameCache(smm, 4, int(np.prod(SHAPE)), SHAPE)
+        assert cache.get(0) is None
+        assert not cache.wait(0, timeout=0.05)
+        threading.Timer(0.1, cache.__setitem__, args=(0, np.full(SHAPE, 7, dtype=np.uint8))).start()
+        s = time.time()
+        assert cache.wait(0, timeout=5)
+        assert time.time() - s < 1
+        assert cache.get(0)[0, 0, 0] == 7
+        for i in range(1, 6):
+            cache[i] = np.full(SHAPE, i, dtype=np.uint8)
+        # slot of frame 1 now holds frame 5
+        assert cache.get(1) is None and cache.get(5)[0, 0, 0] == 5
+        assert cache.slot_index(1) == 5 and cache.latest() == 5
+        # a frame got from cache is not changed by the writer lapping its slot
+        frame = cache.get(5)
+        cache[9] = np.full(SHAPE, 9, dtype=np.uint8)
+        assert frame[0, 0, 0] == 5 and cache.get(5) is None
+        # a slot being overwritten is never read
+        cache.headers()[2] = -1
+        assert cache.get(2) is None
+
+
+class ClipWriter(object):
+
+    def __init__(self):
+        self.frames = []
+        self.released = None
+
+    def write(self, frame):
+        self.frames.append(int(frame[0, 0, 0]))
+
+    def release(self):
+        self.released = time.time()
+
+
+def test_clip_done_once_last_frame_arrives(tmp_path, build_render):
+    with SharedMemoryManager() as smm:
+        render = build_render(tmp_path, smm)
+        render.status = type('Status', (), {'get': lambda self: SystemStatus.RUNNING})()
+        cache = render.original_frame_cache
+        writer = ClipWriter()
+        # frames 40 ~ 49 arrive at 25 FPS while the clip is being written
+        arrived = {}
+
+        def produce():
+            for i in range(40, 50):
+                time.sleep(0.04)
+                cache[i] = np.full(render.cfg.shape, i, dtype=np.uint8)
+                arrived[i] = time.time()
+
+        threading.Thread(target=produce, daemon=True).start()
+        assert render.write_original_video_work(writer, 30, 50) == 50
+        writer.release()
+        assert writer.frames == [i * 4 for i in range(30, 40)] + list(range(40, 50))
+        assert writer.released - arrived[49] < 0.04
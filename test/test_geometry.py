@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_geometry.py
+@time: 10/19/26 2:40 PM
+@version 1.0
+@desc: precomputed frame geometry must agree with preprocess and legacy bbox helpers
+"""
+import copy
+
+import numpy as np
+
+from utils import FrameGeometry, preprocess, bbox_points
+
+
+def resize_cfgs(base):
+    for resize in [{'scale': 0.5, 'width': -1, 'height': -1},
+                   {'scale': -1, 'width': 1000, 'height': -1},
+                   {'scale': -1, 'width': -1, 'height': 300}]:
+        cfg = copy.deepcopy(base)
+        cfg.resize = resize
+        yield cfg
+
+
+def test_preprocess_equivalence(load_cfg):
+    frame = np.random.randint(0, 255, size=(2160, 3840, 3), dtype=np.uint8)
+    for cfg in resize_cfgs(load_cfg()):
+        geometry = FrameGeometry(cfg)
+        expected, _ = preprocess(frame, cfg)
+        processed, original_frame = geometry.preprocess(frame)
+        assert processed.shape == expected.shape
+        assert np.array_equal(processed, expected)
+        assert not original_frame.flags.writeable
+        assert processed.shape[1] // cfg.routine['col'] == geometry.x_step
+
+
+def test_block_to_original_round_trip(load_cfg):
+    for cfg in resize_cfgs(load_cfg()):
+        geometry = FrameGeometry(cfg)
+        # a rect known in the original frame, inside the ROI
+        x1, y1, x2, y2 = 1200, 1800, 1520, 1960
+        start = [0, 0]
+        rect = [(x1 - geometry.roi_x) / geometry.scale_x, (y1 - geometry.roi_y) / geometry.scale_y,
+                (x2 - x1) / geometry.scale_x, (y2 - y1) / geometry.scale_y]
+        boxes = geometry.block_to_original([rect, rect], start)
+        assert boxes.shape == (2, 4)
+        assert np.abs(boxes[0] - [x1, y1, x2, y2]).max() <= 1
+        assert len(geometry.block_to_original([], start)) == 0
+
+
+def test_square_boxes_match_bbox_points(load_cfg):
+    cfg = load_cfg()
+    geometry = FrameGeometry(cfg)
+    rects = [[10, 10, 50, 50, 0.9], [1000, 1900, 1100, 2000, 0.8], [3800, 2100, 3839, 2159, 0.7]]
+    boxes = geometry.square_boxes(rects)
+    for rect, box in zip(rects, boxes):
+        p1, p2 = bbox_points(cfg, rect, cfg.shape)
+        assert np.abs(np.array(box) - np.array([*p1, *p2])).max() <= 1
+    assert (boxes[:, 2] <= cfg.shape[1] - 1).all() and (boxes[:, 3] <= cfg.shape[0] - 1).all()
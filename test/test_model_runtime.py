@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_model_runtime.py
+@time: 10/19/26 10:50 PM
+@version 1.0
+@desc: model runtime must keep model outputs unchanged
+"""
+import copy
+
+import torch
+import torch.nn as nn
+
+from utils.runtime import ModelRuntime
+
+
+def conv_bn_net():
+    torch.manual_seed(0)
+    net = nn.Sequential(nn.Conv2d(3, 8, 3, padding=1), nn.BatchNorm2d(8), nn.ReLU(),
+                        nn.Sequential(nn.Conv2d(8, 8, 3, bias=False), nn.BatchNorm2d(8)))
+    for m in net.modules():
+        if isinstance(m, nn.BatchNorm2d):
+            m.running_mean.uniform_(-1, 1)
+            m.running_var.uniform_(0.5, 2)
+            m.weight.data.uniform_(0.5, 2)
+            m.bias.data.uniform_(-1, 1)
+    return net.eval()
+
+
+def test_fuse_and_channels_last_keep_outputs():
+    net = conv_bn_net()
+    x = torch.rand(2, 3, 16, 16)
+    with torch.no_grad():
+        expected = net(x)
+    runtime = ModelRuntime(fuse_bn=True, channels_last=True)
+    fused = runtime.prepare(copy.deepcopy(net))
+    assert not any(isinstance(m, nn.BatchNorm2d) for m in fused.modules())
+    y = runtime.run(fused, runtime.input(x))
+    assert not y.requires_grad
+    assert torch.allclose(expected, y, atol=1e-5)
+
+
+def test_setup_process_threads():
+    threads = torch.get_num_threads()
+    ModelRuntime(num_threads=1).setup_process()
+    assert torch.get_num_threads() == 1
+    torch.set_num_threads(threads)
+
+
+def test_ssd_priors_follow_network():
+    from detection.ssd.ssd import build_ssd
+    net = build_ssd('test', torch.device('cpu'), 300, 2)
+    assert 'priors' in dict(net.named_buffers())
+    # checkpoints are loaded without priors
+    assert 'priors' not in net.state_dict()
+    # a dtype move stands in for a device move, priors must be cast along with the weights
+    net = ModelRuntime(fuse_bn=False, channels_last=False).prepare(net, torch.float64)
+    assert net.priors.dtype == torch.float64
+    # Detect is a legacy autograd function newer torch refuses to call, its forward is what SSD.forward feeds
+    num_priors = net.priors.size(0)
+    loc = torch.zeros(1, num_priors, 4, dtype=torch.float64)
+    conf = torch.softmax(torch.rand(1, num_priors, 2, dtype=torch.float64), dim=-1)
+    with torch.no_grad():
+        output = net.detect.forward(loc, conf, net.priors)
+    assert output.shape[:2] == (1, 2)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_multi_track.py
+@time: 10/19/26 4:20 PM
+@version 1.0
+@desc: batched multi-target tracking must agree with tracking each rect in turn
+"""
+import copy
+
+import numpy as np
+import torch
+
+from pysot.tracker.service import TrackRequest, track_single, track_multi
+
+
+def test_multi_target_matches_single(build_tracker, synthetic_frames):
+    tracker = build_tracker()
+    frames = synthetic_frames()
+    rects = [[100, 100, 160, 140], [400, 220, 450, 260], [20, 20, 80, 70]]
+    window = list(enumerate(frames[1:], start=1))
+    with torch.no_grad():
+        multi = track_multi(tracker, TrackRequest(0, 0, 0, None, None, rects=rects), frames[0], window, -1)
+        singles = [track_single(tracker, TrackRequest(i + 1, 0, 0, rect, i), frames[0], window, -1, False, 0)
+                   for i, rect in enumerate(rects)]
+    assert len(multi) == len(rects)
+    for m, s in zip(multi, singles):
+        assert m.rect_id == s.rect_id
+        assert len(m.result) == len(s.result) == len(frames)
+        for (mi, mb), (si, sb) in zip(m.result, s.result):
+            assert mi == si
+            assert np.allclose(mb, sb, atol=1e-2)
+
+
+def test_multi_target_subset(build_tracker, synthetic_frames):
+    tracker = build_tracker()
+    frames = synthetic_frames(2)
+    rects = [[100, 100, 160, 140], [400, 220, 450, 260], [20, 20, 80, 70]]
+    with torch.no_grad():
+        tracker.init_multi(frames[0], [[r[0], r[1], r[2] - r[0], r[3] - r[1]] for r in rects])
+        state = copy.deepcopy((tracker.center_pos_multi, tracker.size_multi))
+        full = tracker.track_multi(frames[1])
+        tracker.center_pos_multi, tracker.size_multi = copy.deepcopy(state)
+        subset = tracker.track_multi(frames[1], [0, 2])
+    assert np.allclose(subset[0]['bbox'], full[0]['bbox'], atol=1e-2)
+    assert np.allclose(subset[1]['bbox'], full[2]['bbox'], atol=1e-2)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_pix_fmt.py
+@time: 10/20/26 1:10 AM
+@version 1.0
+@desc: frames are piped into ffmpeg in the pixel format they are stored
+"""
+import cv2
+import numpy as np
+import pytest
+import yaml
+
+from config import PROJECT_DIR, VideoConfig
+from stream.rtsp import FFMPEG_MP4Writer, blank_frame, check_pix_fmt, to_bgr
+
+SIZE = (64, 48)
+
+
+def first_frame(path):
+    cap = cv2.VideoCapture(str(path))
+    grabbed, frame = cap.read()
+    cap.release()
+    assert grabbed
+    return frame
+
+
+def colored(bgr):
+    frame = np.zeros((SIZE[1], SIZE[0], 3), dtype=np.uint8)
+    frame[:] = bgr
+    return frame
+
+
+@pytest.mark.parametrize('pix_fmt', ['bgr24', 'rgb24'])
+def test_colors_kept(tmp_path, pix_fmt):
+    bgr = colored((200, 30, 30))
+    frame = bgr if pix_fmt == 'bgr24' else cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    # frames of a shared frame cache are read-only
+    frame.flags.writeable = False
+    target = tmp_path / f'{pix_fmt}.mp4'
+    writer = FFMPEG_MP4Writer(str(target), SIZE, 25, pix_fmt=pix_fmt)
+    for _ in range(3):
+        writer.write(frame)
+    writer.release()
+    decoded = first_frame(target)
+    assert np.abs(decoded.astype(np.int32) - bgr).mean() < 8
+    assert np.abs(to_bgr(frame, pix_fmt).astype(np.int32) - bgr).max() == 0
+
+
+def test_non_contiguous_and_nv12(tmp_path):
+    bgr = colored((30, 200, 30))
+    target = tmp_path / 'flipped.mp4'
+    writer = FFMPEG_MP4Writer(str(target), SIZE, 25, pix_fmt='rgb24')
+    writer.write(bgr[:, :, ::-1])
+    writer.release()
+    assert np.abs(first_frame(target).astype(np.int32) - bgr).mean() < 8
+
+    nv12 = blank_frame(SIZE, 'nv12')
+    assert nv12.shape == (SIZE[1] * 3 // 2, SIZE[0])
+    target = tmp_path / 'nv12.mp4'
+    writer = FFMPEG_MP4Writer(str(target), SIZE, 25, pix_fmt='nv12')
+    writer.write(nv12)
+    writer.release()
+    assert first_frame(target).mean() < 8
+    assert to_bgr(nv12, 'nv12').shape == (SIZE[1], SIZE[0], 3)
+    with pytest.raises(Exception):
+        check_pix_fmt('yuv444p')
+
+
+def test_frame_cache_formats():
+    with open(PROJECT_DIR / 'vcfg/test/video-11.yml') as f:
+        cfg = yaml.safe_load(f)
+    assert VideoConfig.from_yaml(dict(cfg, frame_pix_fmt='bgr24')).frame_pix_fmt == 'bgr24'
+    # frame caches hold frames of full shape, planar formats are piped by writers only
+    with pytest.raises(Exception):
+        VideoConfig.from_yaml(dict(cfg, frame_pix_fmt='nv12'))
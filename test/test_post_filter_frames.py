@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_post_filter_frames.py
+@time: 10/20/26 4:00 AM
+@version 1.0
+@desc: post filter analyses the event window from frame cache while clips are encoded
+"""
+import json
+from multiprocessing.managers import SharedMemoryManager
+
+import numpy as np
+
+from detection.render import ArrivalMessage, ArrivalMsgType
+
+
+class RecordingFilter(object):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.frames = []
+
+    def post_filter_frames(self, frames, task_cnt):
+        for idx, frame in frames:
+            self.frames.append((idx, int(frame[0, 0, 0])))
+        return True, []
+
+    def post_filter_video(self, video_path, task_cnt):
+        raise AssertionError('clip must not be decoded again')
+
+
+def test_post_filter_from_frame_cache(tmp_path, build_render):
+    for single_pass in [True, False]:
+        path = tmp_path / str(single_pass)
+        path.mkdir()
+        with SharedMemoryManager() as smm:
+            render = build_render(path, smm, post_filter=True, single_pass_render=single_pass)
+            render.post_filter = RecordingFilter()
+            render.render_task(20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0)
+            # window [10, 30) as positions in clip, frame values are index * 4
+            assert render.post_filter.frames == [(i, (i + 10) * 4) for i in range(20)]
+            clip = path / 'original_stream_path' / f'now_{render.cfg.index}_0.mp4'
+            assert clip.exists()
+            msg = json.loads(render.msg_queue.get_nowait())
+            assert msg['data']['path'] == str(clip)
+
+
+def test_rejected_window_sends_nothing(tmp_path, build_render):
+    with SharedMemoryManager() as smm:
+        render = build_render(tmp_path, smm, post_filter=True)
+        render.post_filter = RecordingFilter()
+        render.post_filter.post_filter_frames = lambda frames, task_cnt: (False, [])
+        render.render_task(20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0)
+        assert render.msg_queue.empty()
+        assert np.array_equal(render.original_frame_cache[20], np.full(render.cfg.shape, 80, dtype=np.uint8))
+
+
+def test_sidecar_named_after_post_filter(tmp_path, build_render):
+    with SharedMemoryManager() as smm:
+        render = build_render(tmp_path, smm, post_filter=True, render_sidecar=True)
+        render.post_filter = RecordingFilter()
+        render.render_task(20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0)
+        msg = json.loads(render.msg_queue.get_nowait())
+        clip = tmp_path / 'original_stream_path' / f'now_{render.cfg.index}_0.mp4'
+        assert msg['data']['track'].endswith(clip.with_suffix('.json').name)
+        assert clip.with_suffix('.json').exists()
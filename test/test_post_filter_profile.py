@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_post_filter_profile.py
+@time: 10/20/26 5:10 AM
+@version 1.0
+@desc: downscaled and strided post filter analysis, boxes are mapped back into original frame
+"""
+import numpy as np
+
+from detection.render import Filter
+
+
+def test_profile_cfg(tmp_path, blob_cfg):
+    cfg = blob_cfg(post_filter_scale=0.5)
+    post_filter = Filter(cfg, tmp_path)
+    alg = post_filter.analysis_params[0].cfg.alg
+    assert (alg['sp'], alg['block_size'], alg['ok_size'], alg['dk_size']) == (5, 27, 2, -1)
+    assert alg['area'] == cfg.alg['area'] / 4
+    assert (post_filter.analysis_geometry.pre_w, post_filter.analysis_geometry.pre_h) == (240, 135)
+    # configuration of camera is untouched
+    assert cfg.alg['block_size'] == 51 and cfg.resize['width'] == 480
+
+
+def test_boxes_in_original_frame(tmp_path, blob_cfg, moving_blob):
+    frames = moving_blob()
+    full = Filter(blob_cfg(), tmp_path).detect_frames(frames)
+    profile = Filter(blob_cfg(post_filter_scale=0.5, post_filter_stride=2), tmp_path).detect_frames(frames)
+    assert [idx for idx, _ in full] == list(range(10))
+    assert [idx for idx, _ in profile] == list(range(0, 10, 2))
+    full = dict(full)
+    for idx, rects in profile:
+        assert len(rects) == len(full[idx]) == 1
+        assert np.abs(np.array(rects[0]) - np.array(full[idx][0])).max() <= 8
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_renditions.py
+@time: 10/20/26 3:00 AM
+@version 1.0
+@desc: renditions of a live stream encoded by one ffmpeg process
+"""
+import cv2
+import numpy as np
+
+from stream.rtsp import FFMPEG_LadderStreamer, Rendition
+
+
+def test_filters():
+    assert Rendition('rtsp://host/a').filters((64, 48), 25) == 'null'
+    assert Rendition('rtsp://host/a', 64, 48, fps=25).filters((64, 48), 25) == 'null'
+    assert Rendition('hls', width=32).filters((64, 48), 25) == 'scale=32:-2'
+    assert Rendition('hls', 32, 24, fps=10).filters((64, 48), 25) == 'scale=32:24,fps=10'
+
+
+def test_hls_ladder(tmp_path):
+    renditions = [Rendition(str(tmp_path / 'full')),
+                  Rendition(str(tmp_path / 'low'), 32, 24, bitrate='100k', fps=10)]
+    streamer = FFMPEG_LadderStreamer((64, 48), 25, renditions, pix_fmt='bgr24')
+    for i in range(75):
+        streamer.write_frame(np.full((48, 64, 3), i * 3, dtype=np.uint8))
+    streamer.close()
+    for name, size, fps in [('full', (64, 48), 25), ('low', (32, 24), 10)]:
+        assert (tmp_path / name / 'index.m3u8').exists()
+        cap = cv2.VideoCapture(str(tmp_path / name / 'index.m3u8'))
+        frames = 0
+        grabbed, frame = cap.read()
+        while grabbed:
+            assert (frame.shape[1], frame.shape[0]) == size
+            frames += 1
+            grabbed, frame = cap.read()
+        cap.release()
+        # 3 seconds of source
+        assert abs(frames - 3 * fps) <= 2
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_result_reuse.py
+@time: 10/19/26 3:30 PM
+@version 1.0
+@desc: histogram signature and temporal result reuse of near-identical frames
+"""
+import cv2
+import numpy as np
+
+from utils import createHistFeature, FrameGeometry
+from utils.cache import ResultReuseCache
+
+
+def hist_feature_by_loop(grid, small_grid=3):
+    hist_mask = np.array([])
+    colnum = int(grid.shape[1] / small_grid)
+    rownum = int(grid.shape[0] / small_grid)
+    for i in range(small_grid):
+        for j in range(small_grid):
+            image = grid[i * colnum:(i + 1) * colnum, j * rownum:(j + 1) * rownum, :]
+            hist_mask0 = cv2.calcHist([image], [0], None, [16], [0, 255])
+            hist_mask1 = cv2.calcHist([image], [1], None, [16], [0, 255])
+            hist_mask2 = cv2.calcHist([image], [2], None, [16], [0, 255])
+            hist_mask_small = np.concatenate((hist_mask0, hist_mask1, hist_mask2), axis=0)
+            if len(hist_mask) == 0:
+                hist_mask = hist_mask_small
+            else:
+                hist_mask = np.concatenate((hist_mask, hist_mask_small), axis=0)
+    return hist_mask
+
+
+def test_hist_feature_equivalence():
+    for shape in [(90, 90, 3), (108, 192, 3), (192, 108, 3), (37, 61, 3)]:
+        grid = np.random.randint(0, 256, size=shape, dtype=np.uint8)
+        grid[0, :] = 255
+        expected = hist_feature_by_loop(grid)
+        feature = createHistFeature(grid)
+        # calcHist of opencv 4.x returns a column vector, newer builds may return a flat one
+        assert feature.shape == (432, 1)
+        assert feature.dtype == expected.dtype
+        assert np.array_equal(feature.ravel(), expected.ravel())
+
+
+def test_reuse_near_identical_frames(load_cfg):
+    cfg = load_cfg()
+    # result reuse has its own threshold and is disabled by default
+    assert cfg.reuse_dist_thresh == 0
+    cache = ResultReuseCache(0.05, 3, FrameGeometry(cfg))
+    frame = np.random.randint(0, 200, size=cfg.shape, dtype=np.uint8)
+    results = [np.array([[10, 10, 50, 50, 0.9]])]
+    assert cache.lookup(frame, 0) is None
+    cache.update(0, results)
+    assert cache.lookup(frame, 2) is results
+    # exceeds max reuse age
+    assert cache.lookup(frame, 4) is None
+    cache.update(4, results)
+    # a brighter ROI changes the histogram
+    changed = frame.copy()
+    changed[cfg.roi['y']:] = 255 - changed[cfg.roi['y']:]
+    assert cache.lookup(changed, 5) is None
+    # changes out of ROI are ignored
+    outside = frame.copy()
+    outside[:cfg.roi['y']] = 0
+    assert cache.lookup(outside, 6) is results
+    assert 0 < cache.hit_rate() < 1
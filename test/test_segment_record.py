@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_segment_record.py
+@time: 10/19/26 11:55 PM
+@version 1.0
+@desc: rolling segment recording and clip cutting by stream copy
+"""
+import cv2
+
+from detection.controller import DetectorController
+from stream.segment import SegmentRecorder, cut_clip, list_segments, segment_path
+
+
+def read_levels(path):
+    cap = cv2.VideoCapture(str(path))
+    levels = []
+    grabbed, img = cap.read()
+    while grabbed:
+        levels.append(int(round(img.mean())))
+        grabbed, img = cap.read()
+    cap.release()
+    return levels
+
+
+def test_clip_aligned_to_segments(tmp_path, record):
+    # recording starts at the first index aligned to a segment boundary
+    record(tmp_path, range(3, 130))
+    assert list_segments(tmp_path) == [1, 2, 3, 4, 5]
+    target = tmp_path / 'clip.mp4'
+    # the clip starts at the boundary of segment 2
+    assert cut_clip(tmp_path, 25, 60, 80, target, timeout=1) == (50, 100)
+    levels = read_levels(target)
+    # frames of segments 2 and 3
+    assert len(levels) == 50
+    assert abs(levels[0] - (50 * 3) % 256) <= 2 and abs(levels[-1] - (99 * 3) % 256) <= 2
+
+
+def test_rolling_and_gaps(tmp_path, record):
+    # frames 60 ~ 74 are lost, recording resumes at frame 75 and the truncated segment 2 is dropped
+    record(tmp_path, list(range(0, 60)) + list(range(75, 200)), keep=5)
+    assert list_segments(tmp_path) == [3, 4, 5, 6, 7]
+    target = tmp_path / 'clip.mp4'
+    # segments 0 ~ 2 were rolled out, the clip starts at segment 3
+    assert cut_clip(tmp_path, 25, 0, 100, target, timeout=0.5, event_index=80) == (75, 100)
+    assert len(read_levels(target)) == 25
+    # the event itself was not recorded
+    assert cut_clip(tmp_path, 25, 0, 100, tmp_path / 'lost.mp4', timeout=0.5) is None
+
+
+def test_gap_inside_clip(tmp_path, record):
+    # frames 60 ~ 74 are lost, segments before and after the gap are never joined
+    record(tmp_path, list(range(0, 60)) + list(range(75, 150)))
+    assert list_segments(tmp_path) == [0, 1, 3, 4, 5]
+    target = tmp_path / 'after.mp4'
+    assert cut_clip(tmp_path, 25, 10, 110, target, timeout=0.5, event_index=80) == (75, 125)
+    levels = read_levels(target)
+    assert len(levels) == 50 and abs(levels[0] - (75 * 3) % 256) <= 2
+    target = tmp_path / 'before.mp4'
+    assert cut_clip(tmp_path, 25, 10, 110, target, timeout=0.5, event_index=30) == (0, 50)
+    assert len(read_levels(target)) == 50
+
+
+def test_lapped_frame_breaks_segment(tmp_path, segment_frame):
+    # frame 30 was overwritten in cache before the recorder reached it
+    cache = {i: segment_frame(i) for i in range(100) if i != 30}
+    recorder = SegmentRecorder(tmp_path, cache, (64, 48), fps=25, duration=1)
+    for i in range(100):
+        recorder.feed(i)
+    recorder.stop()
+    # segment 1 is broken by the lapped frame and dropped, recording resumes at segment 2
+    assert list_segments(tmp_path) == [0, 2, 3]
+    assert len(read_levels(segment_path(tmp_path, 2))) == 25
+
+
+def test_controller_stops_recorder(tmp_path, segment_frame):
+    cache = {}
+    controller = DetectorController.__new__(DetectorController)
+    controller.segment_recorder = SegmentRecorder(tmp_path, cache, (64, 48), fps=25, duration=1)
+    for i in range(30):
+        cache[i] = segment_frame(i)
+        controller.segment_recorder.feed(i)
+    controller.stop_recording()
+    assert controller.segment_recorder is None
+    # the segment being recorded is completed on exit
+    assert len(read_levels(tmp_path / 'seg_0000000001.mkv')) == 5
+    controller.stop_recording()
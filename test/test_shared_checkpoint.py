@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_shared_checkpoint.py
+@time: 10/19/26 11:40 PM
+@version 1.0
+@desc: weights of a shared checkpoint are bound without copying, also in pool workers
+"""
+from multiprocessing import Pool
+
+import pytest
+import torch
+import torch.nn as nn
+
+from utils.runtime import SharedCheckpoint
+
+
+def small_net():
+    return nn.Sequential(nn.Conv2d(3, 4, 3), nn.BatchNorm2d(4), nn.ReLU(), nn.Conv2d(4, 2, 1))
+
+
+def bind_in_worker(checkpoint):
+    model = checkpoint.bind(small_net())
+    weight = model[0].weight
+    # writes through to the storage of the parent process
+    weight.data[0, 0, 0, 0] = 42
+    return weight.is_shared()
+
+
+def test_bind_without_copy():
+    net = small_net()
+    checkpoint = SharedCheckpoint({'module.' + k: v for k, v in net.state_dict().items()})
+    # prefix is only stripped by load(), keys must match otherwise
+    with pytest.raises(Exception):
+        checkpoint.bind(small_net())
+    checkpoint = SharedCheckpoint(net.state_dict())
+    model = checkpoint.bind(small_net())
+    for name, tensor in model.state_dict().items():
+        assert tensor.data_ptr() == checkpoint.state_dict[name].data_ptr()
+        assert torch.equal(tensor, net.state_dict()[name])
+    # float weights are packed into one storage
+    assert model[0].weight.untyped_storage().data_ptr() == model[3].bias.untyped_storage().data_ptr()
+
+
+def test_bind_in_pool_worker():
+    checkpoint = SharedCheckpoint(small_net().state_dict())
+    with Pool(1) as pool:
+        assert pool.apply(bind_in_worker, (checkpoint,))
+    assert checkpoint.state_dict['0.weight'][0, 0, 0, 0] == 42
+
+
+def test_bind_ssd_with_priors():
+    from detection.ssd.ssd import build_ssd
+    net = build_ssd('test', torch.device('cpu'), 300, 2)
+    checkpoint = SharedCheckpoint(net.state_dict())
+    # priors are a non-persistent buffer, strict binding must not ask the checkpoint for them
+    model = checkpoint.bind(build_ssd('test', torch.device('cpu'), 300, 2))
+    name = next(iter(checkpoint.state_dict))
+    assert model.state_dict()[name].data_ptr() == checkpoint.state_dict[name].data_ptr()
+    assert torch.equal(model.priors, net.priors)
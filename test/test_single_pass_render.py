@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_single_pass_render.py
+@time: 10/20/26 12:40 AM
+@version 1.0
+@desc: original clip, overlay clip, preview and bbox track of an event rendered in a single pass
+"""
+import json
+from multiprocessing.managers import SharedMemoryManager
+
+import cv2
+import numpy as np
+
+from detection.render import ArrivalMessage, ArrivalMsgType
+from stream.rtsp import FFMPEGWriterPool
+
+
+def read_clip(path):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    grabbed, frame = cap.read()
+    while grabbed:
+        frames.append(frame)
+        grabbed, frame = cap.read()
+    cap.release()
+    return frames
+
+
+def test_single_pass(tmp_path, build_render):
+    with SharedMemoryManager() as smm:
+        single_pass(tmp_path, build_render(tmp_path, smm))
+
+
+def single_pass(tmp_path, render):
+    snapshot = {i: render.original_frame_cache[i].copy() for i in range(1, 40)}
+    # box colors are random, a color close to the background would not be told apart
+    np.random.seed(0)
+    render.render_task(20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0)
+    original = read_clip(tmp_path / 'original_stream_path' / f'now_{render.cfg.index}_0.mp4')
+    overlay = read_clip(tmp_path / 'rect_stream_path' / f'now_{render.cfg.index}_0.mp4')
+    # frames [10, 30)
+    assert len(original) == len(overlay) == 20
+    assert abs(float(original[0].mean()) - 40) < 2
+    # boxes appear from frame 18 on and are held until the end of clip
+    for i in range(20):
+        diff = np.abs(original[i].astype(np.int64) - overlay[i].astype(np.int64)).max()
+        assert (diff > 30) == (i >= 8)
+    assert cv2.imread(str(tmp_path / 'preview_path' / f'now_{render.cfg.index}_0.jpg')).mean() > 70
+    for i, f in snapshot.items():
+        assert np.array_equal(render.original_frame_cache[i], f)
+    msg = json.loads(render.msg_queue.get_nowait())
+    assert msg['data']['filename'] == f'now_{render.cfg.index}_0.mp4' and 'track' not in msg['data']
+
+
+def test_sidecar_only(tmp_path, build_render):
+    with SharedMemoryManager() as smm:
+        sidecar_only(tmp_path, build_render(tmp_path, smm, render_sidecar=True))
+
+
+def sidecar_only(tmp_path, render):
+    render.render_task(20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0)
+    assert not len(list((tmp_path / 'rect_stream_path').iterdir()))
+    clip = tmp_path / 'original_stream_path' / f'now_{render.cfg.index}_0.mp4'
+    assert len(read_clip(clip)) == 20
+    with open(str(clip.with_suffix('.json'))) as f:
+        track = json.load(f)
+    assert track['frames'] == [{'frame': 8, 'boxes': [[34, 34, 66, 66]], 'scores': [0.9]}]
+    msg = json.loads(render.msg_queue.get_nowait())
+    assert msg['data']['path'] == str(clip) and msg['data']['track'].endswith(clip.with_suffix('.json').name)
+
+
+def test_sidecar_of_segment_clip(tmp_path, build_render, record):
+    segment_dir = tmp_path / 'segments'
+    # recording starts at frame 0, the clip of window [10, 30) is cut from segment 0
+    record(segment_dir, range(0, 80))
+    with SharedMemoryManager() as smm:
+        render = build_render(tmp_path, smm, render_sidecar=True, fps=25, segment_duration=1)
+        render.segment_path = segment_dir
+        render.render_task(20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0)
+    clip = tmp_path / 'original_stream_path' / f'now_{render.cfg.index}_0.mp4'
+    assert len(read_clip(clip)) == 50
+    with open(str(clip.with_suffix('.json'))) as f:
+        track = json.load(f)
+    # boxes of frame 18 are at frame 18 of the clip, not 8 frames after the start of the window
+    assert [f['frame'] for f in track['frames']] == [18]
+
+
+def test_merged_events_extend_clip(tmp_path, build_render):
+    with SharedMemoryManager() as smm:
+        render = build_render(tmp_path, smm)
+        waiting = (20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0, 30)
+        merged = render.merge_task(waiting, (25, 'later', ArrivalMessage(25, ArrivalMsgType.DETECTION, True), 1, 35))
+        assert merged[:4] == waiting[:4] and merged[4] == 35
+        render.render_task(*merged)
+    # frames [10, 35), frames after the window of the first event are not lost
+    assert len(read_clip(tmp_path / 'original_stream_path' / f'now_{render.cfg.index}_0.mp4')) == 25
+    assert len(read_clip(tmp_path / 'rect_stream_path' / f'now_{render.cfg.index}_0.mp4')) == 25
+
+
+def test_busy_encoders_drop_event(tmp_path, build_render):
+    with SharedMemoryManager() as smm:
+        render = build_render(tmp_path, smm)
+        render.scfg.encoder_pool_timeout = 0.1
+        pool = FFMPEGWriterPool((128, 96), 25, tmp_path / 'encoding', workers=1)
+        render.original_writer_pool = pool
+        busy = pool.start(tmp_path / 'busy.mp4')
+        try:
+            render.render_task(20, 'now', ArrivalMessage(20, ArrivalMsgType.DETECTION, True), 0)
+            # no encoder is launched beyond the pool, the event is dropped and counted
+            assert pool.rejected == 1
+            assert not len(list((tmp_path / 'original_stream_path').iterdir()))
+            assert not len(list((tmp_path / 'rect_stream_path').iterdir()))
+            assert render.msg_queue.empty()
+        finally:
+            busy.release()
+            pool.close()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_stream_pacer.py
+@time: 10/20/26 2:20 AM
+@version 1.0
+@desc: frame choice and timing of StreamPacer
+"""
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+import stream.rtsp
+from config import SystemStatus
+from stream.rtsp import PushStreamer, StreamPacer
+
+
+def test_repeat_on_stall_and_skip_when_behind():
+    pacer = StreamPacer(fps=25, delay=2, max_lag=10)
+    assert pacer.next_index(-1) is None
+    assert pacer.next_index(5) == 3
+    # frames in order while the source keeps up
+    assert [pacer.next_index(latest) for latest in [6, 7, 8]] == [4, 5, 6]
+    # source stalls, the last frame is repeated and frames in reserve are kept
+    assert [pacer.next_index(8) for _ in range(3)] == [6, 6, 6]
+    assert pacer.metrics['duplicated'] == 3
+    assert pacer.next_index(9) == 7
+    # source bursts, the pacer jumps back to delay frames behind the newest one
+    assert pacer.next_index(30) == 28
+    assert pacer.metrics['dropped'] == 28 - 7 - 1
+    assert pacer.next_index(31) == 29
+    pacer.skip()
+    assert pacer.report(force=True)['dropped'] == 28 - 7
+
+
+def test_fixed_rate_and_overrun():
+    pacer = StreamPacer(fps=100)
+    s = time.monotonic()
+    for _ in range(21):
+        pacer.wait()
+    elapse = time.monotonic() - s
+    assert 0.19 <= elapse < 0.4
+    assert pacer.metrics['overrun'] == 0
+    # a slow write loses ticks, the schedule restarts instead of bursting frames
+    time.sleep(0.1)
+    assert pacer.wait() >= 0.08
+    s = time.monotonic()
+    pacer.wait()
+    assert time.monotonic() - s >= 0.008
+    assert pacer.metrics['overrun'] == 1
+
+
+class LappedCache(object):
+    """
+    a stalled cache returning read-only views of its only slot
+    """
+
+    def __init__(self, shape):
+        self.slot = np.full(shape, 3, dtype=np.uint8)
+
+    def latest(self):
+        return 5
+
+    def get(self, index):
+        view = self.slot.view()
+        view.flags.writeable = False
+        return view
+
+
+class RecordingStreamer(object):
+
+    def __init__(self, streamer, *args, **kwargs):
+        self.streamer = streamer
+        self.frames = []
+
+    def write_frame(self, frame):
+        self.frames.append(int(frame[0, 0, 0]))
+        if len(self.frames) == 1:
+            # capture laps the slot of the emitted frame while the pacer repeats it
+            self.streamer.stream_stack[0].slot[:] = 99
+        if len(self.frames) == 4:
+            self.streamer.status = SimpleNamespace(get=lambda: SystemStatus.SHUT_DOWN)
+
+    def close(self):
+        pass
+
+
+def test_repeated_frame_is_private(monkeypatch, load_cfg):
+    cfg = load_cfg(shape=[8, 8, 3], renditions=[], write_timestamp=False)
+    streamer = PushStreamer.__new__(PushStreamer)
+    streamer.cfg = cfg
+    streamer.stream_stack = [LappedCache(cfg.shape), []]
+    streamer.LOG_PREFIX = ''
+    streamer.status = SimpleNamespace(get=lambda: SystemStatus.RUNNING)
+    streamer.listen = lambda: None
+    recorder = {}
+    monkeypatch.setattr(stream.rtsp, 'FFMPEG_VideoStreamer',
+                        lambda *args, **kwargs: recorder.setdefault('s', RecordingStreamer(streamer)))
+    streamer.push_stream()
+    # the stalled stream repeats frame 3 as it was emitted
+    assert recorder['s'].frames == [3, 3, 3, 3]
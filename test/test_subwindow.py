@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_subwindow.py
+@time: 10/19/26 6:05 PM
+@version 1.0
+@desc: crop-then-pad search region must be the same as cropping from a fully padded frame
+"""
+import numpy as np
+
+from pysot.tracker.base_tracker import SiameseTracker
+
+
+def padded_subwindow(im, pos, original_sz, avg_chans):
+    c = (original_sz + 1) / 2
+    xmin = np.floor(pos[0] - c + 0.5)
+    ymin = np.floor(pos[1] - c + 0.5)
+    xmax, ymax = xmin + original_sz - 1, ymin + original_sz - 1
+    left, top = int(max(0., -xmin)), int(max(0., -ymin))
+    right, bottom = int(max(0., xmax - im.shape[1] + 1)), int(max(0., ymax - im.shape[0] + 1))
+    r, c, k = im.shape
+    te_im = np.zeros((r + top + bottom, c + left + right, k), np.uint8)
+    te_im[:] = avg_chans
+    te_im[top:top + r, left:left + c] = im
+    return te_im[int(ymin + top):int(ymax + top + 1), int(xmin + left):int(xmax + left + 1)]
+
+
+def test_crop_then_pad_equivalence():
+    tracker = SiameseTracker()
+    im = np.random.randint(0, 255, size=(200, 300, 3), dtype=np.uint8)
+    avg = np.array([10.5, 100.2, 200.9])
+    for pos, sz in [((5, 5), 63), ((295, 190), 63), ((150, 100), 63), ((150, 100), 401), ((-50, 20), 63),
+                    ((400, 300), 41)]:
+        patch = tracker.get_subwindow(im, np.array(pos, dtype=np.float64), sz, sz, avg, None)
+        expected = padded_subwindow(im, pos, sz, avg)
+        assert patch.shape == (1, 3, sz, sz)
+        assert np.array_equal(patch[0].numpy().transpose(1, 2, 0), expected.astype(np.float32))
+
+
+def test_context_average_inside_window():
+    tracker = SiameseTracker()
+    im = np.zeros((200, 300, 3), dtype=np.uint8)
+    im[:50, :50] = 90
+    avg = tracker.context_average(im, np.array([10., 10.]), 41)
+    assert np.allclose(avg, 90)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_template_cache.py
+@time: 10/19/26 9:20 PM
+@version 1.0
+@desc: tracker template cache, reused exemplar features must track the same as freshly computed ones
+"""
+import numpy as np
+import torch
+
+from pysot.tracker.service import TrackRequest, track_multi, track_single
+from utils.cache import TemplateCache
+
+
+def test_lru_and_gap():
+    cache = TemplateCache(2, quant=16, max_gap=100)
+    cache.update(0, [0, 0, 32, 32], 'a')
+    cache.update(0, [100, 100, 132, 132], 'b')
+    # a nearby box of a later frame hits the same template
+    assert cache.lookup(50, [2, 1, 34, 33]) == 'a'
+    cache.update(60, [300, 300, 332, 332], 'c')
+    # b is least recently used
+    assert cache.lookup(60, [100, 100, 132, 132]) is None
+    assert cache.lookup(200, [0, 0, 32, 32]) is None
+    assert cache.lookup(60, [300, 300, 332, 332]) == 'c'
+    assert cache.hit_rate() == 0.5
+
+
+def test_cached_templates_track_the_same(build_tracker, synthetic_frames):
+    tracker = build_tracker()
+    frames = synthetic_frames()
+    rects = [[100, 100, 160, 140], [400, 220, 450, 260]]
+    window = list(enumerate(frames[1:], start=1))
+    cache = TemplateCache(8)
+    with torch.no_grad():
+        expected = track_multi(tracker, TrackRequest(0, 0, 0, None, None, rects=rects), frames[0], window, -1)
+        first = track_multi(tracker, TrackRequest(1, 0, 0, None, None, rects=rects), frames[0], window, -1,
+                            template_cache=cache)
+        # second request reuses both exemplars, single request reuses a batched one
+        second = track_multi(tracker, TrackRequest(2, 0, 0, None, None, rects=rects), frames[0], window, -1,
+                             template_cache=cache)
+        single = track_single(tracker, TrackRequest(3, 0, 0, rects[1], 1), frames[0], window, -1, False, 0,
+                              template_cache=cache)
+    assert cache.hit == 3 and cache.total == 5
+    for results in [first, second, [expected[0], single]]:
+        for e, r in zip(expected, results):
+            assert np.allclose([b for _, b in e.result], [b for _, b in r.result], atol=1e-3)
+    assert np.allclose([b for _, b in expected[1].result], [b for _, b in single.result], atol=1e-3)
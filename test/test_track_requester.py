@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_track_requester.py
+@time: 10/19/26 5:10 PM
+@version 1.0
+@desc: future-based tracking request delivery, timeout and cancellation
+"""
+import threading
+import time
+from multiprocessing import Pool
+
+from pysot.tracker.service import TrackRequest, TrackRequester, TrackResult, deliver, pack_results
+from pysot.tracker.transport import CancelledRequests, SharedRecordRing, request_dtype, result_dtype
+
+
+def build_rings(max_targets=4, window_size=8):
+    request_rings = {0: SharedRecordRing(request_dtype(max_targets), 8)}
+    result_rings = {0: [SharedRecordRing(result_dtype(max_targets, window_size), 4)]}
+    return request_rings, result_rings
+
+
+def close_rings(request_rings, result_rings):
+    for ring in list(request_rings.values()) + [r for rings in result_rings.values() for r in rings]:
+        ring.close()
+
+
+def fake_service(request_rings, result_rings, cancelled, delay=0.05, stop=None):
+    def run():
+        while stop is None or not stop.is_set():
+            record = request_rings[0].pop()
+            if record is None:
+                request_rings[0].wait(0.1)
+                continue
+            req = TrackRequest.from_record(record)
+            if cancelled.pop((req.monitor_index, req.request_id), None):
+                continue
+            time.sleep(delay)
+            output = [TrackResult(i, [(req.frame_index, rect), (req.frame_index + 1, rect)])
+                      for i, rect in zip(req.rect_ids, req.rects)]
+            deliver({0: result_rings[0][0]}, req, output)
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t
+
+
+def test_request_resolves_without_polling():
+    request_rings, result_rings = build_rings()
+    cancelled = CancelledRequests([0])
+    requester = TrackRequester(request_rings, result_rings, True, cancelled, max_targets=4)
+    stop = threading.Event()
+    fake_service(request_rings, result_rings, cancelled, stop=stop)
+    rects = [[0, 0, 10, 10], [20, 20, 40, 40]]
+    s = time.time()
+    res, seq = requester.request(0, 5, rects, timeout=5)
+    assert time.time() - s < 0.9
+    assert [k for k, _ in res] == [5, 6]
+    assert res[0][1] == rects
+    assert seq[1][0] == (5, rects[1])
+    # more rects than a record holds are split into several requests
+    rects = [[i, i, i + 10, i + 10] for i in range(6)]
+    res, seq = requester.request(0, 9, rects, timeout=5)
+    assert res[0] == (9, rects)
+    # delivered results are not kept anywhere
+    assert not len(requester._futures)
+    assert not len(result_rings[0][0])
+    stop.set()
+    close_rings(request_rings, result_rings)
+    cancelled.close()
+
+
+def test_request_timeout_cancels():
+    request_rings, result_rings = build_rings()
+    cancelled = CancelledRequests([0])
+    requester = TrackRequester(request_rings, result_rings, True, cancelled, max_targets=4)
+    res, seq = requester.request(0, 5, [[0, 0, 10, 10]], timeout=0.2)
+    assert res == []
+    assert len(cancelled) == 1
+    assert not len(requester._futures)
+    # the tracker skips the cancelled request
+    stop = threading.Event()
+    fake_service(request_rings, result_rings, cancelled, stop=stop)
+    time.sleep(0.3)
+    assert not len(result_rings[0][0])
+    assert not len(cancelled)
+    # a late result of an unknown request is dropped
+    result_rings[0][0].put(lambda record: pack_results(record, 1000, []))
+    res, _ = requester.request(0, 7, [[0, 0, 10, 10]], timeout=5)
+    assert [k for k, _ in res] == [7, 8]
+    stop.set()
+    close_rings(request_rings, result_rings)
+    cancelled.close()
+
+
+def test_cancel_running_request():
+    request_rings, result_rings = build_rings()
+    cancelled = CancelledRequests([0])
+    requester = TrackRequester(request_rings, result_rings, True, cancelled, max_targets=4)
+    stop = threading.Event()
+    fake_service(request_rings, result_rings, cancelled, delay=0.3, stop=stop)
+    futures = requester.submit(0, 5, [[0, 0, 10, 10]])
+    # the tracker has taken the request before it is cancelled
+    time.sleep(0.1)
+    requester.cancel(futures)
+    assert len(cancelled) == 1
+    # the cancellation is forgotten once the dropped result arrives
+    time.sleep(0.5)
+    assert not len(cancelled)
+    stop.set()
+    close_rings(request_rings, result_rings)
+    cancelled.close()
+
+
+def test_record_round_trip():
+    request_rings, result_rings = build_rings()
+    req = TrackRequest(7, 0, 11, [1, 2, 3, 4], 2)
+    request_rings[0].put(req.to_record)
+    got = TrackRequest.from_record(request_rings[0].pop())
+    assert (got.request_id, got.frame_index, got.rect, got.rect_id, got.rects) == (7, 11, [1, 2, 3, 4], 2, None)
+    assert got.post_time == req.post_time
+    assert request_rings[0].pop() is None
+    close_rings(request_rings, result_rings)
+
+
+def pop_all(ring, num):
+    return [int(ring.pop()['request_id']) for i in range(num)]
+
+
+def test_ring_blocks_until_pooled_consumer_pops():
+    ring = SharedRecordRing(request_dtype(4), 2)
+    # workers forked after the ring inherit its semaphores, the ring itself is pickled by name
+    with Pool(1) as pool:
+        for i in range(2):
+            assert ring.put(lambda record: record.__setitem__('request_id', i))
+        assert ring.reserve(timeout=0) is None
+        future = pool.apply_async(pop_all, (ring, 2))
+        # a free record is announced by the consumer's pop, the producer does not poll
+        s = time.time()
+        assert ring.put(lambda record: record.__setitem__('request_id', 2), timeout=5)
+        assert time.time() - s < 1
+        assert future.get(5) == [0, 1]
+    assert ring.wait(0)
+    assert int(ring.pop()['request_id']) == 2
+    ring.close()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_track_scheduler.py
+@time: 10/19/26 8:40 PM
+@version 1.0
+@desc: fair queuing, deadline drop and coalescing of tracking requests
+"""
+from queue import Queue
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from pysot.tracker.service import TrackRequest, TrackResult, TrackScheduler, deliver, drop_cancelled, \
+    unpack_results
+from pysot.tracker.transport import SharedRecordRing, result_dtype
+
+
+@pytest.fixture
+def scheduler(load_cfg):
+    def build(num=2, latest=0, **kwargs):
+        cfgs = {i: load_cfg(index=i) for i in range(num)}
+        caches = {i: SimpleNamespace(latest=lambda: latest) for i in range(num)}
+        return TrackScheduler(cfgs, caches, {}, Queue(1), **kwargs)
+
+    return build
+
+
+def test_round_robin_across_cameras(scheduler):
+    s = scheduler(coalesce=False)
+    for i in range(5):
+        s.put(TrackRequest(i, 0, 0, [0, 0, 10, 10], 0))
+    s.put(TrackRequest(100, 1, 0, [0, 0, 10, 10], 0))
+    order = [(r.monitor_index, r.request_id) for r in iter(s.next, None)]
+    # the single request of camera 1 is not queued behind the burst of camera 0
+    assert order[:2] == [(0, 0), (1, 100)]
+    assert len(order) == 6
+
+
+def test_expired_requests_dropped(scheduler):
+    cancelled = {}
+    horizon = scheduler().horizon[0]
+    # the template frame is kept as long as fewer frames than horizon are written after it, however long it waits
+    s = scheduler(latest=horizon - 1)
+    req = TrackRequest(1, 0, 0, [0, 0, 10, 10], 0)
+    req.post_time = 0
+    s.put(req)
+    assert s.next() is req
+    s = scheduler(latest=horizon, cancelled=cancelled)
+    s.put(TrackRequest(1, 0, 0, [0, 0, 10, 10], 0))
+    cancelled[(0, 1)] = True
+    assert s.next() is None
+    assert s.metrics[0]['expired'] == 1
+    # the cancellation of an expired request is not left behind
+    assert not len(cancelled)
+
+
+def test_coalesce_same_frame(scheduler):
+    cancelled = {}
+    s = scheduler(cancelled=cancelled)
+    s.put(TrackRequest(1, 0, 10, [0, 0, 10, 10], 0))
+    s.put(TrackRequest(2, 0, 10, None, None, rects=[[20, 20, 30, 30], [40, 40, 50, 50]]))
+    s.put(TrackRequest(3, 0, 11, [0, 0, 10, 10], 0))
+    assert s.metrics[0]['coalesced'] == 1
+    req = s.next()
+    assert req.rects == [[0, 0, 10, 10], [20, 20, 30, 30], [40, 40, 50, 50]]
+    output = [TrackResult(i, [(10, rect)], [0.5 + i / 10]) for i, rect in enumerate(req.rects)]
+    ring = SharedRecordRing(result_dtype(4, 4), 4)
+    deliver({0: ring}, req, output)
+    delivered = dict(unpack_results(ring.pop()) for _ in range(2))
+    ring.close()
+    assert [r.rect_id for r in delivered[1]] == [0]
+    assert [(r.rect_id, r.result[0][1]) for r in delivered[2]] == [(0, [20, 20, 30, 30]), (1, [40, 40, 50, 50])]
+    assert np.allclose([r.scores[0] for r in delivered[2]], [0.6, 0.7])
+    # a cancelled part is removed, the rest is still tracked
+    cancelled[(0, 1)] = True
+    assert not drop_cancelled(cancelled, req)
+    assert [p[0] for p in req.parts] == [2]
+    cancelled[(0, 2)] = True
+    assert drop_cancelled(cancelled, req)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_track_window.py
+@time: 10/19/26 6:50 PM
+@version 1.0
+@desc: early termination, stride interpolation and lazy fetch of tracking windows
+"""
+import numpy as np
+
+from pysot.tracker.service import TrackWindowPolicy, fetch_window, track_window
+
+
+class CountingCache(object):
+
+    def __init__(self):
+        self.fetched = []
+
+    def get(self, index):
+        self.fetched.append(index)
+        return index
+
+
+def fake_track(scores, boxes=None):
+    def track_fn(frame, targets):
+        return [{'best_score': scores[t](frame), 'bbox': boxes[t](frame) if boxes else [frame, frame, frame + 10,
+                                                                                           frame + 10]}
+                for t in targets]
+
+    return track_fn
+
+
+def test_early_stop_after_lost_frames_with_lazy_fetch(load_cfg):
+    policy = TrackWindowPolicy(load_cfg(search_window_size=20, track_lost_frames=3, track_lazy_fetch=True))
+    cache = CountingCache()
+    frames = fetch_window(cache, 0, 20, policy.stride, policy.lazy_fetch)
+    # target 0 is lost after frame 5, target 1 is kept all the time
+    track_fn = fake_track([lambda i: 0.9 if i <= 5 else 0.1, lambda i: 0.9])
+    results = track_window(track_fn, [(0, [0, 0, 10, 10]), (0, [0, 0, 10, 10])], frames, 0.5, policy)
+    assert [i for i, _ in results[0]] == list(range(0, 6))
+    assert len(results[1]) == 21
+    # all targets lost, frames after the last alive one are never fetched
+    cache = CountingCache()
+    frames = fetch_window(cache, 0, 20, policy.stride, policy.lazy_fetch)
+    track_window(fake_track([lambda i: 0.1]), [(0, [0, 0, 10, 10])], frames, 0.5, policy)
+    assert cache.fetched == [1, 2, 3]
+
+
+def test_stop_out_of_roi(load_cfg):
+    cfg = load_cfg(search_window_size=20, track_stop_out_roi=True)
+    policy = TrackWindowPolicy(cfg)
+    y = cfg.roi['y']
+    boxes = [lambda i: [100, y + 100 - i * 20, 140, y + 140 - i * 20]]
+    results = track_window(fake_track([lambda i: 0.9], boxes), [(0, [100, y + 100, 140, y + 140])],
+                           fetch_window(CountingCache(), 0, 20), 0.5, policy)
+    # center leaves roi at frame 7
+    assert results[0][-1][0] == 7
+
+
+def test_stride_interpolation(load_cfg):
+    policy = TrackWindowPolicy(load_cfg(search_window_size=20, track_stride=4))
+    cache = CountingCache()
+    frames = fetch_window(cache, 0, 20, policy.stride)
+    assert cache.fetched == [4, 8, 12, 16, 20]
+    results = track_window(fake_track([lambda i: 0.1 if i == 12 else 0.9]), [(0, [0, 0, 10, 10])], frames, 0.5,
+                           policy)
+    indices = [i for i, _ in results[0]]
+    # frames around the low score frame 12 are not filled
+    assert indices == list(range(0, 9)) + list(range(16, 21))
+    assert results[0][2][1] == [2, 2, 12, 12]
+
+
+def test_scores_of_rows(load_cfg):
+    policy = TrackWindowPolicy(load_cfg(search_window_size=20, track_stride=4))
+    results, scores = track_window(fake_track([lambda i: 0.5 + i / 100]), [(0, [0, 0, 10, 10])],
+                                   fetch_window(CountingCache(), 0, 8, policy.stride), 0.5, policy, with_scores=True)
+    assert len(scores[0]) == len(results[0]) == 9
+    # template and interpolated rows are not scored by tracker
+    assert np.isnan(scores[0][:4]).all() and np.isnan(scores[0][5:8]).all()
+    assert scores[0][4] == 0.54 and scores[0][8] == 0.58
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: test_trajectory_association.py
+@time: 10/20/26 6:00 AM
+@version 1.0
+@desc: trajectory association and closed-form fits of post filter against the greedy and leastsq versions
+"""
+import math
+
+import numpy as np
+from scipy.optimize import leastsq
+
+from detection.render import Filter, Obj
+
+
+def legacy_obj_list(cfg, result_set):
+    """
+    greedy nearest rect association, each object takes its nearest rect even if another object took it
+    """
+    obj_list = []
+    for i, (idx, rects) in enumerate(result_set):
+        flag_list = [False] * len(rects)
+        if i > 0:
+            for obj in obj_list:
+                dst = [Obj.cal_dst(obj.get_last_rect()[1], rect) for rect in rects]
+                min_pos = dst.index(min(dst))
+                if obj.append_with_rules(idx, rects[min_pos]):
+                    flag_list[min_pos] = True
+        for j in range(len(rects)):
+            if not flag_list[j]:
+                obj = Obj(len(obj_list), cfg)
+                obj.append_with_rules(idx, rects[j])
+                obj_list.append(obj)
+    return obj_list
+
+
+def legacy_line_angle(x, y):
+    a, b = leastsq(lambda p, x, y: p[0] * x + p[1] - y, np.array([0, 0]), args=(x, y))[0]
+    return 180 * math.atan(a) / math.pi
+
+
+def trajectories(seed, n=60):
+    """
+    result set of a dolphin surfacing, a float drifting, a bird crossing and a few flashes of noise,
+    targets keep apart so the nearest rect of each object is unambiguous
+    """
+    rng = np.random.RandomState(seed)
+    # far enough apart that no object can reach another target within disappear_frames_thresh frames
+    targets = [(5, 30, (100, 200), (2, 0.5)), (0, n, (1500, 600), (0.5, 0)), (20, 26, (100, 1400), (60, 5))]
+    result_set = []
+    for idx in range(n):
+        rects = []
+        for begin, end, (x, y), (vx, vy) in targets:
+            # detections are lost now and then, less than disappear_frames_thresh in a row
+            if begin <= idx < end and rng.rand() > 0.2:
+                cx = x + vx * (idx - begin) + rng.randn()
+                cy = y + vy * (idx - begin) + rng.randn()
+                rects.append([cx - 20, cy - 10, cx + 20, cy + 10])
+        if rng.rand() < 0.05:
+            cx, cy = rng.randint(2500, 3500), rng.randint(100, 1000)
+            rects.append([cx - 10, cy - 10, cx + 10, cy + 10])
+        if len(rects):
+            result_set.append((idx, rects))
+    return result_set
+
+
+def summary(obj_list, float_trace_list):
+    for obj in obj_list:
+        obj.predict_category(float_trace_list)
+    return [(obj.category, obj.continue_idx_sum, round(obj.mid_avg_speed, 6),
+             [(idx, [round(v, 6) for v in rect]) for idx, rect in obj.trace]) for obj in obj_list]
+
+
+def test_same_traces_as_greedy_association(tmp_path, trajectory_cfg):
+    cfg = trajectory_cfg()
+    post_filter = Filter(cfg, tmp_path)
+    float_trace_list = []
+    categories = set()
+    for seed in range(20):
+        result_set = trajectories(seed)
+        expected = summary(legacy_obj_list(cfg, result_set), float_trace_list)
+        obj_list = post_filter.get_obj_list_from_result_set(result_set)
+        assert summary(obj_list, float_trace_list) == expected
+        categories.update(category for category, _, _, _ in expected)
+        # floats of this window are the history of the next one
+        float_trace_list = [obj.trace for obj in obj_list if obj.category == 'float']
+    assert categories >= {'dolphin', 'float', 'bird'}
+
+
+def test_same_traces_on_detected_frames(tmp_path, trajectory_cfg, moving_blob):
+    cfg = trajectory_cfg()
+    post_filter = Filter(cfg, tmp_path)
+    result_set = post_filter.detect_frames(moving_blob(20))
+    assert len(result_set) > 1
+    expected = summary(legacy_obj_list(cfg, result_set), [])
+    assert summary(post_filter.get_obj_list_from_result_set(result_set), []) == expected
+
+
+def test_rect_assigned_once(tmp_path, trajectory_cfg):
+    cfg = trajectory_cfg()
+    result_set = [(0, [[100, 100, 120, 120], [140, 100, 160, 120]]), (1, [[120, 100, 140, 120]])]
+    # both objects are nearest to the only rect of frame 1, the greedy version puts it into both traces
+    legacy = legacy_obj_list(cfg, result_set)
+    assert [len(obj.trace) for obj in legacy] == [2, 2]
+    obj_list = Filter(cfg, tmp_path).get_obj_list_from_result_set(result_set)
+    assert [len(obj.trace) for obj in obj_list] == [2, 1]
+    # a one-to-one match keeps the nearer object instead of the first one
+    result_set = [(0, [[100, 100, 120, 120], [140, 100, 160, 120]]), (1, [[135, 100, 155, 120], [0, 100, 20, 120]])]
+    obj_list = Filter(cfg, tmp_path).get_obj_list_from_result_set(result_set)
+    assert [[idx for idx, _ in obj.trace] for obj in obj_list] == [[0, 1], [0, 1]]
+    assert obj_list[0].trace[1][1] == [0, 100, 20, 120]
+    assert obj_list[1].trace[1][1] == [135, 100, 155, 120]
+
+
+def test_gated_and_disappeared_objects(tmp_path, trajectory_cfg):
+    cfg = trajectory_cfg()
+    thresh = cfg.alg['disappear_frames_thresh']
+    result_set = [(0, [[100, 100, 120, 120]]), (1, [[100 + Obj.MAX_STEP_DST + 10, 100, 120 + Obj.MAX_STEP_DST + 10, 120]]),
+                  (2 + thresh, [[100, 100, 120, 120]])]
+    obj_list = Filter(cfg, tmp_path).get_obj_list_from_result_set(result_set)
+    assert [len(obj.trace) for obj in obj_list] == [1, 1, 1]
+    assert not obj_list[0].status and not obj_list[1].status
+
+
+def test_closed_form_fits(trajectory_cfg):
+    rng = np.random.RandomState(0)
+    obj = Obj(0, trajectory_cfg())
+    for _ in range(20):
+        x = rng.uniform(0, 900, size=20)
+        y = rng.uniform(-0.5, 0.5) * x + 300 + rng.randn(20) * 5
+        a, b = obj.solve_linear_lsq(x, y)[0]
+        assert abs(180 * math.atan(a) / math.pi - legacy_line_angle(x, y)) < 1e-3
+        area = -rng.uniform(0, 10) * (np.arange(20) - 10) ** 2 + 2000 + rng.randn(20)
+        assert obj.is_quadratic_with_negative_a(area.tolist())
+        assert not obj.is_quadratic_with_negative_a((-area).tolist())
+    # centers on a vertical line never fit a horizontal one
+    obj.trace = [(0, [100, 100, 120, 120]), (1, [100, 200, 120, 220])]
+    assert not obj.fitting_horizontal_line([(0, [100, 300, 120, 320])])
+    obj.trace = [(0, [100, 100, 120, 120]), (1, [140, 102, 160, 122])]
+    assert obj.fitting_horizontal_line([(0, [400, 105, 420, 125])])
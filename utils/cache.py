@@ -13,12 +13,17 @@
 from multiprocessing import shared_memory
 from multiprocessing.managers import SharedMemoryManager
 from multiprocessing import Manager
+from collections import OrderedDict
 import numpy as np
 
+from .common import createHistFeature, normalization
+
 
 class SharedMemoryFrameCache(object):
     """
-    shared_memory.ShareMemory wrapper for r/w shared memory as a original List
+    shared_memory.ShareMemory wrapper for r/w shared memory as a original List.
+    A header block records the frame index held by each slot and the latest written index,
+    readers can wait for a frame to be written and detect slots lapped by newer frames.
     """
 
     def __init__(self, manager: SharedMemoryManager, cache_size, unit, shape) -> None:
@@ -30,6 +35,56 @@ class SharedMemoryFrameCache(object):
         self.lock = Manager().Lock()
         self.st_id = Manager().Value('i', cache_size)
         self.et_id = Manager().Value('i', -1)
+        # int64 frame index of each slot followed by the latest written index, -1 if nothing is written
+        self.header_block = manager.SharedMemory(size=8 * (cache_size + 1))
+        self.headers()[:] = -1
+        # notified whenever a frame is written
+        self.arrival = Manager().Condition()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # numpy views of shared memory must not be pickled, they would be copied
+        state.pop('_headers', None)
+        return state
+
+    def headers(self):
+        if getattr(self, '_headers', None) is None:
+            self._headers = np.ndarray((self.cache_size + 1,), dtype=np.int64, buffer=self.header_block.buf)
+        return self._headers
+
+    def slot_index(self, index):
+        """
+        :return: frame index currently held by the slot of index
+        """
+        return int(self.headers()[index % self.cache_size])
+
+    def latest(self):
+        return int(self.headers()[self.cache_size])
+
+    def wait(self, index, timeout=None):
+        """
+        block until frame index has been written, no polling
+        :param index: frame index
+        :param timeout: seconds, wait forever if None
+        :return: False if timeout
+        """
+        if self.latest() >= index:
+            return True
+        with self.arrival:
+            return self.arrival.wait_for(lambda: self.latest() >= index, timeout)
+
+    def get(self, index):
+        """
+        cache[index] with exact index verification, the slot is verified again after it is copied like a seqlock,
+        a writer marks the slot before overwriting it, so a copy torn by a lapping writer is never returned
+        :return: private copy of frame, None if slot doesn't hold frame index (not written yet or lapped)
+        """
+        if self.slot_index(index) != index:
+            return None
+        frame = self[index].copy()
+        if self.slot_index(index) != index:
+            return None
+        return frame
 
     def lock_cache(self, st_index, et_index):
         """
@@ -57,12 +112,15 @@ class SharedMemoryFrameCache(object):
 
     def __getitem__(self, index):
         """
-        cache[index]
+        cache[index], the frame is a read-only view of the slot,
+        call utils.copy_on_write() before drawing on it.
         :param index:
         :return:
         """
         buf = self.get_buf(index)
-        return np.ndarray(self.shape, dtype=np.uint8, buffer=buf)
+        frame = np.ndarray(self.shape, dtype=np.uint8, buffer=buf)
+        frame.flags.writeable = False
+        return frame
 
     def __setitem__(self, index, frame):
         """
@@ -83,9 +141,18 @@ class SharedMemoryFrameCache(object):
             self.set(frame, index)
 
     def set(self, frame, index):
+        headers = self.headers()
+        slot = index % self.cache_size
+        # readers see the slot is being overwritten
+        headers[slot] = -1
         buf = self.get_buf(index)
         buf_frame = np.ndarray(self.shape, dtype=np.uint8, buffer=buf)
         buf_frame[:, :, :] = frame[:, :, :]
+        headers[slot] = index
+        if index > headers[self.cache_size]:
+            headers[self.cache_size] = index
+        with self.arrival:
+            self.arrival.notify_all()
 
     def is_closed(self):
         return self.cache_block.close()
@@ -105,8 +172,11 @@ class SharedMemoryFrameCache(object):
         return buf
 
     def close(self):
+        self._headers = None
         self.cache_block.close()
         self.cache_block.unlink()
+        self.header_block.close()
+        self.header_block.unlink()
 
 
 class ListCache(object):
@@ -118,12 +188,40 @@ class ListCache(object):
         self.proxy = manager.list([None] * cache_size)
         self.cache_size = cache_size
         self.template = template
+        # frame index of each slot and the latest written index, same as SharedMemoryFrameCache
+        self.indices = manager.list([-1] * cache_size)
+        self.latest_index = manager.Value('i', -1)
+        self.arrival = manager.Condition()
 
     def __getitem__(self, index):
         return self.proxy[index % self.cache_size]
 
     def __setitem__(self, index, frame):
         self.proxy[index % self.cache_size] = frame
+        self.indices[index % self.cache_size] = index
+        if index > self.latest_index.get():
+            self.latest_index.set(index)
+        with self.arrival:
+            self.arrival.notify_all()
+
+    def slot_index(self, index):
+        return self.indices[index % self.cache_size]
+
+    def latest(self):
+        return self.latest_index.get()
+
+    def wait(self, index, timeout=None):
+        if self.latest() >= index:
+            return True
+        with self.arrival:
+            return self.arrival.wait_for(lambda: self.latest() >= index, timeout)
+
+    def get(self, index):
+        # frame is a copy from manager, it can't be lapped after it is returned
+        frame = self.proxy[index % self.cache_size]
+        if self.slot_index(index) != index:
+            return None
+        return frame
 
     def append(self, frame):
         return self.proxy.append(frame)
@@ -133,3 +231,125 @@ class ListCache(object):
             print('List Cache: Empty Frame.Return Template Instead.')
             return self.template
         return self.proxy.pop()
+
+
+class ResultReuseCache(object):
+    """
+    reuse the last model results if the sampled frame is nearly identical to the last inferred frame.
+    The frame signature is a normalized color histogram of a sub-sampled ROI, two frames are identical
+    if the cosine distance of their signatures is less than thresh.
+    Results are reused for at most max_age frames since the last real inference.
+    """
+
+    def __init__(self, thresh, max_age, geometry, sample_width=128) -> None:
+        """
+        :param thresh: cosine distance threshold, VideoConfig.reuse_dist_thresh
+        :param max_age: max frames distance between a reused frame and the last inferred frame
+        :param geometry: FrameGeometry of camera, signature is computed inside ROI only
+        :param sample_width: approximate width of sub-sampled ROI
+        """
+        self.thresh = thresh
+        self.max_age = max_age
+        self.roi_slice = geometry.roi_slice
+        self.stride = max(1, geometry.roi_w // sample_width)
+        self.signature = None
+        self.index = None
+        self.results = None
+        self.pending = None
+        self.hit = 0
+        self.total = 0
+
+    def sign(self, frame):
+        """
+        cheap per-frame signature, the ROI is sub-sampled by a strided view without copying
+        :param frame: original frame
+        :return: normalized histogram feature
+        """
+        sampled = frame[self.roi_slice][::self.stride, ::self.stride]
+        return np.squeeze(normalization(createHistFeature(sampled)))
+
+    def lookup(self, frame, index):
+        """
+        :param frame: original frame
+        :param index: frame index
+        :return: results of last inferred frame if reusable, otherwise None
+        """
+        self.total += 1
+        self.pending = self.sign(frame)
+        if self.signature is None or index - self.index > self.max_age:
+            return None
+        if 1 - np.dot(self.pending, self.signature) > self.thresh:
+            return None
+        self.hit += 1
+        return self.results
+
+    def update(self, index, results):
+        """
+        record model results of frame index, must be called after a missed lookup() on the same frame
+        :param index: frame index
+        :param results: model results
+        :return:
+        """
+        self.signature = self.pending
+        self.index = index
+        self.results = results
+
+    def hit_rate(self):
+        return self.hit / self.total if self.total else 0
+
+
+class TemplateCache(object):
+    """
+    LRU cache of tracker templates of one camera. A template is keyed by its box quantized into a grid of quant pixels
+    (center and size), it is reusable by later requests within max_gap frames.
+    """
+
+    def __init__(self, capacity, quant=16, max_gap=250) -> None:
+        """
+        :param capacity: max templates kept
+        :param quant: grid size in pixels of box center and size
+        :param max_gap: max frames distance between template frame and a reusing frame
+        """
+        self.capacity = capacity
+        self.quant = quant
+        self.max_gap = max_gap
+        self.entries = OrderedDict()
+        self.hit = 0
+        self.total = 0
+
+    def key(self, rect):
+        """
+        :param rect: [x1, y1, x2, y2]
+        :return: quantized (cx, cy, w, h)
+        """
+        cx, cy = (rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2
+        return tuple(int(round(v / self.quant)) for v in (cx, cy, rect[2] - rect[0], rect[3] - rect[1]))
+
+    def lookup(self, index, rect):
+        """
+        :param index: template frame index of request
+        :param rect: [x1, y1, x2, y2]
+        :return: template or None
+        """
+        self.total += 1
+        key = self.key(rect)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        template_index, template = entry
+        if not 0 <= index - template_index <= self.max_gap:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        self.hit += 1
+        return template
+
+    def update(self, index, rect, template):
+        key = self.key(rect)
+        self.entries[key] = (index, template)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        return self.hit / self.total if self.total else 0
@@ -23,6 +23,7 @@ import cv2
 # import imutils
 import time
 from .crop import crop_by_roi
+from .geometry import FrameGeometry
 from skimage.measure import compare_ssim
 import numpy as np
 import imutils
@@ -31,12 +32,14 @@ import imutils
 def preprocess(frame, cfg: VideoConfig):
     """
     some preprocess operation such as denoising, image enhancement and crop by ROI
+    frame is never copied here, both outputs are read-only views of the input buffer(usually a shared memory slot),
+    a stage that needs to draw on the frame must call copy_on_write() explicitly.
     :param frame:
     :param cfg: well-define frame detection range by ROI
     :return: processed frame, original frame
     """
-    original_frame = frame.copy()
-    frame = crop_by_roi(frame, cfg.roi)
+    original_frame = read_only(frame)
+    frame = crop_by_roi(original_frame, cfg.roi)
     if cfg.resize['scale'] != -1:
         frame = cv2.resize(frame, (0, 0), fx=cfg.resize['scale'], fy=cfg.resize['scale'])
     elif cfg.resize['width'] != -1:
@@ -50,9 +53,36 @@ def preprocess(frame, cfg: VideoConfig):
     return frame, original_frame
 
 
+def read_only(frame):
+    """
+    wrap frame as a non-writeable view without copying its buffer,
+    any in-place operation on the view raises an error instead of polluting the source
+    :param frame: numpy frame, may be a view of shared memory slot
+    :return: read-only view
+    """
+    if frame is None:
+        return None
+    view = frame.view()
+    view.flags.writeable = False
+    return view
+
+
+def copy_on_write(frame):
+    """
+    get a private writeable frame before drawing something on it.
+    read-only views are copied, frames owned by caller are returned directly.
+    :param frame:
+    :return: writeable frame
+    """
+    if frame is None or frame.flags.writeable:
+        return frame
+    return frame.copy()
+
+
 def back(rects, start, shape, original_shape, cfg: VideoConfig):
     """
-    recover original bounding box size after detection-based down sample and divide blocks frame
+    recover original bounding box size after detection-based down sample and divide blocks frame,
+    prefer a per-camera FrameGeometry, this helper rebuilds it on every call
     :param rects: detected bbox based cropped or resized frames
     :param start: start position of frame block
     :param shape: current shape
@@ -62,21 +92,7 @@ def back(rects, start, shape, original_shape, cfg: VideoConfig):
     """
     if not len(rects):
         return rects
-    b_rects = []
-    ratio = 1
-    if cfg.resize['scale'] != -1:
-        ratio = cfg.resize['scale']
-    elif cfg.resize['width'] != -1:
-        ratio = original_shape[1] / cfg.routine['col'] / shape[1]
-    elif cfg.resize['height'] != -1:
-        ratio = original_shape[0] / cfg.routine['row'] / shape[0]
-    for r in rects:
-        x = int((r[0] + start[0]) * ratio + cfg.roi['x'])
-        y = int((r[1] + start[1]) * ratio + cfg.roi['y'])
-        w = int(r[2] * ratio)
-        h = int(r[3] * ratio)
-        b_rects.append((x, y, x + w, y + h))
-    return b_rects
+    return FrameGeometry(cfg, original_shape).block_to_original(rects, start).tolist()
 
 
 def cvt_rect(rects):
@@ -152,28 +168,34 @@ def sec2time(sec, n_msec=1):
     return ('%d days, ' + pattern) % (d, h, m, s)
 
 
+# bin index of each pixel value, 16 bins over [0, 255)
+_HIST_BIN_LUT = (np.arange(256) * 16 // 255).astype(np.int64)
+
+
 def createHistFeature(grid, small_grid=3):
     """
     # 生成颜色直方图特征
+    all cells and channels are counted by a single bincount pass, result is the same as
+    27 calcHist calls of 16 bins over [0, 255) on each cell
     :param grid: 数据
     :param small_grid: 细分的网格数
     :return: 数据的特征
     """
-    hist_mask = np.array([])
+    bins = 16
+    hist_len = small_grid * small_grid * 3 * bins
     colnum = int(grid.shape[1] / small_grid)
     rownum = int(grid.shape[0] / small_grid)
-    for i in range(small_grid):
-        for j in range(small_grid):
-            image = grid[i * colnum:(i + 1) * colnum, j * rownum:(j + 1) * rownum, :]
-            hist_mask0 = cv2.calcHist([image], [0], None, [16], [0, 255])
-            hist_mask1 = cv2.calcHist([image], [1], None, [16], [0, 255])
-            hist_mask2 = cv2.calcHist([image], [2], None, [16], [0, 255])
-            hist_mask_small = np.concatenate((hist_mask0, hist_mask1, hist_mask2), axis=0)
-            if (len(hist_mask) == 0):
-                hist_mask = hist_mask_small
-            else:
-                hist_mask = np.concatenate((hist_mask, hist_mask_small), axis=0)
-    return hist_mask
+    if not colnum or not rownum:
+        return np.zeros((hist_len, 1), dtype=np.float32)
+    # cells are sliced by [i * colnum, j * rownum] as before, pixels out of cells are ignored
+    h = min(grid.shape[0], small_grid * colnum)
+    w = min(grid.shape[1], small_grid * rownum)
+    cell = (np.arange(h) // colnum)[:, None] * small_grid + (np.arange(w) // rownum)[None, :]
+    # 255 falls in the extra 17th bin and is dropped, as calcHist excludes the upper bound
+    key = _HIST_BIN_LUT[grid[:h, :w, :3]] + (cell[:, :, None] * 3 + np.arange(3)) * (bins + 1)
+    hist = np.bincount(key.ravel(), minlength=small_grid * small_grid * 3 * (bins + 1))
+    hist = hist.reshape(-1, bins + 1)[:, :bins]
+    return hist.reshape(hist_len, 1).astype(np.float32)
 
 
 def normalization(data):
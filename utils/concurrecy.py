@@ -18,10 +18,15 @@ import multiprocessing
 # We must import this explicitly, it is not imported by the top-level
 # multiprocessing module.
 import multiprocessing.pool
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future
 
 from random import randint
 
+from .log import logger
+
 
 class NoDaemonProcess(multiprocessing.Process):
     # make 'daemon' attribute always return False
@@ -38,3 +43,157 @@ class NoDaemonProcess(multiprocessing.Process):
 # because the latter is only a wrapper function, not a proper class.
 class NoDaemonPool(multiprocessing.pool.Pool):
     Process = NoDaemonProcess
+
+
+class BoundedExecutor(object):
+    """
+    Run tasks by a fixed number of worker threads, tasks wait in a bounded queue instead of each starting a thread.
+    A task may carry a frame window [start, end]. A new task whose window overlaps a waiting task is merged into it
+    by policy 'merge', or dropped by policy 'drop' if it overlaps a waiting or running task.
+    New tasks are rejected once the queue is full.
+    """
+
+    POLICIES = ['merge', 'drop', 'none']
+
+    def __init__(self, workers=2, max_queue=8, policy='merge', merge=None, name='Executor',
+                 metric_interval=60) -> None:
+        """
+        :param workers: worker threads
+        :param max_queue: max waiting tasks
+        :param policy: merge, drop or none, how a task overlapping others is handled
+        :param merge: merge(waiting_args, new_args) returns args of the merged task, or None if they can't be merged,
+        the new task is absorbed by the waiting one if merge is None
+        :param name: log prefix
+        :param metric_interval: seconds between two metric logs
+        """
+        super().__init__()
+        if policy not in self.POLICIES:
+            raise Exception(f'Unknown overlap policy [{policy}], should be one of {self.POLICIES}.')
+        self.workers = workers
+        self.max_queue = max_queue
+        self.policy = policy
+        self.merge = merge
+        self.name = name
+        self.metric_interval = metric_interval
+        self.pending = deque()
+        self.running = {}
+        self.cond = threading.Condition()
+        self.closed = False
+        self.cancelled = threading.Event()
+        self.metrics = {'submitted': 0, 'merged': 0, 'dropped': 0, 'rejected': 0, 'done': 0, 'failed': 0,
+                        'cancelled': 0, 'max_depth': 0, 'wait': 0., 'max_wait': 0., 'run': 0., 'max_run': 0.}
+        self.last_report = time.time()
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    @staticmethod
+    def overlap(a, b):
+        return a is not None and b is not None and a[0] <= b[1] and b[0] <= a[1]
+
+    def submit(self, fn, *args, window=None):
+        """
+        :param fn: task function
+        :param args: task arguments
+        :param window: (start, end) frame window of task
+        :return: Future of task, the future of the waiting task if merged, None if dropped or rejected
+        """
+        with self.cond:
+            if self.closed:
+                return None
+            self.metrics['submitted'] += 1
+            if self.policy == 'drop' and any(self.overlap(window, w) for w in
+                                             [t[2] for t in self.pending] + list(self.running.values())):
+                self.metrics['dropped'] += 1
+                logger.info(f'{self.name}: task of window {window} overlaps others, dropped.')
+                return None
+            if self.policy == 'merge':
+                for i, (future, waiting_args, w, waiting_fn, post_time) in enumerate(self.pending):
+                    if waiting_fn != fn or not self.overlap(window, w):
+                        continue
+                    merged = waiting_args if self.merge is None else self.merge(waiting_args, args)
+                    if merged is None:
+                        continue
+                    self.pending[i] = (future, merged, (min(w[0], window[0]), max(w[1], window[1])), fn, post_time)
+                    self.metrics['merged'] += 1
+                    logger.info(f'{self.name}: task of window {window} is merged into a waiting task.')
+                    return future
+            if len(self.pending) >= self.max_queue:
+                self.metrics['rejected'] += 1
+                logger.info(f'{self.name}: queue is full, task of window {window} is rejected.')
+                return None
+            future = Future()
+            self.pending.append((future, args, window, fn, time.time()))
+            self.metrics['max_depth'] = max(self.metrics['max_depth'], len(self.pending))
+            self.cond.notify()
+            return future
+
+    def work(self):
+        while True:
+            with self.cond:
+                while not len(self.pending) and not self.closed:
+                    self.cond.wait()
+                if not len(self.pending):
+                    return
+                future, args, window, fn, post_time = self.pending.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self.running[future] = window
+                wait = time.time() - post_time
+                self.metrics['wait'] += wait
+                self.metrics['max_wait'] = max(self.metrics['max_wait'], wait)
+            start = time.time()
+            try:
+                future.set_result(fn(*args))
+                failed = False
+            except Exception as e:
+                logger.error(f'{self.name}: {e}')
+                future.set_exception(e)
+                failed = True
+            elapse = time.time() - start
+            with self.cond:
+                self.running.pop(future, None)
+                self.metrics['failed' if failed else 'done'] += 1
+                self.metrics['run'] += elapse
+                self.metrics['max_run'] = max(self.metrics['max_run'], elapse)
+                report = time.time() - self.last_report > self.metric_interval
+                if report:
+                    self.last_report = time.time()
+            if report:
+                self.report()
+
+    def depth(self):
+        with self.cond:
+            return len(self.pending)
+
+    def report(self):
+        with self.cond:
+            m = dict(self.metrics)
+            depth, running = len(self.pending), len(self.running)
+        started = m['done'] + m['failed']
+        mean_wait = m['wait'] / started if started else 0
+        mean_run = m['run'] / started if started else 0
+        logger.info(f'{self.name}: queue depth [{depth}], max depth [{m["max_depth"]}], running [{running}], '
+                    f'submitted [{m["submitted"]}], done [{m["done"]}], failed [{m["failed"]}], '
+                    f'merged [{m["merged"]}], dropped [{m["dropped"]}], rejected [{m["rejected"]}], '
+                    f'cancelled [{m["cancelled"]}], mean wait [{round(mean_wait, 3)}]s, '
+                    f'max wait [{round(m["max_wait"], 3)}]s, mean run [{round(mean_run, 3)}]s, '
+                    f'max run [{round(m["max_run"], 3)}]s')
+        return m
+
+    def shutdown(self, cancel=True, timeout=None):
+        """
+        :param cancel: cancel waiting tasks, otherwise they are still executed
+        :param timeout: seconds to wait for each worker
+        """
+        with self.cond:
+            self.closed = True
+            if cancel:
+                self.cancelled.set()
+                while len(self.pending):
+                    future = self.pending.popleft()[0]
+                    future.cancel()
+                    self.metrics['cancelled'] += 1
+            self.cond.notify_all()
+        for t in self.threads:
+            t.join(timeout)
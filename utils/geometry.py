@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: geometry.py
+@time: 10/19/26 2:05 PM
+@version 1.0
+@desc: per-camera coordinate transforms between original frame, ROI-resized frame and detection blocks
+"""
+import cv2
+import numpy as np
+
+from config import VideoConfig
+from .crop import in_range
+
+
+class FrameGeometry(object):
+    """
+    ROI offsets, resize factors and block layout of a camera are fixed by its configuration,
+    compute them once and map rects of a whole frame in a single vectorized pass,
+    instead of re-deriving bounds and ratios for every rect in every frame.
+    All boxes are (x1, y1, x2, y2) int arrays in original frame coordinates, rounded by the same rule.
+    """
+
+    def __init__(self, cfg: VideoConfig, shape=None) -> None:
+        """
+        :param cfg: video configuration, defines roi, resize, routine and bbox size
+        :param shape: original frame shape, cfg.shape by default
+        """
+        super().__init__()
+        self.cfg = cfg
+        self.shape = tuple(shape if shape is not None else cfg.shape)
+        self.height, self.width = self.shape[0], self.shape[1]
+        roi = cfg.roi
+        self.roi_x, self.roi_y = roi['x'], roi['y']
+        self.roi_w = roi['width'] if roi['width'] != -1 else self.width - self.roi_x
+        self.roi_h = roi['height'] if roi['height'] != -1 else self.height - self.roi_y
+        is_in_range = in_range(self.roi_y, self.height) and in_range(self.roi_x, self.width) \
+                      and self.roi_y + self.roi_h <= self.height and self.roi_x + self.roi_w <= self.width
+        if not is_in_range:
+            raise Exception('Crop range out of bound.')
+        self.roi_slice = (slice(self.roi_y, self.roi_y + self.roi_h), slice(self.roi_x, self.roi_x + self.roi_w))
+        # keep the same output size and interpolation as preprocess(), see cv2.resize and imutils.resize
+        self.interpolation = cv2.INTER_AREA
+        if cfg.resize['scale'] != -1:
+            self.pre_w = int(round(self.roi_w * cfg.resize['scale']))
+            self.pre_h = int(round(self.roi_h * cfg.resize['scale']))
+            self.interpolation = cv2.INTER_LINEAR
+        elif cfg.resize['width'] != -1:
+            self.pre_w = cfg.resize['width']
+            self.pre_h = int(self.roi_h * (cfg.resize['width'] / float(self.roi_w)))
+        elif cfg.resize['height'] != -1:
+            self.pre_w = int(self.roi_w * (cfg.resize['height'] / float(self.roi_h)))
+            self.pre_h = cfg.resize['height']
+        else:
+            self.pre_w, self.pre_h = self.roi_w, self.roi_h
+        self.need_resize = (self.pre_w, self.pre_h) != (self.roi_w, self.roi_h)
+        # exact per-axis factors from preprocessed frame back to the ROI
+        self.scale_x = self.roi_w / self.pre_w
+        self.scale_y = self.roi_h / self.pre_h
+        self.x_num = cfg.routine['col']
+        self.y_num = cfg.routine['row']
+        self.x_step = int(self.pre_w / self.x_num)
+        self.y_step = int(self.pre_h / self.y_num)
+        self.bbox_w = cfg.bbox['w']
+        self.bbox_h = cfg.bbox['h']
+
+    def preprocess(self, frame):
+        """
+        same as utils.preprocess(), but the ROI slice and target size are computed only once
+        :param frame: original frame, may be a view of shared memory slot
+        :return: processed frame, read-only view of the original frame
+        """
+        original_frame = frame.view()
+        original_frame.flags.writeable = False
+        frame = original_frame[self.roi_slice]
+        if self.need_resize:
+            frame = cv2.resize(frame, (self.pre_w, self.pre_h), interpolation=self.interpolation)
+        return frame, original_frame
+
+    def block(self, frame, params):
+        """
+        crop a detection block from the preprocessed frame, the range has been validated by layout
+        :param frame: preprocessed frame
+        :param params: DetectorParams of the block
+        :return: block view
+        """
+        return frame[params.start[1]:params.end[1], params.start[0]:params.end[0]]
+
+    def block_to_original(self, rects, start):
+        """
+        map rects detected in a block back to the original frame
+        :param rects: [(x,y,w,h,...)] in block coordinates
+        :param start: start position of the block in preprocessed frame
+        :return: N x 4 int array of (x1,y1,x2,y2) in original frame
+        """
+        if not len(rects):
+            return np.empty((0, 4), dtype=np.int64)
+        rects = np.asarray([r[:4] for r in rects], dtype=np.float64)
+        boxes = np.empty((len(rects), 4), dtype=np.float64)
+        boxes[:, 0] = (rects[:, 0] + start[0]) * self.scale_x + self.roi_x
+        boxes[:, 1] = (rects[:, 1] + start[1]) * self.scale_y + self.roi_y
+        boxes[:, 2] = (rects[:, 0] + rects[:, 2] + start[0]) * self.scale_x + self.roi_x
+        boxes[:, 3] = (rects[:, 1] + rects[:, 3] + start[1]) * self.scale_y + self.roi_y
+        return self.clip(np.rint(boxes).astype(np.int64))
+
+    def clip(self, boxes):
+        """
+        clip (x1,y1,x2,y2) boxes into the drawable range of original frame
+        :param boxes: N x 4 int array
+        :return: clipped boxes, in place
+        """
+        np.clip(boxes[:, 0::2], 0, self.width - 1, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, self.height - 1, out=boxes[:, 1::2])
+        return boxes
+
+    def square_boxes(self, rects, delta_x=0, delta_y=0):
+        """
+        vectorized bbox_points(), fixed size boxes of cfg.bbox centered at each rect
+        :param rects: [(x1,y1,x2,y2,...)] in original frame
+        :param delta_x: expand box in x axis by delta on both sides
+        :param delta_y: expand box in y axis by delta on both sides
+        :return: N x 4 int array of (x1,y1,x2,y2)
+        """
+        if not len(rects):
+            return np.empty((0, 4), dtype=np.int64)
+        rects = np.asarray([r[:4] for r in rects], dtype=np.float64)
+        half_w = self.bbox_w / 2 + round(delta_x)
+        half_h = self.bbox_h / 2 + round(delta_y)
+        center_x = (rects[:, 0] + rects[:, 2]) / 2
+        center_y = (rects[:, 1] + rects[:, 3]) / 2
+        boxes = np.stack([center_x - half_w, center_y - half_h, center_x + half_w, center_y + half_h], axis=1)
+        return self.clip(np.rint(boxes).astype(np.int64))
+
+    def crop_square(self, frame, rect):
+        """
+        vectorized counterpart of crop_by_rect(), crop a square box around rect and resize it to cfg.bbox
+        :param frame: original frame
+        :param rect: (x1,y1,x2,y2,...) in original frame
+        :return: cropped patch
+        """
+        x1, y1, x2, y2 = self.square_boxes([rect])[0]
+        return cv2.resize(frame[y1:y2, x1:x2], (self.bbox_w, self.bbox_h))
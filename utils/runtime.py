@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+@author: Shanda Lau 刘祥德
+@license: (C) Copyright 2019-now, Node Supply Chain Manager Corporation Limited.
+@contact: shandalaulv@gmail.com
+@software:
+@file: runtime.py
+@time: 10/19/26 10:30 PM
+@version 1.0
+@desc: common inference runtime of detector, classifier and tracker models
+"""
+import torch
+import torch.nn as nn
+
+from .log import logger
+
+
+def fuse_conv_bn(conv, bn):
+    """
+    fold batch norm into the preceding conv, same as mmdetection/tools/fuse_conv_bn.py,
+    which can't be imported without mmcv
+    """
+    conv_w = conv.weight
+    conv_b = conv.bias if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    factor = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    conv.weight = nn.Parameter(conv_w * factor.reshape([conv.out_channels, 1, 1, 1]))
+    conv.bias = nn.Parameter((conv_b - bn.running_mean) * factor + bn.bias)
+    return conv
+
+
+def fuse_module(m):
+    """
+    fuse every batch norm which directly follows a conv among children of a module,
+    the batch norm is replaced by identity
+    """
+    last_conv = None
+    last_conv_name = None
+    for name, child in m.named_children():
+        if isinstance(child, (nn.BatchNorm2d, nn.SyncBatchNorm)):
+            if last_conv is None:
+                continue
+            m._modules[last_conv_name] = fuse_conv_bn(last_conv, child)
+            m._modules[name] = nn.Identity()
+            last_conv = None
+        elif isinstance(child, nn.Conv2d):
+            last_conv = child
+            last_conv_name = name
+        else:
+            fuse_module(child)
+    return m
+
+
+def inference_context():
+    """
+    torch.inference_mode() if torch supports it, otherwise torch.no_grad()
+    """
+    if hasattr(torch, 'inference_mode'):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+class ModelRuntime(object):
+    """
+    Inference settings shared by all models of a process:
+    gradient free execution, intra-op threads, channels_last memory format, conv-bn fusion and warm-up.
+    """
+
+    def __init__(self, num_threads=0, channels_last=False, fuse_bn=False, warmup=1) -> None:
+        """
+        :param num_threads: intra-op threads of process, 0 keeps torch default
+        :param channels_last: convert weights and inputs into channels_last memory format
+        :param fuse_bn: fold batch norms into convs
+        :param warmup: warm-up iterations after model is ready
+        """
+        super().__init__()
+        self.num_threads = num_threads
+        # channels_last is only supported since torch 1.5
+        self.channels_last = channels_last and hasattr(torch, 'channels_last')
+        self.fuse_bn = fuse_bn
+        self.warmup = warmup
+
+    @staticmethod
+    def from_config(server_cfg):
+        return ModelRuntime(server_cfg.torch_threads, server_cfg.channels_last, server_cfg.fuse_conv_bn,
+                            server_cfg.warmup_iters)
+
+    def setup_process(self):
+        """
+        must be called inside the process which runs models
+        """
+        if self.num_threads > 0:
+            torch.set_num_threads(self.num_threads)
+
+    def inference(self):
+        return inference_context()
+
+    def prepare(self, model: nn.Module, device=None, channels_last=None):
+        """
+        :param model: model with weights loaded
+        :param device: target device, model is not moved if None
+        :param channels_last: overrides runtime setting, models that view() conv features must disable it
+        :return: model ready for inference
+        """
+        model.eval()
+        if device is not None:
+            model = model.to(device)
+        if self.fuse_bn:
+            with torch.no_grad():
+                model = fuse_module(model)
+        if channels_last is None:
+            channels_last = self.channels_last
+        if channels_last and hasattr(torch, 'channels_last'):
+            model = model.to(memory_format=torch.channels_last)
+        return model
+
+    def input(self, x: torch.Tensor, device=None):
+        """
+        move a NCHW input to device in memory format of model
+        """
+        if device is not None:
+            x = x.to(device)
+        if self.channels_last and x.dim() == 4:
+            x = x.contiguous(memory_format=torch.channels_last)
+        return x
+
+    def warm_up(self, fn, *args, **kwargs):
+        """
+        run fn warmup times so that lazy allocations and kernel selection are done before real requests
+        """
+        with self.inference():
+            for _ in range(self.warmup):
+                fn(*args, **kwargs)
+        logger.info(f'Model Runtime: warm up [{self.warmup}] iterations done.')
+
+    def run(self, fn, *args, **kwargs):
+        with self.inference():
+            return fn(*args, **kwargs)
+
+
+class SharedCheckpoint(object):
+    """
+    A checkpoint loaded once and kept in shared memory. Tensors of the same dtype are packed into one shared
+    flat storage and the state dict holds views of it, so passing the checkpoint to a sub-process costs a file
+    descriptor per dtype instead of a copy of the weights.
+    Models bound on CPU use the shared storage directly, models on GPU copy from it.
+    Weights must be treated as read-only, in-place updates are seen by all processes.
+    """
+
+    def __init__(self, state_dict, meta=None, module: nn.Module = None) -> None:
+        """
+        :param state_dict: name -> tensor
+        :param meta: checkpoint meta, such as CLASSES of mmdetection checkpoints
+        :param module: pickled whole model, its parameters are bound to the shared state dict
+        """
+        super().__init__()
+        self.meta = meta if meta is not None else {}
+        self.state_dict = self.share(state_dict)
+        self.module = module
+        if module is not None:
+            self.bind(module)
+
+    @staticmethod
+    def share(state_dict):
+        """
+        pack tensors into shared flat storages, one per dtype
+        :return: state dict of views
+        """
+        groups = {}
+        for name, tensor in state_dict.items():
+            groups.setdefault(tensor.dtype, []).append(name)
+        shared = {}
+        for dtype, names in groups.items():
+            flat = torch.empty(sum(state_dict[n].numel() for n in names), dtype=dtype).share_memory_()
+            offset = 0
+            for n in names:
+                tensor = state_dict[n]
+                view = flat[offset:offset + tensor.numel()].view(tensor.shape)
+                view.copy_(tensor)
+                shared[n] = view
+                offset += tensor.numel()
+        return shared
+
+    @staticmethod
+    def load(path):
+        """
+        read a checkpoint file, a state dict, an mmdetection checkpoint or a pickled model
+        :param path: checkpoint path
+        :return: SharedCheckpoint
+        """
+        checkpoint = torch.load(str(path), map_location=lambda storage, loc: storage.cpu())
+        if isinstance(checkpoint, nn.Module):
+            return SharedCheckpoint(checkpoint.state_dict(), module=checkpoint.eval())
+        meta = None
+        if 'state_dict' in checkpoint:
+            meta = checkpoint.get('meta')
+            checkpoint = checkpoint['state_dict']
+        # weights saved from DataParallel
+        checkpoint = {k[7:] if k.startswith('module.') else k: v for k, v in checkpoint.items()}
+        logger.info(f'Shared Checkpoint: [{path}] loaded into shared memory.')
+        return SharedCheckpoint(checkpoint, meta)
+
+    def bind(self, model: nn.Module, strict=True):
+        """
+        let model parameters and buffers use the shared weights without copying
+        :param model: model built with the same architecture
+        :param strict: raise if keys don't match
+        :return: model
+        """
+        # non-persistent buffers, such as SSD priors, are built by the model and never saved into checkpoints
+        own = model.state_dict(keep_vars=True)
+        missing = [k for k in own if k not in self.state_dict]
+        unexpected = [k for k in self.state_dict if k not in own]
+        if strict and (len(missing) or len(unexpected)):
+            raise Exception(f'Shared checkpoint does not match model, missing keys {missing}, '
+                            f'unexpected keys {unexpected}.')
+        with torch.no_grad():
+            for name, tensor in own.items():
+                if name not in self.state_dict:
+                    continue
+                shared = self.state_dict[name]
+                if tensor.shape != shared.shape:
+                    raise Exception(f'Shape of [{name}] mismatches, model {tuple(tensor.shape)}, '
+                                    f'checkpoint {tuple(shared.shape)}.')
+                if tensor.device.type == 'cpu' and tensor.dtype == shared.dtype:
+                    tensor.data = shared
+                else:
+                    tensor.copy_(shared)
+        return model